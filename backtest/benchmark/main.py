@@ -0,0 +1,155 @@
+# -*- coding:utf-8 -*-
+
+"""
+回测撮合引擎性能测试
+
+K线驱动: 在订单薄中挂若干个不会成交的远端限价单,再让一个买单和一个卖单在每根K线上成交,
+统计每根K线撮合耗时随挂单数量的变化.撮合只处理价格能够成交的挂单,耗时应该基本不随挂单数量增长.
+
+订单薄驱动: 回放随机游走的20档订单薄,买卖两边各保持若干个挂单(成交后重新挂单),统计撮合引擎每秒能处理多少条订单薄.
+
+运行: python backtest/benchmark/main.py
+
+Project: alphahunter
+Author: HJQuant
+Description: Asynchronous driven quantitative trading framework
+"""
+
+import sys
+import os
+import time
+import asyncio
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "../.."))
+
+from quant.config import config
+from quant.market import Kline
+from quant.order import ORDER_ACTION_BUY, ORDER_ACTION_SELL
+from quant.backtest import SimpleSpotMatchEngine
+from quant.ledger import Ledger
+
+
+PLATFORM = "huobi"
+SYMBOL = "btcusdt"
+PRICE = 10000.0
+KLINES = 2000
+BOOKS = 200000
+DEPTH = 20
+
+
+class Callbacks:
+    """ 回调函数全部为空
+    """
+    on_order_update_callback = None
+    on_fill_update_callback = None
+    on_asset_update_callback = None
+
+
+class Trader:
+    """ 只提供撮合引擎需要的资产账本
+    """
+
+    def __init__(self):
+        self._ledger = Ledger()
+        self._ledger.deposit("BTC", 1e9)
+        self._ledger.deposit("USDT", 1e15)
+
+
+def kline(ts):
+    return Kline(PLATFORM, SYMBOL, PRICE, PRICE, PRICE, PRICE, 1, ts, usable=True, close_avg_fillna=PRICE)
+
+
+async def run(resting):
+    """ 挂resting个不会成交的订单,返回每根K线平均撮合耗时(微秒)
+    """
+    engine = SimpleSpotMatchEngine(SYMBOL, Trader(), cb=Callbacks(), databind=PLATFORM, strategy="benchmark", account="benchmark")
+    engine._last_kline = kline(0)
+    for i in range(resting // 2):
+        await engine.create_order(ORDER_ACTION_BUY, PRICE/2 - i*0.01, 0.01)
+        await engine.create_order(ORDER_ACTION_SELL, PRICE*2 + i*0.01, 0.01)
+    elapsed = 0
+    for i in range(KLINES):
+        #每根K线挂一个买单和一个卖单,下一根K线成交
+        await engine.create_order(ORDER_ACTION_BUY, PRICE, 0.01)
+        await engine.create_order(ORDER_ACTION_SELL, PRICE, 0.01)
+        t = time.perf_counter()
+        await engine.on_kline_update_callback(kline(i))
+        elapsed += time.perf_counter() - t
+    assert len(engine._orders) == resting
+    return elapsed / KLINES * 1e6
+
+
+def make_depth(n):
+    """ 随机游走的20档订单薄
+    """
+    rng = np.random.RandomState(0)
+    mid = PRICE + np.cumsum(rng.randint(-1, 2, n)) * 0.01
+    steps = np.arange(DEPTH) * 0.01
+    ask_price = np.round(mid[:, None] + 0.01 + steps, 2)
+    bid_price = np.round(mid[:, None] - 0.01 - steps, 2)
+    ask_size = rng.randint(1, 100, (n, DEPTH)) * 0.01
+    bid_size = rng.randint(1, 100, (n, DEPTH)) * 0.01
+    return ask_price, ask_size, bid_price, bid_size
+
+
+async def run_depth(resting):
+    """ 每边保持resting个挂单,返回每秒处理的订单薄数量
+    """
+    engine = SimpleSpotMatchEngine(SYMBOL, Trader(), cb=Callbacks(), databind=PLATFORM, strategy="benchmark", account="benchmark")
+    arrays = make_depth(BOOKS)
+    engine.set_depth(arrays, 0)
+    await engine.on_orderbook_update_callback(None)
+    fills = 0
+    elapsed = 0
+    for i in range(BOOKS):
+        if len(engine._orders) < 2 * resting:
+            #在最优价附近补充挂单
+            fills += 2 * resting - len(engine._orders)
+            for k in range(resting - len(engine._resting.levels[ORDER_ACTION_BUY])):
+                await engine.create_order(ORDER_ACTION_BUY, round(arrays[2][i][0] - k*0.01, 2), 0.01)
+            for k in range(resting - len(engine._resting.levels[ORDER_ACTION_SELL])):
+                await engine.create_order(ORDER_ACTION_SELL, round(arrays[0][i][0] + k*0.01, 2), 0.01)
+        t = time.perf_counter()
+        engine.set_depth(arrays, i)
+        await engine.on_orderbook_update_callback(None)
+        elapsed += time.perf_counter() - t
+    return BOOKS / elapsed, fills
+
+
+def main():
+    config.backtest = {
+        "feature": {
+            PLATFORM: {
+                "syminfo": {
+                    SYMBOL: {
+                        "type": "spot",
+                        "price_tick": 0.01,
+                        "size_tick": 0.0001,
+                        "size_limit": 0.0001,
+                        "value_tick": 0.01,
+                        "value_limit": 1,
+                        "base_currency": "BTC",
+                        "quote_currency": "USDT",
+                        "settlement_currency": "USDT"
+                    }
+                },
+                "asset": {},
+                "maker_commission_rate": 0.002,
+                "taker_commission_rate": 0.003
+            }
+        }
+    }
+    loop = asyncio.get_event_loop()
+    print("resting orders    us/kline")
+    for resting in (0, 100, 1000, 10000, 100000):
+        print("{:>14d}    {:>8.1f}".format(resting, loop.run_until_complete(run(resting))))
+    print()
+    print("resting orders    books/s    orders placed")
+    for resting in (0, 1, 5, 20):
+        books, placed = loop.run_until_complete(run_depth(resting))
+        print("{:>14d}    {:>7.0f}    {:>13d}".format(2 * resting, books, placed))
+
+
+if __name__ == "__main__":
+    main()
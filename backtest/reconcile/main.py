@@ -0,0 +1,154 @@
+# -*- coding:utf-8 -*-
+
+"""
+向量化回测和事件驱动回测对账
+
+用同一组随机游走K线和随机信号分别运行向量化回测(VectorBacktest.run_signal)和现货撮合引擎(SimpleSpotMatchEngine,K线驱动),
+事件驱动一侧按example/cta_multi_signal/main.py的方式下单: 每根K线 下单量 = nearest(目标仓位 - 当前仓位, size_tick),
+绝对值不小于min_trade时用偏离收盘价100的限价单模拟市价单(按参考价格taker成交).逐笔比较两边的成交(K线,方向,价格,数量,手续费)和最终资产,
+修改撮合引擎或者向量化回测的成交规则(比如手续费取整)以后运行,确认两者仍然一致.
+
+运行: python backtest/reconcile/main.py
+
+Project: alphahunter
+Author: HJQuant
+Description: Asynchronous driven quantitative trading framework
+"""
+
+import sys
+import os
+import asyncio
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "../.."))
+
+from quant.config import config
+from quant.market import Kline
+from quant.order import ORDER_ACTION_BUY, ORDER_ACTION_SELL
+from quant.backtest import SimpleSpotMatchEngine
+from quant.ledger import Ledger
+from quant.vector_backtest import VectorBacktest, nearest
+
+
+PLATFORM = "huobi"
+SYMBOL = "btcusdt"
+PRICE = 10000.0
+KLINES = 5000
+FIXED_VOLUME = 0.04
+MIN_TRADE = 0.01
+ASSET = {"BTC": 1.0, "USDT": 20000.0}
+
+
+class Callbacks:
+    """ 记录成交
+    """
+
+    def __init__(self):
+        self.fills = []
+        self.index = None #当前第几根K线
+
+    on_order_update_callback = None
+    on_asset_update_callback = None
+
+    async def on_fill_update_callback(self, fill):
+        self.fills.append((self.index, fill.side, fill.price, fill.quantity, fill.fee))
+
+
+class Trader:
+    """ 只提供撮合引擎需要的资产账本
+    """
+
+    def __init__(self):
+        self._ledger = Ledger()
+        for currency, amount in ASSET.items():
+            self._ledger.deposit(currency, amount)
+
+
+def make_klines(n, seed):
+    """ 随机游走的收盘均价,随机信号和少量不可用的K线
+    """
+    rng = np.random.RandomState(seed)
+    prices = np.round(PRICE * np.exp(np.cumsum(rng.normal(0, 0.002, n))), 4)
+    signal = rng.choice([1.0, -1.0, np.nan], n, p=[0.05, 0.05, 0.9])
+    usable = rng.random_sample(n) > 0.01
+    return prices, signal, usable
+
+
+async def run_engine(prices, target, usable):
+    """ 事件驱动一侧,返回(成交列表, 最终'货', 最终'钱')
+    """
+    cb = Callbacks()
+    trader = Trader()
+    engine = SimpleSpotMatchEngine(SYMBOL, trader, cb=cb, databind=PLATFORM, strategy="reconcile", account="reconcile")
+    ledger = trader._ledger
+    size_tick = config.backtest["feature"][PLATFORM]["syminfo"][SYMBOL]["size_tick"]
+    for i, price in enumerate(prices):
+        cb.index = i
+        kline = Kline(PLATFORM, SYMBOL, price, price, price, price, 1, i, usable=bool(usable[i]), close_avg_fillna=price)
+        await engine.on_kline_update_callback(kline)
+        held = ledger.entry("BTC")["total"] - ASSET["BTC"]
+        delta = float(nearest(target[i] - held, size_tick))
+        if abs(delta) < MIN_TRADE:
+            continue
+        if delta > 0:
+            await engine.create_order(ORDER_ACTION_BUY, round(price + 100, 2), abs(delta)) #限价单模拟市价单
+        else:
+            await engine.create_order(ORDER_ACTION_SELL, round(price - 100, 2), abs(delta))
+    return cb.fills, ledger.entry("BTC")["total"], ledger.entry("USDT")["total"]
+
+
+def compare(seed):
+    """ 对账一组K线,返回不一致的数量
+    """
+    prices, signal, usable = make_klines(KLINES, seed)
+    vb = VectorBacktest(PLATFORM, SYMBOL, min_trade=MIN_TRADE)
+    result = vb.run_signal(prices, signal, FIXED_VOLUME, usable=usable)
+    target = vb.signal_to_target(signal, FIXED_VOLUME)
+    fills, base, quote = asyncio.get_event_loop().run_until_complete(run_engine(prices, target, usable))
+    vector_fills = list(zip(result.fills["index"].tolist(), result.fills["side"], result.fills["price"], result.fills["quantity"], result.fills["fee"]))
+    errors = 0
+    if len(fills) != len(vector_fills):
+        print("seed {}: {} fills in engine, {} in vector backtest".format(seed, len(fills), len(vector_fills)))
+        errors += 1
+    for a, b in zip(fills, vector_fills):
+        if a[:2] != b[:2] or any(abs(x - y) > 1e-9 for x, y in zip(a[2:], b[2:])):
+            print("seed {}: engine {} != vector {}".format(seed, a, b))
+            errors += 1
+            break
+    if abs(base - result.base[-1]) > 1e-9 or abs(quote - result.quote[-1]) > 1e-6:
+        print("seed {}: final assets engine ({}, {}) != vector ({}, {})".format(seed, base, quote, result.base[-1], result.quote[-1]))
+        errors += 1
+    print("seed {}: {} fills, rejected {}, total return {:.4%}".format(seed, len(vector_fills), result.rejected, result.total_return))
+    return errors
+
+
+def main():
+    config.backtest = {
+        "feature": {
+            PLATFORM: {
+                "syminfo": {
+                    SYMBOL: {
+                        "type": "spot",
+                        "price_tick": 0.01,
+                        "size_tick": 0.0001,
+                        "size_limit": 0.0001,
+                        "value_tick": 0.01,
+                        "value_limit": 1,
+                        "base_currency": "BTC",
+                        "quote_currency": "USDT",
+                        "settlement_currency": "USDT"
+                    }
+                },
+                "asset": ASSET,
+                "maker_commission_rate": 0.002,
+                "taker_commission_rate": 0.003
+            }
+        }
+    }
+    errors = sum(compare(seed) for seed in range(5))
+    print("OK" if errors == 0 else "{} differences".format(errors))
+    sys.exit(1 if errors else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -258,6 +258,8 @@ def insert(kline, begin_timestamp, klines):
         try:
             documents = copy.deepcopy(klines[offset: offset + LIMIT])
             result = kline.insert_many(documents)
+            kline.mark_coverage(range(begin_timestamp, begin_timestamp + ONE_DAY, kline.interval))
+            kline.invalidate_cache([begin_timestamp - kline.interval, begin_timestamp, begin_timestamp + ONE_DAY - 1])  # 包括上一天最后一根K线
             print(result.bulk_api_result, begin_timestamp, kline.collection_name)
             message = {
                 "result": result.bulk_api_result,
@@ -94,6 +94,8 @@ def update_one_day_klines(trade, kline, begin_timestamp):
     
     #更新数据库
     result = kline.insert_many(klines)
+    kline.mark_coverage(range(begin_timestamp, begin_timestamp + ONE_DAY, kline.interval))
+    kline.invalidate_cache([begin_timestamp - kline.interval, begin_timestamp, begin_timestamp + ONE_DAY - 1])  # 包括上一天最后一根K线
     print(result.bulk_api_result)
 
 
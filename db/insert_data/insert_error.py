@@ -2,7 +2,7 @@
 import os
 import json
 import copy
-from models import OrderBook, Trade
+from models import OrderBook, Trade, Bucket
 
 RE_PATH = "/Users/nanqiang/Documents/work/re/"
 
@@ -27,6 +27,9 @@ def main():
             for line in f.readlines():
                 line = json.loads(line)
                 documents = copy.deepcopy(line)
+                if Bucket.configured(obj.DATA_TYPE):  # 分桶格式整批重新写入
+                    obj.insert_documents(documents)
+                    continue
                 for document in documents:
                     try:
                         obj.collection.replace_one(filter=document, replacement=document, upsert=True)
@@ -1,4 +1,6 @@
 # -*- coding: utf-8 -*-
+import os
+import sys
 import re
 import datetime
 import time
@@ -9,6 +11,20 @@ from pandas import DataFrame
 
 from mongo_utils import get_mongo_conn
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "../.."))
+from quant.config import config  # noqa: E402
+from quant.coverage import Coverage  # noqa: E402
+from quant.bucket import Bucket, META_COLLECTION  # noqa: E402
+from quant.datacache import DataCache  # noqa: E402
+
+
+ONE_HOUR = 60 * 60 * 1000
+ONE_DAY = 24 * ONE_HOUR
+CONFIG_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "config.json")  # 和回测使用相同的配置(INFRA.bucket_ms, INFRA.cache_path等)
+
+if os.path.exists(CONFIG_FILE):
+    config.loads(CONFIG_FILE)
+
 
 class Base(object):
     DATABASE = "db_market"
@@ -18,6 +34,53 @@ class Base(object):
     def get_all(self, sort=None, **kwargs):
         pass
 
+    def mark_coverage(self, dts):
+        """
+        更新数据覆盖索引(t_coverage表), 标记这些时间所在的小时有数据, 格式和 quant/coverage.py 保持一致
+        写入失败时抛出异常, 没有写入的掩码保留下来, 下次标记时重新写入
+        """
+        pending = self.__dict__.setdefault("_pending_masks", {})
+        for day, hours in Coverage.hour_masks(dts).items():
+            pending[day] = pending.get(day, 0) | hours
+        t_coverage = get_mongo_conn(self.DATABASE)[Coverage.COLLECTION]
+        for day in sorted(pending):
+            t_coverage.update_one({"name": self.collection_name, "day": day}, {"$bit": {"hours": {"or": pending[day]}}}, upsert=True)
+            del pending[day]
+
+    def mark_indexed(self, begin_timestamp, end_timestamp):
+        """
+        记录[begin_timestamp, end_timestamp)内的数据已经全部导入并且标记, 回测时这段时间内没有标记的小时才会被跳过
+        """
+        self.mark_coverage([])  # 先写入之前失败的掩码
+        t_coverage = get_mongo_conn(self.DATABASE)[Coverage.COLLECTION]
+        t_coverage.update_one({"name": self.collection_name, "indexed_begin": begin_timestamp},
+                              {"$max": {"indexed_end": end_timestamp}}, upsert=True)
+
+    def invalidate_cache(self, dts):
+        """
+        重写数据后删除这些时间所在天的回测本地磁盘缓存(配置文件中的INFRA.cache_path), 没有配置时不需要删除
+        """
+        cache_path = config.infra.get("cache_path")
+        if not cache_path:
+            return
+        for day in {dt // ONE_DAY * ONE_DAY for dt in dts}:
+            DataCache.invalidate(cache_path, self.exchange_name, self.symbol_name, self.DATA_TYPE, day)
+
+    def insert_documents(self, documents):
+        """
+        插入记录, 配置文件中INFRA.bucket_ms配置了桶大小时按 quant/bucket.py 的格式打包后写入分桶数据表(表名加上"_bucket"后缀),
+        并且在t_bucket_meta表中记录用过的桶大小
+        """
+        interval = Bucket.configured(self.DATA_TYPE)
+        if not interval:
+            self.collection.insert_many(documents)
+            return
+        name = Bucket.collection_name(self.collection_name)
+        database = get_mongo_conn(self.DATABASE)
+        database[META_COLLECTION].update_one({"name": name}, {"$max": {"interval": interval}}, upsert=True)
+        docs = Bucket(interval, "dt").pack(sorted(documents, key=lambda d: d["dt"]))
+        database[name].insert_many(sorted(docs, key=lambda d: d["bucket_dt"]))
+
     def get_key(self):
         key = ""
         if self.__class__.__name__ in ["Trade", "OrderBook"]:
@@ -180,6 +243,7 @@ class OrderBook(Base):
     市场订单簿表
     索引 dt
     """
+    DATA_TYPE = "orderbook"
     COLUMNS = ["dt",
                 "askprice1", "askprice2", "askprice3", "askprice4", "askprice5", "askprice6", "askprice7", "askprice8", "askprice9", "askprice10", "askprice11", "askprice12", "askprice13", "askprice14", "askprice15", "askprice16", "askprice17", "askprice18", "askprice19", "askprice20",  # NOQA
                 "bidprice1", "bidprice2", "bidprice3", "bidprice4", "bidprice5", "bidprice6", "bidprice7", "bidprice8", "bidprice9", "bidprice10", "bidprice11", "bidprice12", "bidprice13", "bidprice14", "bidprice15", "bidprice16", "bidprice17", "bidprice18", "bidprice19", "bidprice20",  # NOQA
@@ -189,6 +253,8 @@ class OrderBook(Base):
 
     def __init__(self, exchange_name, symbol_name):
         super(Base, self).__init__()
+        self.exchange_name = exchange_name
+        self.symbol_name = symbol_name
         self.collection_name = "t_orderbook_{exchange_name}_{symbol_name}".format(exchange_name=exchange_name,
                                                                                   symbol_name=symbol_name)
         self.collection = get_mongo_conn(self.DATABASE)[self.collection_name]
@@ -198,10 +264,13 @@ class Trade(Base):
     """
     市场逐笔成交记录表
     """
+    DATA_TYPE = "trade"
     COLUMNS = ["dt", "tradedt", "tradeprice", "volume", "amount", "direction"]
 
     def __init__(self, exchange_name, symbol_name):
         super(Base, self).__init__()
+        self.exchange_name = exchange_name
+        self.symbol_name = symbol_name
         self.collection_name = "t_trade_{exchange_name}_{symbol_name}".format(exchange_name=exchange_name,
                                                                               symbol_name=symbol_name)
         self.collection = get_mongo_conn(self.DATABASE)[self.collection_name]
@@ -211,6 +280,7 @@ class Kline(Base):
     """
     K线
     """
+    DATA_TYPE = "kline"
     DATABASE = "db_custom_kline"
     COLUMNS = ["begin_dt", "end_dt", "open", "high", "low", "close", "avg_price", "buy_avg_price", "sell_avg_price",
                "open_avg", "close_avg", "volume", "amount", "book_count", "buy_book_count", "sell_book_count",
@@ -228,6 +298,8 @@ class Kline(Base):
 
     def __init__(self, exchange_name, symbol_name, interval_str="1min"):
         super(Base, self).__init__()
+        self.exchange_name = exchange_name
+        self.symbol_name = symbol_name
         
         if interval_str=="1min":
             self.collection_name = "t_kline_{exchange_name}_{symbol_name}".format(exchange_name=exchange_name, symbol_name=symbol_name)
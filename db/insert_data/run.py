@@ -10,7 +10,7 @@ import copy
 
 from zipfile import ZipFile, is_zipfile
 
-from models import Symbol, OrderBook, Trade
+from models import Symbol, OrderBook, Trade, ONE_DAY
 
 
 PATH = "/home/nijun/Documents/huobi"  # 文件存放地址
@@ -151,15 +151,20 @@ def handle_trade(exchange_name, symbol_name, df):
     trade = Trade(exchange_name, symbol_name)
     rows = df.to_dict('records')
 
+    complete = True
     for skip in range(0, len(rows), LIMIT):
         documents = copy.deepcopy(rows[skip: skip + LIMIT])
         try:
-            trade.collection.insert_many(documents)
+            trade.insert_documents(documents)
+            trade.mark_coverage([d["dt"] for d in documents])
+            trade.invalidate_cache([d["dt"] for d in documents])
         except Exception as e:
             error_log.error(e)
+            complete = False
             with open(RE_PATH + trade.collection_name + ".txt", "a") as f:
                 f.write(json.dumps(rows[skip: skip + LIMIT]))
                 f.write("\n")
+    mark_file_indexed(trade, rows, complete)
 
 
 def handle_order_book(exchange_name, symbol_name, df):
@@ -189,15 +194,35 @@ def handle_order_book(exchange_name, symbol_name, df):
     order_book = OrderBook(exchange_name, symbol_name)
     rows = df.to_dict('records')
 
+    complete = True
     for skip in range(0, len(rows), LIMIT):
         documents = copy.deepcopy(rows[skip: skip + LIMIT])
         try:
-            order_book.collection.insert_many(documents)
+            order_book.insert_documents(documents)
+            order_book.mark_coverage([d["dt"] for d in documents])
+            order_book.invalidate_cache([d["dt"] for d in documents])
         except Exception as e:
             error_log.error(e)
+            complete = False
             with open(RE_PATH + order_book.collection_name + ".txt", "a") as f:
                 f.write(json.dumps(rows[skip: skip + LIMIT]))
                 f.write("\n")
+    mark_file_indexed(order_book, rows, complete)
+
+
+def mark_file_indexed(obj, rows, complete):
+    """
+    一个文件是一个交易品种一天的数据, 全部导入成功时把这一天记录为数据覆盖索引的完整时间段
+    """
+    if not complete or not rows:
+        return
+    dts = [row["dt"] for row in rows]
+    begin = min(dts) // ONE_DAY * ONE_DAY
+    end = (max(dts) // ONE_DAY + 1) * ONE_DAY
+    try:
+        obj.mark_indexed(begin, end)
+    except Exception as e:
+        error_log.error(e)
 
 
 def direction_change(series):
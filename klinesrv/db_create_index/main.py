@@ -19,6 +19,8 @@ from quant import const
 from quant.state import State
 from quant.utils import tools, logger
 from quant.utils.mongo import MongoDB
+from quant.coverage import Coverage
+from quant.bucket import Bucket, BUCKET_KEY
 from quant.config import config
 from quant.market import Market, Kline, Orderbook, Trade, Ticker
 from quant.order import Order, Fill
@@ -46,21 +48,34 @@ class CreateIndex(Strategy):
         self.t_depth_map = defaultdict(lambda:None)
         self.t_trade_map = defaultdict(lambda:None)
         self.t_kline_map = defaultdict(lambda:None)
+        self.t_bucket_list = [] #分桶格式的订单薄和逐笔成交
+        self.coverage_list = [] #需要重建的数据覆盖索引 (Coverage, 行情数据表, 时间字段, 是否分桶格式)
         if config.mongodb:
             for sym in self.symbols:
                 postfix = sym.replace('-','').replace('_','').replace('/','').lower() #将所有可能的情况转换为我们自定义的数据库表名规则
                 #订单薄
                 name = "t_orderbook_{}_{}".format(self.platform, postfix).lower()
                 self.t_depth_map[sym] = MongoDB("db_market", name)
+                self.t_bucket_list.append(MongoDB("db_market", Bucket.collection_name(name)))
+                self.add_coverage("db_market", name, "dt", Bucket.configured("orderbook"))
                 #逐笔成交
                 name = "t_trade_{}_{}".format(self.platform, postfix).lower()
                 self.t_trade_map[sym] = MongoDB("db_market", name)
+                self.t_bucket_list.append(MongoDB("db_market", Bucket.collection_name(name)))
+                self.add_coverage("db_market", name, "dt", Bucket.configured("trade"))
                 #K线
                 name = "t_kline_{}_{}".format(self.platform, postfix).lower()
                 self.t_kline_map[sym] = MongoDB("db_custom_kline", name)
+                self.add_coverage("db_custom_kline", name, "begin_dt", None)
         #开始任务
         SingleTask.run(self._do_work)
 
+    def add_coverage(self, db, name, key, bucketed):
+        """ 按INFRA.bucket_ms选择的数据格式(和回测读取时一致)重建数据覆盖索引
+        """
+        source = MongoDB(db, Bucket.collection_name(name) if bucketed else name)
+        self.coverage_list.append((Coverage(db, name), source, key, bool(bucketed)))
+
     async def _do_work(self):
         while not MongoDB.is_connected(): #等待数据库连接稳定
             await asyncio.sleep(1)
@@ -77,6 +92,14 @@ class CreateIndex(Strategy):
             s, e = await t_kline.create_index({'begin_dt':1})
             if e:
                 logger.error("create_index kline:", e, caller=self)
+        for t_bucket in self.t_bucket_list:
+            s, e = await t_bucket.create_index({BUCKET_KEY:1})
+            if e:
+                logger.error("create_index bucket:", e, caller=self)
+        for coverage, source, key, bucketed in self.coverage_list: #从数据表统计有数据的小时,重建数据覆盖索引并且记录为完整时间段
+            e = await coverage.build(source, key, unwind=bucketed)
+            if e:
+                logger.error("build coverage:", e, caller=self)
         #结束进程
         self.stop()
 
@@ -17,7 +17,10 @@ from collections import defaultdict
 from quant import const
 from quant.state import State
 from quant.utils import tools, logger
-from quant.utils.mongo import MongoDB
+from quant.utils.mongo import MongoDB, BulkWriter
+from quant.coverage import Coverage
+from quant.datacache import DataCache
+from quant.infra_api import InfraAPI
 from quant.config import config
 from quant.market import Market, Kline, Orderbook, Trade, Ticker
 from quant.order import Order, Fill
@@ -42,17 +45,13 @@ class klinesrv(Strategy):
         self.symbols = config.platforms[0]["symbols"]
 
         #连接数据库
-        self.t_trade_map = defaultdict(lambda:None)
-        self.t_kline_map = defaultdict(lambda:None)
+        self.w_kline_map = defaultdict(lambda:None) #K线批量写入器
         if config.mongodb:
             for sym in self.symbols:
                 postfix = sym.replace('-','').replace('_','').replace('/','').lower() #将所有可能的情况转换为我们自定义的数据库表名规则
-                #逐笔成交
-                name = "t_trade_{}_{}".format(self.platform, postfix).lower()
-                self.t_trade_map[sym] = MongoDB("db_market", name)
                 #K线
                 name = "t_kline_{}_{}".format(self.platform, postfix).lower()
-                self.t_kline_map[sym] = MongoDB("db_custom_kline", name)
+                self.w_kline_map[sym] = self.create_writer(sym, name)
 
         # 注册定时器
         self.enable_timer()  # 每隔1秒执行一次回调
@@ -61,6 +60,34 @@ class klinesrv(Strategy):
         self.prev_kline_map = defaultdict(lambda:None)
         self.interval = 60*1000 #一分钟
 
+        #退出前把写入队列中的K线全部写入数据库
+        from quant.quant import quant
+        quant.register_shutdown(self.close_writers)
+
+    async def close_writers(self):
+        """ 关闭所有批量写入器,写入队列中剩余的K线
+        """
+        for writer in self.w_kline_map.values():
+            if writer:
+                e = await writer.close()
+                if e:
+                    logger.error("close writer:", e, caller=self)
+
+    def create_writer(self, symbol, name):
+        """ 创建K线批量写入器,写入成功后标记数据覆盖索引
+        """
+        coverage = Coverage("db_custom_kline", name)
+        async def on_flush(docs, specs):
+            dts = [d["begin_dt"] for d in docs]
+            if config.infra.get("cache_path"): #插入的K线和更新的前一根K线所在的天(补写历史K线,跨天)的本地磁盘缓存都已经过期
+                days = set(dt // DataCache.DAY for dt in dts + [spec["begin_dt"] for spec in specs])
+                for day in days:
+                    DataCache.invalidate(config.infra["cache_path"], self.platform, symbol, "kline", day * DataCache.DAY)
+            if not dts:
+                return None
+            return await coverage.mark(dts)
+        return BulkWriter(MongoDB("db_custom_kline", name), on_flush=on_flush, **config.mongodb_writer)
+
     async def on_time(self):
         """ 每秒钟执行一次.
         """
@@ -95,36 +122,29 @@ class klinesrv(Strategy):
         await self.db_write_kline(symbol, new_kline, prev_kline) #保存K线
 
     async def db_read_trades(self, symbol, begin_dt):
-        """ 读取指定一分钟的所有的逐笔成交
+        """ 读取指定一分钟的所有的逐笔成交(INFRA.bucket_ms中配置了trade时按分桶格式读取)
         """
-        t_trade = self.t_trade_map[symbol]
-        if t_trade:
-            end_dt = begin_dt + 60*1000
-            s, e = await t_trade.get_list({'dt':{'$gte':begin_dt,'$lt':end_dt}})
-            if e:
-                logger.error("get trades:", e, caller=self)
+        if config.mongodb:
+            s = await InfraAPI.query_between(self.platform, symbol, "trade", begin_dt, begin_dt + 60*1000)
+            if s is None:
+                logger.error("get trades error", caller=self)
                 return []
             return s
 
     async def db_write_kline(self, symbol, new_kline, prev_kline):
-        """ 将新K线插入数据库,同时更新数据库前一根K线
+        """ 将新K线插入数据库,同时更新数据库前一根K线(后台批量写入)
         """
-        t_kline = self.t_kline_map[symbol]
-        if t_kline:
-            s, e = await t_kline.insert(new_kline)
-            if e:
-                logger.error("insert kline:", e, caller=self)
-            if prev_kline: #如果存在前一根K线就更新
-                update_fields = {}
-                update_fields.update({
+        w_kline = self.w_kline_map[symbol]
+        if w_kline:
+            if prev_kline: #如果存在前一根K线就更新,排在新K线前面,新K线写入成功时前一根K线已经更新
+                update_fields = {
                     "next_price": prev_kline["next_price"],
                     "next_price_fillna": prev_kline["next_price_fillna"],
                     "lead_ret": prev_kline["lead_ret"],
                     "lead_ret_fillna": prev_kline["lead_ret_fillna"]
-                })
-                s, e = await t_kline.update({'begin_dt':prev_kline["begin_dt"]}, {'$set':update_fields})
-                if e:
-                    logger.error("update kline:", e, caller=self)
+                }
+                await w_kline.put_update({'begin_dt':prev_kline["begin_dt"]}, {'$set':update_fields})
+            await w_kline.put(new_kline)
 
     def generate_kline(self, begin_dt, trades, prev_kline):
         """ 生成新K线
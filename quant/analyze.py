@@ -87,7 +87,7 @@ class Analyzer(object):
         self.report_dic = dict() #最终报告
 
     async def get_daily_closes(self):
-        """ 获取每日收盘价
+        """ 获取每日收盘价,由数据库按天聚合,只返回每天一条记录
         """
         start_date = tools.datetime_str_to_ts(config.backtest["start_time"], fmt='%Y-%m-%d') #转换为时间戳
         start_date *= 1000 #转换为毫秒时间戳
@@ -98,37 +98,24 @@ class Analyzer(object):
         for x in config.platforms:
             platform = x["platform"]
             for sym in x["symbols"]:
-                r = await ModelAPI.get_klines_between(platform, sym, start_date, end_date)
-                if not r: #获取行情失败
+                r = await ModelAPI.get_daily_closes(platform, sym, start_date, end_date)
+                if r is None: #获取行情失败
                     return None
-                df = pd.DataFrame()
-                df_temp = pd.DataFrame(r)
-                df['end_dt'] = df_temp['end_dt']
-                df['close'] = df_temp['close_avg_fillna']
+                df = pd.DataFrame(r, columns=['trade_date', 'close'])
                 df['platform'] = platform
                 df['symbol'] = sym
                 pd_list.append(df)
 
         df = pd.concat(pd_list)
-        df['trade_date'] = (df['end_dt']+CHINA_TZONE_SHIFT)//ONE_DAY*ONE_DAY-CHINA_TZONE_SHIFT
         df = df.set_index(['platform', 'symbol', 'trade_date']).sort_index(axis=0)
-        df = df.drop(['end_dt'], axis=1)
-
-        def _get_last(ser):
-            r = 0
-            if ser.count() > 0:
-                for i in range(1, ser.count()):
-                    r = ser.iat[-i]
-                    if r > 0:
-                        break
-            return r
-
-        gp = df.reset_index().groupby(by=['platform', 'symbol', 'trade_date'])
-        df = gp.agg({'close': _get_last}) #因为获取的是分钟级别收盘价,所以要合成为日级别的收盘价
         return df
 
-    async def initialize(self, file_folder='.'):
-        """
+    async def initialize(self, file_folder='.', trades=None):
+        """ 初始化,读取成交列表和每日收盘价
+
+        Args:
+            file_folder: trades.csv所在目录,没有传入trades时从这个文件读取成交列表
+            trades: 成交列表DataFrame(比如FillStore.to_dataframe()),列和trades.csv相同
         """
         type_map = {'platform': str,
                     'account': str,
@@ -143,15 +130,16 @@ class Analyzer(object):
                     'fee': float,
                     'ctime': np.int64}
 
-        trades = pd.read_csv(os.path.join(file_folder, 'trades.csv'), ',', dtype=type_map)
+        if trades is None:
+            trades = pd.read_csv(os.path.join(file_folder, 'trades.csv'), sep=',', dtype=type_map)
         if trades.empty:
             logger.error("error:", "无法读取成交列表", caller=self)
             return False
         #因为我们时间用的都是东八区时间,换成时间戳以后并不是按天对齐的,为了能够按天对齐进行运算,要先加八小时,再减八小时
         trades['trade_date'] = (trades['ctime']+CHINA_TZONE_SHIFT)//ONE_DAY*ONE_DAY-CHINA_TZONE_SHIFT
-        self.trades = trades.set_index(['platform', 'symbol', 'ctime']).sort_index(axis=0)
+        self.trades = trades.set_index(['platform', 'symbol', 'ctime']).sort_index(axis=0, kind='mergesort')
         #保存交易符号列表
-        self.trades.groupby(by=['platform', 'symbol']).apply(lambda gp_df: self.universe.append((gp_df.index.levels[0][0], gp_df.index.levels[1][0])))
+        self.universe = list(self.trades.index.droplevel('ctime').unique())
         #回测天数
         self.period_day = int(config.backtest["period_day"])
         #获取每日收盘价
@@ -163,81 +151,65 @@ class Analyzer(object):
         #
         return True
 
+    def symbol_params(self, index):
+        """ 每一行对应交易符号的参数,返回(是否现货, 合约乘数, 是否反向合约)三个数组
+
+        Args:
+            index: 前两级为(platform, symbol)的MultiIndex
+        """
+        codes, uniques = pd.factorize(index.droplevel(list(range(2, index.nlevels))))
+        n = len(uniques)
+        is_spot, mult, is_inverse = np.zeros(n, dtype=bool), np.ones(n), np.zeros(n, dtype=bool)
+        for i, (platform, symbol) in enumerate(uniques):
+            syminfo = config.backtest["feature"][platform]["syminfo"][symbol]
+            if syminfo["type"] == "spot": #现货
+                is_spot[i] = True
+            elif syminfo["type"] == "future": #期货
+                mult[i] = syminfo['contract_size'] #合约乘数
+                is_inverse[i] = syminfo["is_inverse"]
+        return is_spot[codes], mult[codes], is_inverse[codes]
+
     def process_trades(self):
         """ 处理逐笔成交列表,计算并添加新的字段
+
+        所有交易符号一起按列计算,累计值按(platform, symbol)分组累加
         """
         df = self.trades
         # pre-process
         cols_to_drop = ['account', 'strategy', 'order_no', 'fill_no', 'liquidity']
         df = df.drop(cols_to_drop, axis=1) #抛弃不用的列
         #
-        def _apply(gp_df):
-            direction = gp_df['side'].apply(lambda s: 1 if s=="BUY" else -1)
-            price, quantity = gp_df['price'], gp_df['quantity']
-            platform = gp_df.index.levels[0][0]
-            symbol = gp_df.index.levels[1][0]
-            syminfo = config.backtest["feature"][platform]["syminfo"][symbol]
-            is_spot = False #是否是现货
-            is_future = False #是否是期货
-            is_inverse = False #如果是期货的话,是否是反向合约
-            if syminfo["type"] == "spot": #现货
-                is_spot = True
-            elif syminfo["type"] == "future": #期货
-                is_future = True
-                is_inverse = syminfo["is_inverse"]
-            #----------------------------------------
-            mult = 1 #合约乘数默认1
-            if is_spot: #现货
-                turnover = quantity * price #成交额
-                #现货手续费买入扣'货',卖出扣'钱',所以要统一成'钱'
-                #方法一:向量运算版
-                fee = gp_df['fee']
-                mask = direction==-1
-                commission = (direction + 1) / 2 * fee * price
-                commission[mask] = fee[mask]
-                gp_df['commission'] = commission
-                #方法二:标量循环版
-                #gp_df['commission'] = gp_df[['fee', 'side', 'price']].apply(lambda s: (s['fee']*s['price']) if s['side']=="BUY" else s['fee'], axis=1)
-            elif is_future: #期货
-                #不管正向合约还是反向合约,买卖的手续费都是从结算币种里面扣,不需要做特殊处理,
-                #比如BTC正向合约结算币种是USDT,那么就扣USDT,BTC反向合约结算币种是BTC,那么就扣BTC
-                gp_df['commission'] = gp_df['fee']
-                mult = syminfo['contract_size'] #合约乘数
-                if is_inverse: #反向合约
-                    #成交额的单位是结算币种,以BTC反向合约为例子,其结算币种为BTC,比如成交100张合约,每张合约价值100美金(合约乘数),
-                    #那么就是 100美金*100张合约/成交价=成交额(单位BTC)
-                    #turnover = mult * quantity / price
-                    pass
-                else: #正向合约
-                    #正向合约的成交额算法和现货类似,比如成交100张合约,每张合约价值0.01个BTC(合约乘数),
-                    #那么就是 0.01BTC*100张合约*成交价=成交额
-                    turnover = mult * quantity * price #成交额
-            gp_df['BuyVolume'] = (direction + 1) / 2 * quantity
-            gp_df['SellVolume'] = (direction - 1) / -2 * quantity
-            gp_df['TurnOver'] = turnover
-            gp_df['CumVolume'] = quantity.cumsum()
-            gp_df['CumTurnOver'] = turnover.cumsum()
-            gp_df['CumNetTurnOver'] = (turnover * -direction).cumsum() #累计净成交额
-            gp_df['CumNetVolume'] = (quantity * direction).cumsum() #累计净成交量
-            if is_spot: #现货
-                gp_df['CumProfit'] = (gp_df['CumNetTurnOver'] + gp_df['CumNetVolume'] * price) #累计净成交额+累计净成交量*成交价=累计盈亏(没计算手续费)
-                quantity -= (direction + 1) / 2 * gp_df['fee'] #现货买入是从'货'里面扣手续费
-                gp_df['position'] = (quantity * direction).cumsum() #去掉手续费后进行计算才是真实仓位
-            elif is_future: #期货
-                if is_inverse: #反向合约
-                    #gp_df['CumProfit'] = (gp_df['CumNetTurnOver'] + gp_df['CumNetVolume'] * mult / price) #比如BTC+BTC
-                    #gp_df['position'] = gp_df['CumNetVolume']
-                    pass
-                else: #正向合约
-                    gp_df['CumProfit'] = (gp_df['CumNetTurnOver'] + gp_df['CumNetVolume'] * price * mult) #比如USDT+USDT
-                    gp_df['position'] = gp_df['CumNetVolume']
-            return gp_df
-        #按交易符号分组处理
-        gp = df.groupby(by=['platform', 'symbol'])
-        self.trades = gp.apply(_apply)
+        is_spot, mult, is_inverse = self.symbol_params(df.index)
+        direction = np.where(df['side'].values == "BUY", 1.0, -1.0)
+        buy = (direction + 1) / 2
+        price, quantity, fee = df['price'].values, df['quantity'].values, df['fee'].values
+        #现货手续费买入扣'货',卖出扣'钱',所以要统一成'钱'
+        #期货不管正向合约还是反向合约,买卖的手续费都是从结算币种里面扣,不需要做特殊处理
+        df['commission'] = np.where(is_spot & (direction == 1), fee * price, fee)
+        #现货和正向合约成交额都是 合约乘数(现货为1)*成交量*成交价,比如成交100张合约,每张合约价值0.01个BTC(合约乘数),那么就是 0.01BTC*100张合约*成交价=成交额
+        #反向合约成交额的单位是结算币种(mult * quantity / price),暂不支持
+        turnover = np.where(is_inverse, np.nan, mult * quantity * price)
+        df['BuyVolume'] = buy * quantity
+        df['SellVolume'] = (1 - buy) * quantity
+        df['TurnOver'] = turnover
+        df['net_turnover'] = turnover * -direction
+        df['net_volume'] = quantity * direction
+        #现货买入是从'货'里面扣手续费,去掉手续费后进行计算才是真实仓位
+        df['net_position'] = np.where(is_spot, (quantity - buy * fee) * direction, quantity * direction)
+        cum = df.groupby(level=['platform', 'symbol'], sort=False)[['quantity', 'TurnOver', 'net_turnover', 'net_volume', 'net_position']].cumsum()
+        df['CumVolume'] = cum['quantity']
+        df['CumTurnOver'] = cum['TurnOver']
+        df['CumNetTurnOver'] = cum['net_turnover'] #累计净成交额
+        df['CumNetVolume'] = cum['net_volume'] #累计净成交量
+        #累计净成交额+累计净成交量*成交价*合约乘数=累计盈亏(没计算手续费)
+        df['CumProfit'] = np.where(is_inverse, np.nan, df['CumNetTurnOver'].values + df['CumNetVolume'].values * price * mult)
+        df['position'] = cum['net_position']
+        self.trades = df.drop(['net_turnover', 'net_volume', 'net_position'], axis=1)
 
     def process_daily(self):
         """ 每日成交处理
+
+        所有交易符号的(platform, symbol, trade_date)面板一起按列计算
         """
         close = self.closes
         trade = self.trades
@@ -246,84 +218,43 @@ class Analyzer(object):
         trade_cols = ['trade_date', 'BuyVolume', 'SellVolume', 'commission', 'CumNetVolume', 'CumNetTurnOver', 'position', 'TurnOver']
         trade = trade.loc[:, trade_cols] #只留下需要的列
         gp = trade.reset_index().groupby(by=['platform', 'symbol', 'trade_date']) #按天分组
-        func_last = lambda ser: ser.iat[-1]
-        df = gp.agg({'BuyVolume': np.sum, 'SellVolume': np.sum, 'commission': np.sum, 'TurnOver': np.sum,
-                     'CumNetVolume': func_last, 'CumNetTurnOver': func_last, 'position': func_last}) #按日统计
+        df = gp.agg({'BuyVolume': 'sum', 'SellVolume': 'sum', 'commission': 'sum', 'TurnOver': 'sum',
+                     'CumNetVolume': 'last', 'CumNetTurnOver': 'last', 'position': 'last'}) #按日统计
         df.index.names = ['platform', 'symbol', 'trade_date']
         #
-        df = pd.concat([close, df], axis=1, join='outer') #和每日收盘价连接到一起,如果某一天没有成交,下面会填默认值
-
-        def _apply(gp_df):
-            """ 给每日成交统计添加新的列
-            """
-            platform = gp_df.index.levels[0][0]
-            symbol = gp_df.index.levels[1][0]
-            syminfo = config.backtest["feature"][platform]["syminfo"][symbol]
-            is_spot = False #是否是现货
-            is_future = False #是否是期货
-            is_inverse = False #如果是期货的话,是否是反向合约
-            if syminfo["type"] == "spot": #现货
-                is_spot = True
-            elif syminfo["type"] == "future": #期货
-                is_future = True
-                is_inverse = syminfo["is_inverse"]
-            #----------------------------------------------
-            #如果某一天没有成交,填默认值
-            cols_nan_fill = ['close', 'CumNetVolume', 'CumNetTurnOver', 'position']
-            gp_df[cols_nan_fill] = gp_df[cols_nan_fill].fillna(method='ffill')
-            gp_df[cols_nan_fill] = gp_df[cols_nan_fill].fillna(0)
-            #如果某一天没有成交,填默认值
-            cols_nan_to_zero = ['BuyVolume', 'SellVolume', 'commission']
-            gp_df[cols_nan_to_zero] = gp_df[cols_nan_to_zero].fillna(0)
-            #
-            mult = 1.0
-            #
-            close = gp_df['close']
-            commission = gp_df['commission']
-            cum_net_volume = gp_df['CumNetVolume']
-            cum_net_turnOver = gp_df['CumNetTurnOver']
-            if is_spot: #现货
-                cum_profit = cum_net_turnOver + cum_net_volume * close
-            elif is_future: #期货
-                mult = syminfo['contract_size'] #合约乘数
-                if is_inverse: #反向合约
-                    #cum_profit = cum_net_turnOver + mult * cum_net_volume / close
-                    pass
-                else: #正向合约
-                    cum_profit = cum_net_turnOver + mult * cum_net_volume * close
-            #
-            cum_profit_comm = cum_profit - commission.cumsum()
-            gp_df['CumProfit'] = cum_profit #累计盈亏
-            gp_df['CumProfitComm'] = cum_profit_comm #计算了手续费后的累计盈亏
-            #
-            daily_cum_net_turnover_change = cum_net_turnOver.diff(1)
-            daily_cum_net_turnover_change.iloc[0] = cum_net_turnOver.iloc[0]
-            #
-            daily_cum_net_volume_change = cum_net_volume.diff(1)
-            daily_cum_net_volume_change.iloc[0] = cum_net_volume.iloc[0]
-            if is_spot: #现货
-                trading_pnl = (daily_cum_net_turnover_change + close * daily_cum_net_volume_change - commission) #每日交易盈亏(重点:指的是每日)
-                holding_pnl = (close.diff(1) * cum_net_volume.shift(1)).fillna(0.0) #每日持仓盈亏(重点:指的是每日)
-            elif is_future: #期货
-                if is_inverse: #反向合约
-                    #trading_pnl = (daily_cum_net_turnover_change + mult * daily_cum_net_volume_change / close - commission)
-                    #mult * cum_net_volume.shift(1) / close
-                    #holding_pnl = (mult * cum_net_volume.shift(1) / close.diff(1)).fillna(0.0)
-                    pass
-                else: #正向合约
-                    trading_pnl = (daily_cum_net_turnover_change + mult * close * daily_cum_net_volume_change - commission)
-                    holding_pnl = (mult * close.diff(1) * cum_net_volume.shift(1)).fillna(0.0)
-            #
-            total_pnl = trading_pnl + holding_pnl
-            gp_df['trading_pnl'] = trading_pnl #每日交易盈亏(重点:指的是每日)
-            gp_df['holding_pnl'] = holding_pnl #每日持仓盈亏(重点:指的是每日)
-            gp_df['total_pnl'] = total_pnl #每日总盈亏(重点:指的是每日)
-            return gp_df
-        #按交易符号分组处理
-        gp = df.groupby(by=['platform', 'symbol'])
-        self.daily = gp.apply(_apply)
+        df = pd.concat([close, df], axis=1, join='outer').sort_index() #和每日收盘价连接到一起,如果某一天没有成交,下面会填默认值
+        #如果某一天没有成交,填默认值
+        cols_nan_fill = ['close', 'CumNetVolume', 'CumNetTurnOver', 'position']
+        df[cols_nan_fill] = df.groupby(level=['platform', 'symbol'], sort=False)[cols_nan_fill].ffill().fillna(0)
+        cols_nan_to_zero = ['BuyVolume', 'SellVolume', 'commission']
+        df[cols_nan_to_zero] = df[cols_nan_to_zero].fillna(0)
+        #
+        is_spot, mult, is_inverse = self.symbol_params(df.index)
+        mult[is_inverse] = np.nan #反向合约暂不支持
+        #每个交易符号的第一天
+        codes = pd.factorize(df.index.droplevel('trade_date'))[0]
+        first = np.ones(len(df), dtype=bool)
+        first[1:] = codes[1:] != codes[:-1]
+        #
+        close = df['close'].values
+        commission = df['commission'].values
+        cum_net_volume = df['CumNetVolume'].values
+        cum_net_turnover = df['CumNetTurnOver'].values
+        cum_profit = cum_net_turnover + mult * cum_net_volume * close
+        df['CumProfit'] = cum_profit #累计盈亏
+        df['CumProfitComm'] = cum_profit - df.groupby(level=['platform', 'symbol'], sort=False)['commission'].cumsum().values #计算了手续费后的累计盈亏
+        #每日变化量,每个交易符号第一天的变化量就是当天的值
+        daily_cum_net_turnover_change = np.where(first, cum_net_turnover, cum_net_turnover - np.roll(cum_net_turnover, 1))
+        daily_cum_net_volume_change = np.where(first, cum_net_volume, cum_net_volume - np.roll(cum_net_volume, 1))
+        close_change = np.where(first, 0.0, close - np.roll(close, 1))
+        prev_volume = np.where(first, 0.0, np.roll(cum_net_volume, 1))
+        trading_pnl = daily_cum_net_turnover_change + mult * close * daily_cum_net_volume_change - commission #每日交易盈亏(重点:指的是每日)
+        holding_pnl = mult * close_change * prev_volume #每日持仓盈亏(重点:指的是每日)
+        df['trading_pnl'] = trading_pnl
+        df['holding_pnl'] = holding_pnl
+        df['total_pnl'] = trading_pnl + holding_pnl #每日总盈亏(重点:指的是每日)
         #
-        self.daily = self.daily.drop(['CumNetVolume', 'CumNetTurnOver'], axis=1)
+        self.daily = df.drop(['CumNetVolume', 'CumNetTurnOver'], axis=1)
         #报告输出的时候需要用到
         gp = self.daily.groupby(by=['platform', 'symbol'])
         for key, value in gp:
@@ -20,15 +20,32 @@ class Asset:
         assets: Asset information, e.g. {"BTC": {"free": 1.1, "locked": 2.2, "total": 3.3}, ... }
         timestamp: Published time, millisecond.
         update: If any update? True or False.
+        changes: Only the currencies changed by this update, same format as `assets`. None means a full update.
+        snapshot: Function to build `assets` on first access, used instead of `assets` when building the full
+            asset list is expensive and most receivers only look at `changes`.
     """
 
-    def __init__(self, platform=None, account=None, assets=None, timestamp=None, update=False):
+    def __init__(self, platform=None, account=None, assets=None, timestamp=None, update=False, changes=None, snapshot=None):
         """ Initialize. """
         self.platform = platform
         self.account = account
-        self.assets = assets
+        self._assets = assets
+        self._snapshot = snapshot
         self.timestamp = timestamp
         self.update = update
+        self.changes = changes
+
+    @property
+    def assets(self):
+        if self._assets is None and self._snapshot is not None:
+            self._assets = self._snapshot()
+            self._snapshot = None
+        return self._assets
+
+    @assets.setter
+    def assets(self, assets):
+        self._assets = assets
+        self._snapshot = None
 
     @property
     def data(self):
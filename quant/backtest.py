@@ -22,13 +22,12 @@ from typing import DefaultDict, Deque, List, Dict, Tuple, Optional, Any
 from itertools import zip_longest
 from abc import ABCMeta, abstractmethod
 from six import with_metaclass
-from decimal import Decimal
 
 from quant.config import config
 from quant.state import State
 from quant.order import Order, Fill, SymbolInfo
 from quant.tasks import SingleTask, LoopRunTask
-from quant.position import Position
+from quant.position import Position, MARGIN_MODE_CROSSED
 from quant.asset import Asset
 from quant.const import MARKET_TYPE_KLINE, MARKET_TYPE_KLINE_5M
 from quant.utils import tools, logger
@@ -36,9 +35,13 @@ from quant.utils.decorator import async_method_locker
 from quant.order import ORDER_ACTION_BUY, ORDER_ACTION_SELL
 from quant.order import ORDER_TYPE_LIMIT, ORDER_TYPE_MARKET, ORDER_TYPE_IOC
 from quant.order import LIQUIDITY_TYPE_MAKER, LIQUIDITY_TYPE_TAKER
+from quant.order import TRADE_TYPE_NONE, TRADE_TYPE_BUY_OPEN, TRADE_TYPE_SELL_OPEN, TRADE_TYPE_SELL_CLOSE, TRADE_TYPE_BUY_CLOSE
 from quant.order import ORDER_STATUS_SUBMITTED, ORDER_STATUS_PARTIAL_FILLED, ORDER_STATUS_FILLED, ORDER_STATUS_CANCELED, ORDER_STATUS_FAILED
 from quant.market import Kline, Orderbook, Trade, Ticker
 from quant.history import VirtualTrader
+from quant.matching import MarketDepth, RestingOrders
+from quant.ledger import Ledger, DEFAULT_UNIT, decimals
+from quant.metrics import OnlineMetrics
 from quant.infra_api import InfraAPI
 from quant.interface.model_api import ModelAPI
 from quant.trader import Trader
@@ -60,15 +63,48 @@ class SequenceGenerator(object):
 
 class BaseMatchEngine(with_metaclass(ABCMeta)):
     """ 撮合引擎基类
+
+    K线驱动时挂单在收盘均价越过挂单价格时全部成交.
+    订单薄驱动时主动成交按档位依次吃掉对手盘,对手盘越过挂单价格时挂单成交,同时根据档位挂单量估计挂单的排队位置;
+    逐笔成交驱动时挂单先等排在前面的数量成交完再成交.有订单薄或者逐笔成交时K线不再参与撮合.
+    成交以后的资产和持仓结算由子类的_settle实现.
+
+    撮合和结算内部价格使用整数个price_tick,数量使用整数个size_tick,资产记在BacktestTrader的整数账本(Ledger)中,
+    只有通知上层策略时才转换为浮点数.
     """
 
     def __init__(self, symbol, trader, **kwargs):
         """Initialize."""
+        self.cb = kwargs["cb"]
         self._platform = kwargs.get("databind")
+        self._strategy = kwargs.get("strategy")
+        self._account = kwargs.get("account")
         self._symbol = symbol #绑定的交易对符号
+        self._trader = trader
+        self._ledger = trader._ledger #账户资产账本
         self._seq_gen = SequenceGenerator()
         self._maker_commission_rate = config.backtest["feature"][self._platform]["maker_commission_rate"] #maker手续费
         self._taker_commission_rate = config.backtest["feature"][self._platform]["taker_commission_rate"] #taker手续费
+        self._last_kline = None
+        self._last_trade_price = None #最新逐笔成交价格
+        self.market_price = None #最新市场价格(K线收盘均价,订单薄中间价,逐笔成交价格)
+        #符号相关信息只读取一次
+        syminfo = config.backtest["feature"][self._platform]["syminfo"][self._symbol]
+        self._price_tick = syminfo["price_tick"]   #价格变动最小精度
+        self._size_tick = syminfo["size_tick"]     #下单数量变动最小精度
+        self._size_limit = syminfo["size_limit"]   #下单数量最小限制
+        self._value_tick = syminfo["value_tick"]   #下单金额变动最小精度
+        self._value_limit = syminfo["value_limit"] #下单金额最小限制
+        self._base_currency = syminfo["base_currency"] #基础币种,交易标的,或者说就是'货'
+        self._settlement_currency = syminfo["settlement_currency"] #结算币种,或者说就是'钱'
+        self._price_scale = 1 / self._price_tick #价格乘以price_scale取整就是价格档位
+        self._size_scale = 1 / self._size_tick
+        self._price_digits = decimals(self._price_tick)
+        self._size_digits = decimals(self._size_tick)
+        self._resting = RestingOrders(self._price_tick) #挂单
+        self._orders = self._resting.orders #订单列表,模拟订单薄
+        self._depth = MarketDepth(self._price_tick) #市场订单薄
+        self._depth_pending = False #set_depth已经更新了订单薄,on_orderbook_update_callback不需要再转换
 
     def next_fill_no(self):
         return "trade_{}_{}_{:0>8d}".format(self._platform, self._symbol, self._seq_gen.get_next('trade_id'))
@@ -88,20 +124,227 @@ class BaseMatchEngine(with_metaclass(ABCMeta)):
         """
         return self._taker_commission_rate
 
-    @abstractmethod
+    def _price(self, n):
+        """ 价格档位转换为浮点数价格
+        """
+        return round(n * self._price_tick, self._price_digits)
+
+    def _size(self, n):
+        """ 数量档位转换为浮点数数量
+        """
+        return round(n * self._size_tick, self._size_digits)
+
     async def on_kline_update_callback(self, kline: Kline):
         """ K线方式驱动回测引擎
         """
+        self._last_kline = kline #保存最新一根K线
+        if kline.usable:
+            self.market_price = kline.close_avg_fillna
+            self.on_market_price(self.market_price)
+        if not self._depth.ready and self._last_trade_price is None: #有更细粒度的数据时由它们撮合
+            await self.make_trade() #尝试和订单列表中的订单进行撮合成交
+
+    def set_depth(self, arrays, i):
+        """ 回放订单薄时直接引用数据块中的档位数组
+        """
+        self._depth.update(arrays, i)
+        self._depth_pending = True
 
-    @abstractmethod
     async def on_orderbook_update_callback(self, orderbook: Orderbook):
         """ 订单薄方式驱动回测引擎
         """
+        if self._depth_pending:
+            self._depth_pending = False
+        else:
+            self._depth.update_from_orderbook(orderbook)
+        if self._depth.best_ask is not None and self._depth.best_bid is not None:
+            self.market_price = (self._depth.best_ask + self._depth.best_bid) / 2
+            self.on_market_price(self.market_price)
+        if self._orders:
+            await self.match_depth()
 
-    @abstractmethod
     async def on_trade_update_callback(self, trade: Trade):
         """ 市场成交方式驱动回测引擎
         """
+        self._last_trade_price = trade.price
+        self.market_price = trade.price
+        self.on_market_price(trade.price)
+        if self._orders:
+            await self.match_trade(trade)
+
+    async def make_trade(self):
+        """ 尝试和订单列表中的订单进行撮合成交
+        """
+        price = self._last_kline.close_avg_fillna
+        price_t = round(price * self._price_scale) #收盘均价模拟成交价
+        #只取出价格能够成交的挂单,买单价格不低于当前价格,卖单价格不高于当前价格
+        for o in self._resting.pop_crossed(price, price):
+            if o.order_no not in self._orders: #回调函数里可能已经撤销了这个订单
+                continue
+            await self._fill_resting_order(o, price_t)
+
+    async def match_depth(self):
+        """ 订单薄撮合: 对手盘价格越过挂单价格时挂单以挂单价格全部成交,否则更新挂单的排队位置
+        """
+        for o in self._resting.pop_crossed(self._depth.best_ask, self._depth.best_bid):
+            if o.order_no in self._orders:
+                await self._fill_resting_order(o, round(o.price * self._price_scale))
+        self._resting.update_queue(self._depth)
+
+    async def match_trade(self, trade: Trade):
+        """ 逐笔成交撮合: 成交价格优于挂单价格时挂单以挂单价格全部成交,
+        和挂单价格相同时先消耗排在前面的数量,剩下的数量才和挂单成交
+        """
+        bid_price = ask_price = None
+        if trade.action != ORDER_ACTION_BUY: #主动卖出吃的是买单,方向未知时两边都检查
+            bid_price = trade.price
+        if trade.action != ORDER_ACTION_SELL: #主动买入吃的是卖单
+            ask_price = trade.price
+        for o in self._resting.pop_crossed(bid_price, ask_price, strict=True):
+            if o.order_no in self._orders:
+                await self._fill_resting_order(o, round(o.price * self._price_scale))
+        fills = []
+        if bid_price is not None:
+            fills.extend(self._resting.consume_queue(ORDER_ACTION_BUY, trade.price, trade.quantity))
+        if ask_price is not None:
+            fills.extend(self._resting.consume_queue(ORDER_ACTION_SELL, trade.price, trade.quantity))
+        for o, quantity in fills:
+            if o.order_no in self._orders:
+                await self._fill_resting_order(o, round(o.price * self._price_scale), round(quantity * self._size_scale))
+
+    async def _fill_resting_order(self, o, price_t, vol_t=None):
+        """ 挂单成交(maker),成交量为None或者超过剩余数量时按剩余数量成交
+
+        Args:
+            o: 订单
+            price_t: 成交价格档位
+            vol_t: 成交数量档位
+        """
+        remain_t = round(o.remain * self._size_scale)
+        if vol_t is None or vol_t > remain_t:
+            vol_t = remain_t
+        if vol_t <= 0:
+            return
+        ts = ModelAPI.current_milli_timestamp()
+        #订单通知
+        remain_t -= vol_t
+        o.remain = self._size(remain_t)
+        o.status = ORDER_STATUS_FILLED if remain_t <= 0 else ORDER_STATUS_PARTIAL_FILLED
+        o.utime = ts
+        if self.cb.on_order_update_callback:
+            await self.cb.on_order_update_callback(o)
+        #成交通知和账户资产通知
+        await self._settle(o, price_t, vol_t, LIQUIDITY_TYPE_MAKER, True)
+        #删除订单簿中的订单
+        if remain_t <= 0:
+            self._resting.remove(o.order_no)
+
+    def on_market_price(self, price):
+        """ 市场价格变化(K线收盘均价,订单薄中间价,逐笔成交价格),合约引擎用来更新未实现盈亏
+        """
+        pass
+
+    def precision_verify(self, src:float, t:float):
+        #src和t不能超出浮点数有效精度范围
+        #t为0代表不检测,直接返回True
+        if not t:
+            return True
+        n = src / t
+        return abs(n - round(n)) <= 1e-9 + 1e-12 * abs(n) #只容许浮点数本身的表示误差
+
+    def _money(self, price_t, vol_t):
+        """ 成交金额,单位为结算币种的记账单位,没有取整
+        """
+        return price_t * vol_t * self._price_tick * self._size_tick * self._ledger.scale[self._settlement_currency]
+
+    def _affordable(self, money_t, price_t):
+        """ money_t个记账单位的结算币种在price_t价格上最多能买多少个size_tick
+        """
+        return int(money_t / self._money(price_t, 1) + 1e-9)
+
+    def _reference_price(self):
+        """ 没有订单薄时模拟成交使用的参考价格: 最新逐笔成交价格,没有逐笔成交时为最新K线收盘均价
+        """
+        if self._last_trade_price is not None:
+            return self._last_trade_price
+        if self._last_kline and self._last_kline.usable:
+            return self._last_kline.close_avg_fillna
+        return None
+
+    def _take(self, side, limit=None, quantity_t=None, money_t=None):
+        """ 主动成交,有订单薄时按订单薄档位成交,否则按参考价格模拟成交
+
+        Args:
+            side: 对手盘, ORDER_ACTION_SELL为卖盘, ORDER_ACTION_BUY为买盘
+            limit: 限价,None表示市价
+            quantity_t: 成交数量档位
+            money_t: 成交金额(市价买单),结算币种记账单位
+
+        Returns:
+            ([(成交价格档位, 成交数量档位), ...], 剩余数量档位或者金额, 对手盘显示的档位是否已经吃完)
+        """
+        if self._depth.ready:
+            return self._walk_depth(side, limit, quantity_t, money_t)
+        return self._take_reference(side, limit, quantity_t, money_t)
+
+    def _walk_depth(self, side, limit=None, quantity_t=None, money_t=None):
+        """ 主动成交时从最优价开始依次吃掉对手盘档位,参数和返回值与_take一致
+        """
+        price_scale = self._price_scale
+        size_scale = self._size_scale
+        fills = []
+        left = quantity_t if money_t is None else money_t
+        for p, s in self._depth.levels(side):
+            if limit is not None and (p > limit if side == ORDER_ACTION_SELL else p < limit):
+                return fills, left, False
+            if s <= 0: #已经被自己吃掉了
+                continue
+            p_t = round(p * price_scale)
+            vol_t = int(s * size_scale + 1e-9) #按最小精度向下取整
+            if money_t is None:
+                vol_t = min(vol_t, left)
+            else:
+                vol_t = min(vol_t, self._affordable(left, p_t))
+            if vol_t <= 0:
+                return fills, left, False
+            fills.append((p_t, vol_t))
+            self._depth.consume(side, p, self._size(vol_t))
+            if money_t is None:
+                left -= vol_t
+            else:
+                left -= round(self._money(p_t, vol_t))
+            if left <= 0:
+                return fills, 0, False
+        return fills, left, True
+
+    def _take_reference(self, side, limit=None, quantity_t=None, money_t=None):
+        """ 没有订单薄时按参考价格模拟主动成交,参数和返回值与_take一致
+        """
+        ref_price = self._reference_price()
+        #限价买单价格低于参考价格或者限价卖单价格高于参考价格时无法成交
+        if limit is not None and (ref_price > limit if side == ORDER_ACTION_SELL else ref_price < limit):
+            return [], quantity_t, False
+        price_t = round(ref_price * self._price_scale)
+        if money_t is None:
+            return [(price_t, quantity_t)], 0, False
+        vol_t = self._affordable(money_t, price_t)
+        if vol_t <= 0:
+            return [], money_t, False
+        return [(price_t, vol_t)], money_t - round(self._money(price_t, vol_t)), False
+
+    async def _notify_asset(self, ts, *currencies):
+        """ 账户资产通知,只转换发生变化的币种(Asset.changes),完整资产列表等到上层策略访问Asset.assets时才生成
+        """
+        if self.cb.on_asset_update_callback:
+            ledger = self._ledger
+            changes = {c: ledger.entry(c) for c in currencies}
+            ast = Asset(self._platform, self._account, None, ts, True, changes, ledger.snapshot)
+            await self.cb.on_asset_update_callback(ast)
+
+    @abstractmethod
+    async def _settle(self, o, price_t, vol_t, liquidity, locked):
+        """ 成交通知和账户资产结算
+        """
 
     @abstractmethod
     async def create_order(self, action, price, quantity, order_type=ORDER_TYPE_LIMIT):
@@ -113,7 +356,7 @@ class BaseMatchEngine(with_metaclass(ABCMeta)):
         """ 撤单
         """
 
-    @abstractmethod    
+    @abstractmethod
     async def get_orders(self):
         """ 获取挂单列表
         """
@@ -123,10 +366,23 @@ class BaseMatchEngine(with_metaclass(ABCMeta)):
         """ 获取当前仓位
         """
 
-    @abstractmethod
     async def get_symbol_info(self):
         """ 获取符号信息
         """
+        info = config.backtest["feature"][self._platform]["syminfo"][self._symbol]
+        price_tick = info["price_tick"]
+        size_tick = info["size_tick"]
+        size_limit = info["size_limit"]
+        value_tick = info["value_tick"]
+        value_limit = info["value_limit"]
+        base_currency = info["base_currency"]
+        quote_currency = info["quote_currency"]
+        settlement_currency = info["settlement_currency"]
+        symbol_type = info["type"]
+        is_inverse = info["is_inverse"] if info.get("is_inverse") else False
+        multiplier = info["contract_size"] if info.get("contract_size") else 1
+        syminfo = SymbolInfo(self._platform, self._symbol, price_tick, size_tick, size_limit, value_tick, value_limit, base_currency, quote_currency, settlement_currency, symbol_type, is_inverse, multiplier)
+        return syminfo, None
 
     @abstractmethod
     async def invalid_indicate(self, indicate_type):
@@ -136,75 +392,377 @@ class BaseMatchEngine(with_metaclass(ABCMeta)):
 
 class SimpleFutureMatchEngine(BaseMatchEngine):
     """ 简单版合约回测撮合引擎
+
+    支持正向合约和反向合约(syminfo中的is_inverse),全仓模式,杠杆倍数为feature中的leverage.
+    okex风格合约(contract_style)可以多空同时持仓,quantity为正数时买入开多/卖出平多,为负数时买入平空/卖出开空(和火币合约接口一致);
+    bitmex风格合约同一时间只能持有一个方向的仓位,quantity为正数,买入先平空仓再开多仓,卖出先平多仓再开空仓.
+
+    结算币种资产: total为静态权益(初始资产+已实现盈亏-手续费)加上未实现盈亏,locked为持仓保证金加上开仓挂单冻结的保证金.
+    市场价格变化时只按本合约的多空持仓重新计算未实现盈亏和持仓保证金,把和上一次的差额加到结算币种资产上,
+    不需要遍历同一结算币种下的其他合约,所以每个tick的盯市结算都是O(1).
     """
 
     def __init__(self, symbol, trader, **kwargs):
         """Initialize."""
         super(SimpleFutureMatchEngine, self).__init__(symbol, trader, **kwargs)
-        self.cb = kwargs["cb"]
-        self._platform = kwargs.get("databind")
-        self._strategy = kwargs.get("strategy")
-        self._account = kwargs.get("account")
-        self._symbol = symbol #绑定的交易对符号
-        self._trader = trader
-        self._orders = dict() #订单列表,模拟订单薄
-        self._last_kline = None
+        feature = config.backtest["feature"][self._platform]
+        syminfo = feature["syminfo"][self._symbol]
+        self._contract_size = syminfo.get("contract_size", 1) #合约大小
+        self._is_inverse = syminfo.get("is_inverse", False) #是否反向合约
+        self._one_way = syminfo.get("contract_style", "okex") == "bitmex" #同一时间只能持有一个方向仓位
+        self._leverage = feature.get("leverage", 1) #杠杆比率
+        self._ledger.add_unit(self._settlement_currency, DEFAULT_UNIT) #保证金和盈亏没有固定精度
+        self._position = Position(self._platform, self._account, self._strategy, self._symbol)
+        self._position.margin_mode = MARGIN_MODE_CROSSED
+        self._position.long_leverage = self._leverage
+        self._position.short_leverage = self._leverage
+        self._long_t = 0 #多仓数量档位
+        self._long_avail_t = 0 #多仓可平仓数量档位
+        self._short_t = 0
+        self._short_avail_t = 0
+        self._mark_price = None #最新市场价格
+        self._unrealised_pnl = 0 #已经计入资产的未实现盈亏(记账单位)
+        self._position_margin = 0 #已经计入资产的持仓保证金(记账单位)
+        self._frozen = {} #开仓挂单冻结的保证金 {order_no: [每个数量档位冻结的保证金, 还冻结着的数量档位, 还冻结着的保证金]}
+
+    def _value(self, vol_t, price):
+        """ 合约价值(结算币种)
+        """
+        if self._is_inverse:
+            return vol_t*self._size_tick*self._contract_size/price
+        return vol_t*self._size_tick*self._contract_size*price
 
-    async def on_kline_update_callback(self, kline: Kline):
-        """ K线方式驱动回测引擎
+    def _pnl(self, vol_t, open_price, price):
+        """ 多仓盈亏(结算币种),空仓盈亏为相反数
         """
-        self._last_kline = kline #保存最新一根K线
-        await self.make_trade() #尝试和订单列表中的订单进行撮合成交
+        if self._is_inverse:
+            return vol_t*self._size_tick*self._contract_size*(1/open_price - 1/price)
+        return vol_t*self._size_tick*self._contract_size*(price - open_price)
 
-    async def on_orderbook_update_callback(self, orderbook: Orderbook):
-        """ 订单薄方式驱动回测引擎
+    def _avg_price(self, q0, p0, q1, p1):
+        """ 加仓以后的开仓均价,反向合约按合约价值加权(调和平均)
         """
-        pass
+        if q0 <= 0:
+            return p1
+        if self._is_inverse:
+            return (q0+q1)/(q0/p0 + q1/p1)
+        return (q0*p0 + q1*p1)/(q0+q1)
+
+    def on_market_price(self, price):
+        """ 市场价格变化,更新本合约的未实现盈亏和持仓保证金
+        """
+        if price != self._mark_price:
+            self._mark_price = price
+            if self._long_t or self._short_t:
+                self._mark_to_market()
 
-    async def on_trade_update_callback(self, trade: Trade):
-        """ 市场成交方式驱动回测引擎
+    def _mark_to_market(self):
+        """ 按最新价格重新计算本合约的未实现盈亏和持仓保证金,和上一次的差额计入结算币种资产
         """
-        pass
+        pos = self._position
+        price = self._mark_price
+        pos.long_unrealised_pnl = self._pnl(self._long_t, pos.long_open_price, price) if self._long_t else 0
+        pos.short_unrealised_pnl = -self._pnl(self._short_t, pos.short_open_price, price) if self._short_t else 0
+        pos.long_margin = self._value(self._long_t, price)/self._leverage
+        pos.short_margin = self._value(self._short_t, price)/self._leverage
+        scale = self._ledger.scale[self._settlement_currency]
+        upnl = round((pos.long_unrealised_pnl + pos.short_unrealised_pnl)*scale)
+        margin = round((pos.long_margin + pos.short_margin)*scale)
+        #free = total - locked, 未实现盈亏增加total,持仓保证金增加locked
+        c = self._settlement_currency
+        self._ledger.free[c] += (upnl - self._unrealised_pnl) - (margin - self._position_margin)
+        self._ledger.locked[c] += margin - self._position_margin
+        self._unrealised_pnl = upnl
+        self._position_margin = margin
+
+    def _sync_position(self, ts):
+        """ 持仓数量档位转换为浮点数
+        """
+        pos = self._position
+        pos.long_quantity = self._size(self._long_t)
+        pos.long_avail_qty = self._size(self._long_avail_t)
+        pos.short_quantity = self._size(self._short_t)
+        pos.short_avail_qty = self._size(self._short_avail_t)
+        pos.utime = ts
+
+    def _legs(self, o, vol_t):
+        """ 把成交数量拆分为开仓和平仓 [(trade_type, 数量档位), ...]
+        """
+        if o.trade_type != TRADE_TYPE_NONE:
+            return [(o.trade_type, vol_t)]
+        #bitmex风格先平掉反方向仓位,剩下的再开仓
+        if o.action == ORDER_ACTION_BUY:
+            close = min(vol_t, self._short_t)
+            legs = [(TRADE_TYPE_BUY_CLOSE, close), (TRADE_TYPE_BUY_OPEN, vol_t - close)]
+        else:
+            close = min(vol_t, self._long_t)
+            legs = [(TRADE_TYPE_SELL_CLOSE, close), (TRADE_TYPE_SELL_OPEN, vol_t - close)]
+        return [(t, q) for t, q in legs if q > 0]
 
-    async def make_trade(self):
-        """ 尝试和订单列表中的订单进行撮合成交
+    async def _settle(self, o, price_t, vol_t, liquidity, locked):
+        """ 成交通知,持仓和账户资产结算
         """
-        pass
+        pos = self._position
+        ledger = self._ledger
+        c = self._settlement_currency
+        scale = ledger.scale[c]
+        tradeprice = self._price(price_t)
+        rate = self.maker_commission_rate if liquidity == LIQUIDITY_TYPE_MAKER else self.taker_commission_rate
+        fee = round(self._value(vol_t, tradeprice)*rate*scale) #合约手续费从结算币种里面扣除
+        ts = ModelAPI.current_milli_timestamp()
+        #成交通知
+        fill_no = self.next_fill_no()
+        f = {
+            "platform": self._platform,
+            "account": self._account,
+            "strategy": self._strategy,
+            "fill_no": fill_no,
+            "order_no": o.order_no,
+            "side": o.action, #成交方向,买还是卖
+            "symbol": self._symbol,
+            "price": tradeprice, #成交价格
+            "quantity": self._size(vol_t), #成交数量
+            "liquidity": liquidity, #maker成交还是taker成交
+            "fee": ledger.to_float(c, fee),
+            "ctime": ts
+        }
+        fill = Fill(**f)
+        if self.cb.on_fill_update_callback:
+            await self.cb.on_fill_update_callback(fill)
+        #持仓变化
+        ledger.free[c] -= fee
+        opened = 0
+        for trade_type, q in self._legs(o, vol_t):
+            if trade_type == TRADE_TYPE_BUY_OPEN: #买入开多
+                pos.long_open_price = self._avg_price(self._long_t, pos.long_open_price, q, tradeprice)
+                pos.long_hold_price = pos.long_open_price
+                self._long_t += q
+                self._long_avail_t += q
+                opened += q
+            elif trade_type == TRADE_TYPE_SELL_OPEN: #卖出开空
+                pos.short_open_price = self._avg_price(self._short_t, pos.short_open_price, q, tradeprice)
+                pos.short_hold_price = pos.short_open_price
+                self._short_t += q
+                self._short_avail_t += q
+                opened += q
+            elif trade_type == TRADE_TYPE_SELL_CLOSE: #卖出平多
+                ledger.free[c] += round(self._pnl(q, pos.long_open_price, tradeprice)*scale) #已实现盈亏
+                self._long_t -= q
+                if o.trade_type == TRADE_TYPE_NONE: #okex风格下单时已经冻结了可平仓数量
+                    self._long_avail_t -= q
+                if self._long_t <= 0:
+                    pos.long_open_price = pos.long_hold_price = 0
+            elif trade_type == TRADE_TYPE_BUY_CLOSE: #买入平空
+                ledger.free[c] -= round(self._pnl(q, pos.short_open_price, tradeprice)*scale)
+                self._short_t -= q
+                if o.trade_type == TRADE_TYPE_NONE:
+                    self._short_avail_t -= q
+                if self._short_t <= 0:
+                    pos.short_open_price = pos.short_hold_price = 0
+        #释放开仓冻结的保证金,订单完成时全部释放
+        frozen = self._frozen.get(o.order_no)
+        if frozen:
+            if o.remain <= 0:
+                release = frozen[2]
+                del self._frozen[o.order_no]
+            else:
+                q = min(opened, frozen[1])
+                release = min(round(frozen[0]*q), frozen[2])
+                frozen[1] -= q
+                frozen[2] -= release
+            ledger.locked[c] -= release
+            ledger.free[c] += release
+        if self._mark_price is None:
+            self._mark_price = tradeprice
+        self._mark_to_market()
+        self._sync_position(ts)
+        await self._notify_account(ts)
+
+    async def _notify_account(self, ts):
+        """ 账户资产和持仓通知
+        """
+        await self._notify_asset(ts, self._settlement_currency)
+        if self.cb.on_position_update_callback:
+            await self.cb.on_position_update_callback(self._position)
+
+    def _release(self, o):
+        """ 订单撤销或者市价单剩余部分撤销,释放冻结的保证金和可平仓数量
+        """
+        c = self._settlement_currency
+        frozen = self._frozen.pop(o.order_no, None)
+        if frozen:
+            self._ledger.locked[c] -= frozen[2]
+            self._ledger.free[c] += frozen[2]
+        remain_t = round(o.remain * self._size_scale)
+        if o.trade_type == TRADE_TYPE_SELL_CLOSE:
+            self._long_avail_t += remain_t
+        elif o.trade_type == TRADE_TYPE_BUY_CLOSE:
+            self._short_avail_t += remain_t
 
     async def create_order(self, action, price, quantity, order_type=ORDER_TYPE_LIMIT):
         """ 下单
         """
-        return None, None
+        if not self._depth.ready and self._reference_price() is None:
+            return None, "无法创建订单"
+        #交易类型
+        if self._one_way:
+            if quantity <= 0:
+                return None, "无法创建订单,下单数量必须大于0"
+            trade_type = TRADE_TYPE_NONE
+        elif quantity > 0:
+            trade_type = TRADE_TYPE_BUY_OPEN if action == ORDER_ACTION_BUY else TRADE_TYPE_SELL_CLOSE
+        elif quantity < 0:
+            trade_type = TRADE_TYPE_BUY_CLOSE if action == ORDER_ACTION_BUY else TRADE_TYPE_SELL_OPEN
+        else:
+            return None, "无法创建订单,下单数量错误"
+        quantity = abs(quantity)
+        #输入参数验证
+        if order_type == ORDER_TYPE_MARKET:
+            if price:
+                return None, "无法创建订单,市价单价格必须填0"
+        elif order_type == ORDER_TYPE_LIMIT:
+            if price <= 0:
+                return None, "无法创建订单,价格必须大于0"
+            if not self.precision_verify(price, self._price_tick):
+                return None, "无法创建订单,价格精度错误"
+        else:
+            raise NotImplementedError
+        if quantity < self._size_limit:
+            return None, "无法创建订单,下单数量太少"
+        if not self.precision_verify(quantity, self._size_tick):
+            return None, "无法创建订单,下单数量精度错误"
+        qty_t = round(quantity * self._size_scale)
+        #可平仓数量和保证金检查
+        if trade_type == TRADE_TYPE_SELL_CLOSE and qty_t > self._long_avail_t:
+            return None, "可平仓数量不足"
+        if trade_type == TRADE_TYPE_BUY_CLOSE and qty_t > self._short_avail_t:
+            return None, "可平仓数量不足"
+        if trade_type in (TRADE_TYPE_BUY_OPEN, TRADE_TYPE_SELL_OPEN):
+            open_t = qty_t
+        elif trade_type == TRADE_TYPE_NONE:
+            open_t = max(0, qty_t - (self._short_t if action == ORDER_ACTION_BUY else self._long_t))
+        else:
+            open_t = 0
+        opposite = ORDER_ACTION_SELL if action == ORDER_ACTION_BUY else ORDER_ACTION_BUY
+        if order_type == ORDER_TYPE_LIMIT:
+            est_price = price
+        elif self._depth.ready:
+            est_price = self._depth.best_ask if action == ORDER_ACTION_BUY else self._depth.best_bid
+        else:
+            est_price = self._reference_price()
+        if not est_price:
+            return None, "无法创建订单,对手盘没有足够挂单"
+        c = self._settlement_currency
+        margin = round(self._value(open_t, est_price)/self._leverage*self._ledger.scale[c])
+        if margin > self._ledger.free[c]:
+            return None, "账户余额不够"
+        #主动成交部分
+        limit = price if order_type == ORDER_TYPE_LIMIT else None
+        fills, _, _ = self._take(opposite, limit, qty_t)
+        if order_type == ORDER_TYPE_MARKET and not fills:
+            return None, "无法创建订单,对手盘没有足够挂单"
+        #获取当前时间
+        ts = ModelAPI.current_milli_timestamp()
+        #订单通知
+        order_no = self.next_order_no()
+        o = {
+            "platform": self._platform,
+            "account": self._account,
+            "strategy": self._strategy,
+            "order_no": order_no,
+            "action": action,
+            "symbol": self._symbol,
+            "price": self._price(round(price * self._price_scale)),
+            "quantity": self._size(qty_t),
+            "remain": self._size(qty_t),
+            "status": ORDER_STATUS_SUBMITTED,
+            "order_type": order_type,
+            "trade_type": trade_type,
+            "ctime": ts,
+            "utime": ts
+        }
+        order = Order(**o)
+        #冻结可平仓数量和开仓保证金
+        if trade_type == TRADE_TYPE_SELL_CLOSE:
+            self._long_avail_t -= qty_t
+        elif trade_type == TRADE_TYPE_BUY_CLOSE:
+            self._short_avail_t -= qty_t
+        if open_t > 0:
+            self._frozen[order_no] = [margin/open_t, open_t, margin]
+            self._ledger.locked[c] += margin
+            self._ledger.free[c] -= margin
+        remain_t = qty_t
+        for p_t, v_t in fills:
+            remain_t -= v_t
+            order.remain = self._size(remain_t)
+            order.status = ORDER_STATUS_FILLED if remain_t <= 0 else ORDER_STATUS_PARTIAL_FILLED
+            if self.cb.on_order_update_callback:
+                await self.cb.on_order_update_callback(order)
+            await self._settle(order, p_t, v_t, LIQUIDITY_TYPE_TAKER, False)
+        if remain_t > 0:
+            if order_type == ORDER_TYPE_LIMIT:
+                #剩余部分进入订单簿,排在当前这个价格上已有挂单的后面
+                ahead = self._depth.size_at(action, order.price) if self._depth.ready else 0
+                self._resting.add(order, float("inf") if ahead is None else ahead)
+            else:
+                #市价单剩余部分撤销
+                order.status = ORDER_STATUS_CANCELED
+                self._release(order)
+            if not fills or order.status == ORDER_STATUS_CANCELED:
+                if self.cb.on_order_update_callback:
+                    await self.cb.on_order_update_callback(order)
+                self._sync_position(ts)
+                await self._notify_account(ts)
+        return order_no, None
+
+    async def _revoke(self, order_no):
+        """ 撤销一个挂单
+        """
+        o = self._resting.remove(order_no)
+        if not o:
+            return False
+        ts = ModelAPI.current_milli_timestamp()
+        o.status = ORDER_STATUS_CANCELED
+        o.utime = ts
+        self._release(o)
+        if self.cb.on_order_update_callback:
+            await self.cb.on_order_update_callback(o)
+        self._sync_position(ts)
+        await self._notify_account(ts)
+        return True
 
     async def revoke_order(self, *order_nos):
         """ 撤单
         """
-        return [], None
+        #如果传入order_nos为空，即撤销全部委托单
+        if len(order_nos) == 0:
+            order_nos = [o.order_no for o in self._orders.values()]
+            if not order_nos:
+                return [], None
+        #如果传入order_nos为一个委托单号，那么只撤销一个委托单
+        if len(order_nos) == 1:
+            if await self._revoke(order_nos[0]):
+                return order_nos[0], None
+            else:
+                return order_nos[0], "没有找到指定订单"
+        #如果传入order_nos数量大于1，那么就批量撤销传入的委托单
+        result = []
+        for oid in order_nos:
+            if await self._revoke(oid):
+                result.append((oid, None))
+            else:
+                result.append((oid, "没有找到指定订单"))
+        return result, None
 
     async def get_orders(self):
         """ 获取挂单列表
         """
-        return [], None
+        return list(self._orders.values()), None
 
     async def get_position(self):
         """ 获取当前仓位
         """
-        return None, None
-
-    async def get_symbol_info(self):
-        """ 获取符号信息
-        """
-        info = config.backtest["feature"][self._platform]["syminfo"][self._symbol]
-        price_tick = info["price_tick"]
-        size_tick = info["size_tick"]
-        size_limit = info["size_limit"]
-        value_tick = info["value_tick"]
-        value_limit = info["value_limit"]
-        base_currency = info["base_currency"]
-        quote_currency = info["quote_currency"]
-        settlement_currency = info["settlement_currency"]
-        syminfo = SymbolInfo(self._platform, self._symbol, price_tick, size_tick, size_limit, value_tick, value_limit, base_currency, quote_currency, settlement_currency)
-        return syminfo, None
+        return self._position, None
 
     async def invalid_indicate(self, indicate_type):
         """ 强制刷新指定回调函数
@@ -219,187 +777,104 @@ class SimpleSpotMatchEngine(BaseMatchEngine):
     def __init__(self, symbol, trader, **kwargs):
         """Initialize."""
         super(SimpleSpotMatchEngine, self).__init__(symbol, trader, **kwargs)
-        self.cb = kwargs["cb"]
-        self._platform = kwargs.get("databind")
-        self._strategy = kwargs.get("strategy")
-        self._account = kwargs.get("account")
-        self._symbol = symbol #绑定的交易对符号
-        self._trader = trader
-        self._orders = dict() #订单列表,模拟订单薄
-        self._last_kline = None
-
-    async def on_kline_update_callback(self, kline: Kline):
-        """ K线方式驱动回测引擎
-        """
-        self._last_kline = kline #保存最新一根K线
-        await self.make_trade() #尝试和订单列表中的订单进行撮合成交
+        #'货'按size_tick记账,'钱'按value_tick记账
+        self._ledger.add_unit(self._base_currency, self._size_tick)
+        self._ledger.add_unit(self._settlement_currency, self._value_tick)
+        self._frozen = {} #挂单锁定的资产(买单锁定'钱',卖单锁定'货') {order_no: 还锁定着的数量}
 
-    async def on_orderbook_update_callback(self, orderbook: Orderbook):
-        """ 订单薄方式驱动回测引擎
+    def _unfreeze(self, o, amount):
+        """ 挂单成交时从订单锁定的资产中释放amount,订单完成时全部释放,返回实际释放的数量
         """
-        pass
+        frozen = self._frozen.get(o.order_no, 0)
+        if o.remain <= 0:
+            self._frozen.pop(o.order_no, None)
+            return frozen
+        amount = min(amount, frozen)
+        self._frozen[o.order_no] = frozen - amount
+        return amount
 
-    async def on_trade_update_callback(self, trade: Trade):
-        """ 市场成交方式驱动回测引擎
-        """
-        pass
+    async def _settle(self, o, price_t, vol_t, liquidity, locked):
+        """ 成交通知和账户资产结算
 
-    async def make_trade(self):
-        """ 尝试和订单列表中的订单进行撮合成交
+        Args:
+            o: 订单
+            price_t: 成交价格档位
+            vol_t: 成交数量档位
+            liquidity: maker成交还是taker成交
+            locked: 订单是否是挂单,挂单成交时需要释放挂单占用的资产
         """
-        #遍历订单簿里面所有挂单
-        os = copy.copy(self._orders)
-        for (k, o) in os.items():
-            syminfo = config.backtest["feature"][self._platform]["syminfo"][self._symbol]
-            price_tick = syminfo["price_tick"]   #价格变动最小精度
-            size_tick = syminfo["size_tick"]     #下单数量变动最小精度
-            value_tick = syminfo["value_tick"]   #下单金额变动最小精度
-            base_currency = syminfo["base_currency"] #基础币种,交易标的,或者说就是'货'
-            settlement_currency = syminfo["settlement_currency"] #结算币种,或者说就是'钱'
-            bc = self._trader._assets[base_currency]
-            sc = self._trader._assets[settlement_currency]
-
-            if o.action == ORDER_ACTION_BUY: #买单
-                if o.price >= self._last_kline.close_avg_fillna: #当前价格可以成交
-                    ts = ModelAPI.current_milli_timestamp()
-                    #收盘均价模拟成交价
-                    tradeprice = tools.nearest(self._last_kline.close_avg_fillna, price_tick)
-                    tradevolmue = o.quantity #直接模拟全部成交
-                    trademoney = tradeprice*tradevolmue #成交金额
-                    #对于现货交易,手续费是从接收币种里面扣除
-                    fee = tradevolmue*self.maker_commission_rate
-                    #订单通知
-                    o.remain = 0
-                    o.status = ORDER_STATUS_FILLED
-                    o.utime = ts
-                    if self.cb.on_order_update_callback:
-                        await self.cb.on_order_update_callback(o)
-                    #成交通知
-                    fill_no = self.next_fill_no()
-                    f = {
-                        "platform": self._platform,
-                        "account": self._account,
-                        "strategy": self._strategy,
-                        "fill_no": fill_no,
-                        "order_no": o.order_no,
-                        "side": o.action, #成交方向,买还是卖
-                        "symbol": self._symbol,
-                        "price": tools.nearest(tradeprice, price_tick), #成交价格
-                        "quantity": tools.nearest(tradevolmue, size_tick), #成交数量
-                        "liquidity": LIQUIDITY_TYPE_MAKER, #maker成交还是taker成交
-                        "fee": tools.nearest(fee, size_tick),
-                        "ctime": ts
-                    }
-                    fill = Fill(**f)
-                    if self.cb.on_fill_update_callback:
-                        await self.cb.on_fill_update_callback(fill)
-                    #账户资产通知
-                    #'货'增加
-                    bc['free'] += (tradevolmue-fee)
-                    bc['free'] = tools.nearest(bc['free'], size_tick)
-                    bc['total'] = bc['free'] + bc['locked']
-                    bc['total'] = tools.nearest(bc['total'], size_tick)
-                    #释放挂单占用的'钱'
-                    sc['locked'] -= o.quantity*o.price
-                    sc['locked'] = tools.nearest(sc['locked'], value_tick)
-                    sc['free'] = sc['total'] - sc['locked']
-                    #'钱'减少
-                    sc['free'] -= trademoney
-                    sc['free'] = tools.nearest(sc['free'], value_tick)
-                    sc['total'] = sc['free'] + sc['locked']
-                    sc['total'] = tools.nearest(sc['total'], value_tick)
-                    #
-                    ast = Asset(self._platform, self._account, self._trader._assets, ts, True)
-                    if self.cb.on_asset_update_callback:
-                        await self.cb.on_asset_update_callback(ast)
-                    #删除订单簿中的订单
-                    del self._orders[o.order_no]
-            elif o.action == ORDER_ACTION_SELL: #卖单
-                if o.price <= self._last_kline.close_avg_fillna: #当前价格可以成交
-                    ts = ModelAPI.current_milli_timestamp()
-                    #收盘均价模拟成交价
-                    tradeprice = tools.nearest(self._last_kline.close_avg_fillna, price_tick)
-                    trademoney = o.quantity*tradeprice #模拟全部成交
-                    #对于现货交易,手续费是从接收币种里面扣除
-                    fee = trademoney*self.maker_commission_rate
-                    trademoney -= fee
-                    #订单通知
-                    o.remain = 0
-                    o.status = ORDER_STATUS_FILLED
-                    o.utime = ts
-                    if self.cb.on_order_update_callback:
-                        await self.cb.on_order_update_callback(o)
-                    #成交通知
-                    fill_no = self.next_fill_no()
-                    f = {
-                        "platform": self._platform,
-                        "account": self._account,
-                        "strategy": self._strategy,
-                        "fill_no": fill_no,
-                        "order_no": o.order_no,
-                        "side": o.action, #成交方向,买还是卖
-                        "symbol": self._symbol,
-                        "price": tools.nearest(tradeprice, price_tick), #成交价格
-                        "quantity": tools.nearest(o.quantity, size_tick), #成交数量
-                        "liquidity": LIQUIDITY_TYPE_MAKER, #maker成交还是taker成交
-                        "fee": tools.nearest(fee, value_tick),
-                        "ctime": ts
-                    }
-                    fill = Fill(**f)
-                    if self.cb.on_fill_update_callback:
-                        await self.cb.on_fill_update_callback(fill)
-                    #账户资产通知
-                    #释放挂单占用的'货'
-                    bc['locked'] -= o.quantity
-                    bc['locked'] = tools.nearest(bc['locked'], size_tick)
-                    bc['free'] = bc['total'] - bc['locked']
-                    #'货'减少
-                    bc['free'] -= o.quantity
-                    bc['free'] = tools.nearest(bc['free'], size_tick)
-                    bc['total'] = bc['free'] + bc['locked']
-                    bc['total'] = tools.nearest(bc['total'], size_tick)
-                    #'钱'增加
-                    sc['free'] += trademoney
-                    sc['free'] = tools.nearest(sc['free'], value_tick)
-                    sc['total'] = sc['free'] + sc['locked']
-                    sc['total'] = tools.nearest(sc['total'], value_tick)
-                    #
-                    ast = Asset(self._platform, self._account, self._trader._assets, ts, True)
-                    if self.cb.on_asset_update_callback:
-                        await self.cb.on_asset_update_callback(ast)
-                    #删除订单簿中的订单
-                    del self._orders[o.order_no]
-
-    def precision_verify(self, src:float, t:float):
-        #src和t不能超出浮点数有效精度范围
-        #t为0代表不检测,直接返回True
-        if not t or Decimal(str(src))%Decimal(str(t)) == 0:
-            return True
+        ledger = self._ledger
+        bc = self._base_currency
+        sc = self._settlement_currency
+        rate = self.maker_commission_rate if liquidity == LIQUIDITY_TYPE_MAKER else self.taker_commission_rate
+        ts = ModelAPI.current_milli_timestamp()
+        qty = vol_t * self._size_tick * ledger.scale[bc] #成交数量,'货'的记账单位
+        money = self._money(price_t, vol_t) #成交金额,'钱'的记账单位
+        #对于现货交易,手续费是从接收币种里面扣除
+        if o.action == ORDER_ACTION_BUY:
+            fee = round(qty*rate)
+            fee_currency = bc
         else:
-            return False
-
-    def market_buy_order_cross(self, money, price, size_tick):
-        shares = int(1/size_tick) #按最小量分成N份
-        p = price/shares #每一份最小量的价格
-        cnt = money//p #地板除法取整数,一共可买多少份‘最小值’
-        tradevolmue = size_tick*cnt #成交量
-        left = money - tradevolmue*price #还剩多少钱
-        return tradevolmue, left
+            fee = round(money*rate)
+            fee_currency = sc
+        #成交通知
+        fill_no = self.next_fill_no()
+        f = {
+            "platform": self._platform,
+            "account": self._account,
+            "strategy": self._strategy,
+            "fill_no": fill_no,
+            "order_no": o.order_no,
+            "side": o.action, #成交方向,买还是卖
+            "symbol": self._symbol,
+            "price": self._price(price_t), #成交价格
+            "quantity": self._size(vol_t), #成交数量
+            "liquidity": liquidity, #maker成交还是taker成交
+            "fee": ledger.to_float(fee_currency, fee),
+            "ctime": ts
+        }
+        fill = Fill(**f)
+        if self.cb.on_fill_update_callback:
+            await self.cb.on_fill_update_callback(fill)
+        #账户资产结算
+        if o.action == ORDER_ACTION_BUY:
+            #'货'增加
+            ledger.free[bc] += round(qty) - fee
+            if locked:
+                #释放挂单占用的'钱'
+                release = self._unfreeze(o, round(self._money(round(o.price * self._price_scale), vol_t)))
+                ledger.locked[sc] -= release
+                ledger.free[sc] += release
+            #'钱'减少
+            ledger.free[sc] -= round(money)
+        else:
+            #'货'减少,挂单成交时从挂单占用的'货'里面扣除
+            if locked:
+                release = self._unfreeze(o, round(qty))
+                ledger.locked[bc] -= release
+                ledger.free[bc] += release - round(qty)
+            else:
+                ledger.free[bc] -= round(qty)
+            #'钱'增加
+            ledger.free[sc] += round(money - money*rate)
+        #账户资产通知
+        await self._notify_asset(ts, bc, sc)
 
     async def create_order(self, action, price, quantity, order_type=ORDER_TYPE_LIMIT):
         """ 下单
+
+        能成交的部分按对手盘档位(没有订单薄时按参考价格)taker成交,限价单剩余部分挂单并锁定资产,市价单剩余部分撤销.
         """
-        if not self._last_kline or not self._last_kline.usable:
+        if not self._depth.ready and self._reference_price() is None:
             return None, "无法创建订单"
         #获取符号相关信息
-        syminfo = config.backtest["feature"][self._platform]["syminfo"][self._symbol]
-        price_tick = syminfo["price_tick"]   #价格变动最小精度
-        size_tick = syminfo["size_tick"]     #下单数量变动最小精度
-        size_limit = syminfo["size_limit"]   #下单数量最小限制
-        value_tick = syminfo["value_tick"]   #下单金额变动最小精度
-        value_limit = syminfo["value_limit"] #下单金额最小限制
-        base_currency = syminfo["base_currency"] #基础币种,交易标的,或者说就是'货'
-        settlement_currency = syminfo["settlement_currency"] #结算币种,或者说就是'钱'
+        size_tick = self._size_tick
+        size_limit = self._size_limit
+        value_tick = self._value_tick
+        value_limit = self._value_limit
+        ledger = self._ledger
+        bc = self._base_currency
+        sc = self._settlement_currency
         #输入参数验证
         if order_type == ORDER_TYPE_MARKET:
             if price:
@@ -415,367 +890,129 @@ class SimpleSpotMatchEngine(BaseMatchEngine):
                     return None, "无法创建订单,下单数量太少"
                 if not self.precision_verify(quantity, size_tick):
                     return None, "无法创建订单,下单数量精度错误"
-        else:
+        elif order_type == ORDER_TYPE_LIMIT:
             if price <= 0:
                 return None, "无法创建订单,价格必须大于0"
-            if not self.precision_verify(price, price_tick):
+            if not self.precision_verify(price, self._price_tick):
                 return None, "无法创建订单,价格精度错误"
             if quantity < size_limit:
                 return None, "无法创建订单,下单数量太少"
             if not self.precision_verify(quantity, size_tick):
                 return None, "无法创建订单,下单数量精度错误"
-        #获取当前时间
-        ts = ModelAPI.current_milli_timestamp()
-        #
-        if order_type == ORDER_TYPE_MARKET: #市价单
-            if action == ORDER_ACTION_BUY: #买
-                bc = self._trader._assets[base_currency]
-                sc = self._trader._assets[settlement_currency]
-                if quantity > sc['free']:
-                    return None, "账户余额不够"
-                #收盘均价模拟成交价
-                tradeprice = tools.nearest(self._last_kline.close_avg_fillna, price_tick)
-                #市价买单quantity指的是'钱',逼真模拟
-                tradevolmue, left_money = self.market_buy_order_cross(quantity, tradeprice, size_tick)
+        else:
+            raise NotImplementedError
+        opposite = ORDER_ACTION_SELL if action == ORDER_ACTION_BUY else ORDER_ACTION_BUY
+        #主动成交部分
+        if order_type == ORDER_TYPE_MARKET:
+            if action == ORDER_ACTION_BUY:
                 #市价买单quantity指的是'钱'
-                #tradevolmue = quantity/tradeprice
-                #对于现货交易,手续费是从接收币种里面扣除
-                fee = tradevolmue*self.taker_commission_rate
-                #订单通知
-                order_no = self.next_order_no()
-                o = {
-                    "platform": self._platform,
-                    "account": self._account,
-                    "strategy": self._strategy,
-                    "order_no": order_no,
-                    "action": action,
-                    "symbol": self._symbol,
-                    "price": 0,
-                    "quantity": tools.nearest(quantity, value_tick),
-                    "remain": tools.nearest(left_money, value_tick),
-                    "status": ORDER_STATUS_FILLED,
-                    "order_type": order_type,
-                    "ctime": ts,
-                    "utime": ts
-                    #avg_price
-                    #trade_type
-                }
-                order = Order(**o)
-                if self.cb.on_order_update_callback:
-                    await self.cb.on_order_update_callback(order)
-                #成交通知
-                fill_no = self.next_fill_no()
-                f = {
-                    "platform": self._platform,
-                    "account": self._account,
-                    "strategy": self._strategy,
-                    "fill_no": fill_no,
-                    "order_no": order_no,
-                    "side": action, #成交方向,买还是卖
-                    "symbol": self._symbol,
-                    "price": tools.nearest(tradeprice, price_tick), #成交价格
-                    "quantity": tools.nearest(tradevolmue, size_tick), #成交数量
-                    "liquidity": LIQUIDITY_TYPE_TAKER, #maker成交还是taker成交
-                    "fee": tools.nearest(fee, size_tick),
-                    "ctime": ts
-                }
-                fill = Fill(**f)
-                if self.cb.on_fill_update_callback:
-                    await self.cb.on_fill_update_callback(fill)
-                #账户资产通知
-                #'货'增加
-                bc['free'] += (tradevolmue-fee)
-                bc['free'] = tools.nearest(bc['free'], size_tick)
-                bc['total'] = bc['free'] + bc['locked']
-                bc['total'] = tools.nearest(bc['total'], size_tick)
-                #'钱'减少
-                sc['free'] -= quantity #市价买单quantity指的是'钱'
-                sc['free'] = tools.nearest(sc['free'], value_tick)
-                sc['total'] = sc['free'] + sc['locked']
-                sc['total'] = tools.nearest(sc['total'], value_tick)
-                #
-                ast = Asset(self._platform, self._account, self._trader._assets, ts, True)
-                if self.cb.on_asset_update_callback:
-                    await self.cb.on_asset_update_callback(ast)
-            elif action == ORDER_ACTION_SELL: #卖
-                bc = self._trader._assets[base_currency]
-                sc = self._trader._assets[settlement_currency]
-                if quantity > bc['free']:
+                money_t = round(quantity * ledger.scale[sc])
+                if money_t > ledger.free[sc]:
+                    return None, "账户余额不够"
+                fills, left, exhausted = self._take(opposite, money_t=money_t)
+                quantity = ledger.to_float(sc, money_t)
+                remain = ledger.to_float(sc, left)
+            else:
+                qty_t = round(quantity * self._size_scale)
+                if round(qty_t * size_tick * ledger.scale[bc]) > ledger.free[bc]:
                     return None, "账户币不足"
-                #收盘均价模拟成交价
-                tradeprice = tools.nearest(self._last_kline.close_avg_fillna, price_tick)
-                trademoney = quantity*tradeprice
-                #对于现货交易,手续费是从接收币种里面扣除
-                fee = trademoney*self.taker_commission_rate
-                trademoney -= fee
-                #订单通知
-                order_no = self.next_order_no()
-                o = {
-                    "platform": self._platform,
-                    "account": self._account,
-                    "strategy": self._strategy,
-                    "order_no": order_no,
-                    "action": action,
-                    "symbol": self._symbol,
-                    "price": 0,
-                    "quantity": tools.nearest(quantity, size_tick),
-                    "remain": 0,
-                    "status": ORDER_STATUS_FILLED,
-                    "order_type": order_type,
-                    "ctime": ts,
-                    "utime": ts
-                    #avg_price
-                    #trade_type
-                }
-                order = Order(**o)
-                if self.cb.on_order_update_callback:
-                    await self.cb.on_order_update_callback(order)
-                #成交通知
-                fill_no = self.next_fill_no()
-                f = {
-                    "platform": self._platform,
-                    "account": self._account,
-                    "strategy": self._strategy,
-                    "fill_no": fill_no,
-                    "order_no": order_no,
-                    "side": action, #成交方向,买还是卖
-                    "symbol": self._symbol,
-                    "price": tools.nearest(tradeprice, price_tick), #成交价格
-                    "quantity": tools.nearest(quantity, size_tick), #成交数量
-                    "liquidity": LIQUIDITY_TYPE_TAKER, #maker成交还是taker成交
-                    "fee": tools.nearest(fee, value_tick),
-                    "ctime": ts
-                }
-                fill = Fill(**f)
-                if self.cb.on_fill_update_callback:
-                    await self.cb.on_fill_update_callback(fill)
-                #账户资产通知
-                #'货'减少
-                bc['free'] -= quantity
-                bc['free'] = tools.nearest(bc['free'], size_tick)
-                bc['total'] = bc['free'] + bc['locked']
-                bc['total'] = tools.nearest(bc['total'], size_tick)
-                #'钱'增加
-                sc['free'] += trademoney
-                sc['free'] = tools.nearest(sc['free'], value_tick)
-                sc['total'] = sc['free'] + sc['locked']
-                sc['total'] = tools.nearest(sc['total'], value_tick)
-                #
-                ast = Asset(self._platform, self._account, self._trader._assets, ts, True)
-                if self.cb.on_asset_update_callback:
-                    await self.cb.on_asset_update_callback(ast)
-        elif order_type == ORDER_TYPE_LIMIT: #限价单
-            if action == ORDER_ACTION_BUY: #买
-                bc = self._trader._assets[base_currency]
-                sc = self._trader._assets[settlement_currency]
-                if quantity*price > sc['free']:
+                fills, left, exhausted = self._take(opposite, quantity_t=qty_t)
+                quantity = self._size(qty_t)
+                remain = self._size(left)
+            if not fills:
+                return None, "无法创建订单,对手盘没有足够挂单"
+            price_t = 0
+            status = ORDER_STATUS_CANCELED if exhausted else ORDER_STATUS_FILLED #对手盘吃完后剩余部分撤销
+        else:
+            price_t = round(price * self._price_scale)
+            qty_t = round(quantity * self._size_scale)
+            if action == ORDER_ACTION_BUY:
+                if round(self._money(price_t, qty_t)) > ledger.free[sc]:
                     return None, "账户余额不够"
-                #如果下单价格小于当前价格,那意味着无法成交,订单将进入订单薄挂着
-                if price < self._last_kline.close_avg_fillna:
-                    #订单通知
-                    order_no = self.next_order_no()
-                    o = {
-                        "platform": self._platform,
-                        "account": self._account,
-                        "strategy": self._strategy,
-                        "order_no": order_no,
-                        "action": action,
-                        "symbol": self._symbol,
-                        "price": tools.nearest(price, price_tick),
-                        "quantity": tools.nearest(quantity, size_tick),
-                        "remain": tools.nearest(quantity, size_tick),
-                        "status": ORDER_STATUS_SUBMITTED,
-                        "order_type": order_type,
-                        "ctime": ts,
-                        "utime": ts
-                        #avg_price
-                        #trade_type
-                    }
-                    order = Order(**o)
-                    self._orders[order_no] = order #进入订单簿
-                    if self.cb.on_order_update_callback:
-                        await self.cb.on_order_update_callback(order)
-                    #账户资产通知
-                    #'钱'需要被锁定一部分
-                    sc['locked'] += quantity*price #挂单部分所占用的资金需要被锁定
-                    sc['locked'] = tools.nearest(sc['locked'], value_tick)
-                    sc['free'] = sc['total'] - sc['locked']
-                    sc['free'] = tools.nearest(sc['free'], value_tick)
-                    #
-                    ast = Asset(self._platform, self._account, self._trader._assets, ts, True)
-                    if self.cb.on_asset_update_callback:
-                        await self.cb.on_asset_update_callback(ast)
-                else: #直接成交
-                    #收盘均价模拟成交价
-                    tradeprice = tools.nearest(self._last_kline.close_avg_fillna, price_tick)
-                    tradevolmue = quantity #直接模拟全部成交
-                    trademoney = tradeprice*tradevolmue #成交金额
-                    #对于现货交易,手续费是从接收币种里面扣除
-                    fee = tradevolmue*self.taker_commission_rate
-                    #订单通知
-                    order_no = self.next_order_no()
-                    o = {
-                        "platform": self._platform,
-                        "account": self._account,
-                        "strategy": self._strategy,
-                        "order_no": order_no,
-                        "action": action,
-                        "symbol": self._symbol,
-                        "price": tools.nearest(price, price_tick),
-                        "quantity": tools.nearest(quantity, size_tick),
-                        "remain": 0,
-                        "status": ORDER_STATUS_FILLED,
-                        "order_type": order_type,
-                        "ctime": ts,
-                        "utime": ts
-                        #avg_price
-                        #trade_type
-                    }
-                    order = Order(**o)
-                    if self.cb.on_order_update_callback:
-                        await self.cb.on_order_update_callback(order)
-                    #成交通知
-                    fill_no = self.next_fill_no()
-                    f = {
-                        "platform": self._platform,
-                        "account": self._account,
-                        "strategy": self._strategy,
-                        "fill_no": fill_no,
-                        "order_no": order_no,
-                        "side": action, #成交方向,买还是卖
-                        "symbol": self._symbol,
-                        "price": tools.nearest(tradeprice, price_tick), #成交价格
-                        "quantity": tools.nearest(tradevolmue, size_tick), #成交数量
-                        "liquidity": LIQUIDITY_TYPE_TAKER, #maker成交还是taker成交
-                        "fee": tools.nearest(fee, size_tick),
-                        "ctime": ts
-                    }
-                    fill = Fill(**f)
-                    if self.cb.on_fill_update_callback:
-                        await self.cb.on_fill_update_callback(fill)
-                    #账户资产通知
-                    #'货'增加
-                    bc['free'] += (tradevolmue-fee)
-                    bc['free'] = tools.nearest(bc['free'], size_tick)
-                    bc['total'] = bc['free'] + bc['locked']
-                    bc['total'] = tools.nearest(bc['total'], size_tick)
-                    #'钱'减少
-                    sc['free'] -= trademoney
-                    sc['free'] = tools.nearest(sc['free'], value_tick)
-                    sc['total'] = sc['free'] + sc['locked']
-                    sc['total'] = tools.nearest(sc['total'], value_tick)
-                    #
-                    ast = Asset(self._platform, self._account, self._trader._assets, ts, True)
-                    if self.cb.on_asset_update_callback:
-                        await self.cb.on_asset_update_callback(ast)
-            elif action == ORDER_ACTION_SELL: #卖
-                bc = self._trader._assets[base_currency]
-                sc = self._trader._assets[settlement_currency]
-                if quantity > bc['free']:
+            else:
+                if round(qty_t * size_tick * ledger.scale[bc]) > ledger.free[bc]:
                     return None, "账户币不足"
-                #如果下单价格大于当前价格,那意味着无法成交,订单将进入订单薄挂着
-                if price > self._last_kline.close_avg_fillna:
-                    #订单通知
-                    order_no = self.next_order_no()
-                    o = {
-                        "platform": self._platform,
-                        "account": self._account,
-                        "strategy": self._strategy,
-                        "order_no": order_no,
-                        "action": action,
-                        "symbol": self._symbol,
-                        "price": tools.nearest(price, price_tick),
-                        "quantity": tools.nearest(quantity, size_tick),
-                        "remain": tools.nearest(quantity, size_tick),
-                        "status": ORDER_STATUS_SUBMITTED,
-                        "order_type": order_type,
-                        "ctime": ts,
-                        "utime": ts
-                        #avg_price
-                        #trade_type
-                    }
-                    order = Order(**o)
-                    self._orders[order_no] = order #进入订单簿
-                    if self.cb.on_order_update_callback:
-                        await self.cb.on_order_update_callback(order)
-                    #账户资产通知
-                    #'货'需要被锁定一部分
-                    bc['locked'] += quantity #挂单部分所占用的'货'需要被锁定
-                    bc['locked'] = tools.nearest(bc['locked'], size_tick)
-                    bc['free'] = bc['total'] - bc['locked']
-                    bc['free'] = tools.nearest(bc['free'], size_tick)
-                    #
-                    ast = Asset(self._platform, self._account, self._trader._assets, ts, True)
-                    if self.cb.on_asset_update_callback:
-                        await self.cb.on_asset_update_callback(ast)
-                else: #直接成交
-                    #收盘均价模拟成交价
-                    tradeprice = tools.nearest(self._last_kline.close_avg_fillna, price_tick)
-                    trademoney = quantity*tradeprice
-                    #对于现货交易,手续费是从接收币种里面扣除
-                    fee = trademoney*self.taker_commission_rate
-                    trademoney -= fee
-                    #订单通知
-                    order_no = self.next_order_no()
-                    o = {
-                        "platform": self._platform,
-                        "account": self._account,
-                        "strategy": self._strategy,
-                        "order_no": order_no,
-                        "action": action,
-                        "symbol": self._symbol,
-                        "price": tools.nearest(price, price_tick),
-                        "quantity": tools.nearest(quantity, size_tick),
-                        "remain": 0,
-                        "status": ORDER_STATUS_FILLED,
-                        "order_type": order_type,
-                        "ctime": ts,
-                        "utime": ts
-                        #avg_price
-                        #trade_type
-                    }
-                    order = Order(**o)
-                    if self.cb.on_order_update_callback:
-                        await self.cb.on_order_update_callback(order)
-                    #成交通知
-                    fill_no = self.next_fill_no()
-                    f = {
-                        "platform": self._platform,
-                        "account": self._account,
-                        "strategy": self._strategy,
-                        "fill_no": fill_no,
-                        "order_no": order_no,
-                        "side": action, #成交方向,买还是卖
-                        "symbol": self._symbol,
-                        "price": tools.nearest(tradeprice, price_tick), #成交价格
-                        "quantity": tools.nearest(quantity, size_tick), #成交数量
-                        "liquidity": LIQUIDITY_TYPE_TAKER, #maker成交还是taker成交
-                        "fee": tools.nearest(fee, value_tick),
-                        "ctime": ts
-                    }
-                    fill = Fill(**f)
-                    if self.cb.on_fill_update_callback:
-                        await self.cb.on_fill_update_callback(fill)
-                    #账户资产通知
-                    #'货'减少
-                    bc['free'] -= quantity
-                    bc['free'] = tools.nearest(bc['free'], size_tick)
-                    bc['total'] = bc['free'] + bc['locked']
-                    bc['total'] = tools.nearest(bc['total'], size_tick)
-                    #'钱'增加
-                    sc['free'] += trademoney
-                    sc['free'] = tools.nearest(sc['free'], value_tick)
-                    sc['total'] = sc['free'] + sc['locked']
-                    sc['total'] = tools.nearest(sc['total'], value_tick)
-                    #
-                    ast = Asset(self._platform, self._account, self._trader._assets, ts, True)
-                    if self.cb.on_asset_update_callback:
-                        await self.cb.on_asset_update_callback(ast)
-        elif order_type == ORDER_TYPE_IOC:
-            raise NotImplementedError
-        #返回订单号
+            fills, left, _ = self._take(opposite, price, qty_t)
+            quantity = remain = self._size(qty_t)
+            status = ORDER_STATUS_SUBMITTED
+        #获取当前时间
+        ts = ModelAPI.current_milli_timestamp()
+        #订单通知
+        order_no = self.next_order_no()
+        o = {
+            "platform": self._platform,
+            "account": self._account,
+            "strategy": self._strategy,
+            "order_no": order_no,
+            "action": action,
+            "symbol": self._symbol,
+            "price": self._price(price_t),
+            "quantity": quantity,
+            "remain": remain,
+            "status": status,
+            "order_type": order_type,
+            "ctime": ts,
+            "utime": ts
+            #avg_price
+            #trade_type
+        }
+        order = Order(**o)
+        if order_type == ORDER_TYPE_MARKET:
+            if self.cb.on_order_update_callback:
+                await self.cb.on_order_update_callback(order)
+            for p_t, v_t in fills:
+                await self._settle(order, p_t, v_t, LIQUIDITY_TYPE_TAKER, False)
+            return order_no, None
+        #限价单能成交的部分
+        remain_t = qty_t
+        for p_t, v_t in fills:
+            remain_t -= v_t
+            order.remain = self._size(remain_t)
+            order.status = ORDER_STATUS_FILLED if remain_t <= 0 else ORDER_STATUS_PARTIAL_FILLED
+            if self.cb.on_order_update_callback:
+                await self.cb.on_order_update_callback(order)
+            await self._settle(order, p_t, v_t, LIQUIDITY_TYPE_TAKER, False)
+        if remain_t <= 0:
+            return order_no, None
+        #剩余部分进入订单簿,排在当前这个价格上已有挂单的后面
+        ahead = self._depth.size_at(action, order.price) if self._depth.ready else 0
+        self._resting.add(order, float("inf") if ahead is None else ahead)
+        if not fills and self.cb.on_order_update_callback:
+            await self.cb.on_order_update_callback(order)
+        #账户资产通知
+        if action == ORDER_ACTION_BUY:
+            #挂单部分所占用的'钱'需要被锁定
+            lock = round(self._money(price_t, remain_t))
+            ledger.locked[sc] += lock
+            ledger.free[sc] -= lock
+            await self._notify_asset(ts, sc)
+        else:
+            #挂单部分所占用的'货'需要被锁定
+            lock = round(remain_t * size_tick * ledger.scale[bc])
+            ledger.locked[bc] += lock
+            ledger.free[bc] -= lock
+            await self._notify_asset(ts, bc)
+        self._frozen[order_no] = lock
         return order_no, None
 
+    async def _revoke(self, order_no):
+        """ 撤销一个挂单,释放锁定的资产
+        """
+        o = self._resting.remove(order_no)
+        if not o:
+            return False
+        ts = ModelAPI.current_milli_timestamp()
+        o.status = ORDER_STATUS_CANCELED
+        o.utime = ts
+        currency = self._settlement_currency if o.action == ORDER_ACTION_BUY else self._base_currency
+        release = self._frozen.pop(order_no, 0)
+        self._ledger.locked[currency] -= release
+        self._ledger.free[currency] += release
+        if self.cb.on_order_update_callback:
+            await self.cb.on_order_update_callback(o)
+        await self._notify_asset(ts, currency)
+        return True
+
     async def revoke_order(self, *order_nos):
         """ 撤单
         """
@@ -786,21 +1023,18 @@ class SimpleSpotMatchEngine(BaseMatchEngine):
                 return [], None
         #如果传入order_nos为一个委托单号，那么只撤销一个委托单
         if len(order_nos) == 1:
-            if self._orders.get(order_nos[0]):
-                del self._orders[order_nos[0]]
+            if await self._revoke(order_nos[0]):
                 return order_nos[0], None
             else:
                 return order_nos[0], "没有找到指定订单"
         #如果传入order_nos数量大于1，那么就批量撤销传入的委托单
-        if len(order_nos) > 1:
-            result = []
-            for oid in order_nos:
-                if self._orders.get(oid):
-                    del self._orders[oid]
-                    result.append((oid, None))
-                else:
-                    result.append((oid, "没有找到指定订单"))
-            return result, None
+        result = []
+        for oid in order_nos:
+            if await self._revoke(oid):
+                result.append((oid, None))
+            else:
+                result.append((oid, "没有找到指定订单"))
+        return result, None
 
     async def get_orders(self):
         """ 获取挂单列表
@@ -812,24 +1046,6 @@ class SimpleSpotMatchEngine(BaseMatchEngine):
         """
         raise NotImplementedError #现货模式不需要此功能
 
-    async def get_symbol_info(self):
-        """ 获取符号信息
-        """
-        info = config.backtest["feature"][self._platform]["syminfo"][self._symbol]
-        price_tick = info["price_tick"]
-        size_tick = info["size_tick"]
-        size_limit = info["size_limit"]
-        value_tick = info["value_tick"]
-        value_limit = info["value_limit"]
-        base_currency = info["base_currency"]
-        quote_currency = info["quote_currency"]
-        settlement_currency = info["settlement_currency"]
-        symbol_type = info["type"]
-        is_inverse = info["is_inverse"] if info.get("is_inverse") else False
-        multiplier = info["contract_size"] if info.get("contract_size") else 1
-        syminfo = SymbolInfo(self._platform, self._symbol, price_tick, size_tick, size_limit, value_tick, value_limit, base_currency, quote_currency, settlement_currency, symbol_type, is_inverse, multiplier)
-        return syminfo, None
-
     async def invalid_indicate(self, indicate_type):
         """ 强制刷新指定回调函数
         """
@@ -860,8 +1076,28 @@ class BacktestTrader(VirtualTrader):
             logger.error(state, caller=self)
             return
 
-        #资产列表
-        self._assets: DefaultDict[str: Dict[str, float]] = defaultdict(lambda: {k: 0.0 for k in {'free', 'locked', 'total'}})
+        #资产账本
+        self._ledger = Ledger()
+
+        #实时业绩指标,每个结算币种一个{结算币种: OnlineMetrics},不同币种的资产不能直接相加
+        #初始资金为结算币种的初始资产,现货交易对基础币种的初始资产按第一个价格计入
+        feature = config.backtest["feature"][self._platform]
+        self.metrics = {}
+        self._metrics_of = {} #{symbol: 所属结算币种的OnlineMetrics}
+        for currency in {feature["syminfo"][sym]["settlement_currency"] for sym in self._symbols}:
+            syminfo = {sym: feature["syminfo"][sym] for sym in self._symbols if feature["syminfo"][sym]["settlement_currency"] == currency}
+            holdings = {}
+            for sym, info in syminfo.items():
+                base = info["base_currency"]
+                if info["type"] == "spot" and base != currency and base not in [syminfo[s]["base_currency"] for s in holdings]:
+                    holdings[sym] = float(feature["asset"].get(base, 0)) #同一个基础币种只计入第一个现货交易对
+            self.metrics[currency] = OnlineMetrics(float(feature["asset"].get(currency, 0)), syminfo, holdings)
+            for sym in syminfo:
+                self._metrics_of[sym] = self.metrics[currency]
+
+        #替换成交回调函数(更新实时业绩指标)
+        self._original_on_fill_update_callback = self.cb.on_fill_update_callback
+        self.cb.on_fill_update_callback = self.on_fill_update_callback
 
         #替换k线回调函数(K线方式驱动回测引擎)
         self._original_on_kline_update_callback = self.cb.on_kline_update_callback
@@ -889,8 +1125,14 @@ class BacktestTrader(VirtualTrader):
             if symtype == "spot": #如果是现货就绑定现货撮合引擎
                 self.match_engine_dict[sym] = SimpleSpotMatchEngine(sym, self, **kwargs)
             elif symtype == "future": #如果是合约就绑定合约撮合引擎
-                #self.match_engine_dict[sym] = SimpleFutureMatchEngine(sym, self, **kwargs)
-                pass
+                self.match_engine_dict[sym] = SimpleFutureMatchEngine(sym, self, **kwargs)
+
+    async def feed(self, block, i):
+        """ 通过历史数据驱动策略进行回测,回放订单薄时撮合引擎直接引用数据块中的档位数组
+        """
+        if block.drive_type == "orderbook" and block.symbol in self.match_engine_dict:
+            self.match_engine_dict[block.symbol].set_depth(block.depth(), i)
+        await super(BacktestTrader, self).feed(block, i)
 
     async def on_kline_update_callback(self, kline: Kline):
         """ K线方式驱动回测引擎
@@ -898,6 +1140,7 @@ class BacktestTrader(VirtualTrader):
         #通过K线所属的交易对,找到对应的撮合引擎,并且驱动它
         match_engine = self.match_engine_dict[kline.symbol]
         await match_engine.on_kline_update_callback(kline)
+        self._metrics_of[kline.symbol].on_price(kline.symbol, match_engine.market_price, kline.timestamp)
         #调用原K线回调函数(上层策略)
         if self._original_on_kline_update_callback:
             await self._original_on_kline_update_callback(kline)
@@ -908,6 +1151,7 @@ class BacktestTrader(VirtualTrader):
         #通过订单薄所属的交易对,找到对应的撮合引擎,并且驱动它
         match_engine = self.match_engine_dict[orderbook.symbol]
         await match_engine.on_orderbook_update_callback(orderbook)
+        self._metrics_of[orderbook.symbol].on_price(orderbook.symbol, match_engine.market_price, orderbook.timestamp)
         #调用原订单薄回调函数(上层策略)
         if self._original_on_orderbook_update_callback:
             await self._original_on_orderbook_update_callback(orderbook)
@@ -918,20 +1162,27 @@ class BacktestTrader(VirtualTrader):
         #通过市场成交所属的交易对,找到对应的撮合引擎,并且驱动它
         match_engine = self.match_engine_dict[trade.symbol]
         await match_engine.on_trade_update_callback(trade)
+        self._metrics_of[trade.symbol].on_price(trade.symbol, match_engine.market_price, trade.timestamp)
         #调用原市场成交回调函数(上层策略)
         if self._original_on_trade_update_callback:
             await self._original_on_trade_update_callback(trade)
 
+    async def on_fill_update_callback(self, fill: Fill):
+        """ 成交通知,先更新实时业绩指标
+        """
+        self._metrics_of[fill.symbol].on_fill(fill)
+        if self._original_on_fill_update_callback:
+            await self._original_on_fill_update_callback(fill)
+
     async def init_asset(self):
         """ 读取回测配置信息中的初始化资产,通知上层策略
         """
         ts = ModelAPI.current_milli_timestamp()
         d = config.backtest["feature"][self._platform]["asset"]
         for (k, v) in d.items():
-            self._assets[k]["free"] = float(v)
-            self._assets[k]["total"] = float(v)
+            self._ledger.deposit(k, float(v))
         #通知上层策略
-        ast = Asset(self._platform, self._account, self._assets, ts, True)
+        ast = Asset(self._platform, self._account, self._ledger.snapshot(), ts, True)
         if self.cb.on_asset_update_callback:
             await self.cb.on_asset_update_callback(ast)
 
@@ -989,7 +1240,7 @@ class BacktestTrader(VirtualTrader):
             error: Error information, otherwise it's None.
         """
         ts = ModelAPI.current_milli_timestamp()
-        ast = Asset(self._platform, self._account, self._assets, ts, True)
+        ast = Asset(self._platform, self._account, self._ledger.snapshot(), ts, True)
         return ast, None
 
     async def get_orders(self, symbol):
@@ -0,0 +1,187 @@
+# -*- coding:utf-8 -*-
+
+"""
+按时间分桶保存的逐笔成交和订单薄数据
+
+Project: alphahunter
+Author: HJQuant
+Description: Asynchronous driven quantitative trading framework
+"""
+
+import numpy as np
+
+from quant.config import config
+from quant.utils.mongo import MongoDB
+
+
+BUCKET_KEY = "bucket_dt" #桶开始时间字段
+BUCKET_SUFFIX = "_bucket" #分桶数据表名后缀
+META_COLLECTION = "t_bucket_meta" #每个分桶数据表用过的最大桶大小 {"name": 分桶数据表名, "interval": 毫秒}
+
+
+class Bucket:
+    """ 分桶数据格式.
+
+    一个文档保存一个时间桶(比如1秒或者1分钟)内的所有记录,每个字段保存为一个数组,数组下标相同的元素属于同一条记录:
+    {"bucket_dt": 桶开始毫秒时间戳, "interval": 桶大小, "n": 记录数, "dt": [...], "tradeprice": [...], ...}
+    分桶数据保存在原来的表名加上"_bucket"后缀的数据表中(比如t_trade_huobi_btcusdt_bucket),只需要在bucket_dt上建立索引.
+    同一个桶可以有多个文档(比如分几次写入),读取时合并在一起并且按dt排序.
+    写入程序在t_bucket_meta表中记录每个分桶数据表用过的最大桶大小,读取时查询条件按这个大小往前放宽,
+    桶大小改变过或者写入程序和读取程序配置不一致时也不会漏掉开始时间之前的桶.
+
+    Args:
+        interval: 桶大小(毫秒)
+        key: 记录的时间字段
+        span: 数据表中最大的桶大小(毫秒),读取时使用,默认和interval相同
+    """
+
+    def __init__(self, interval, key="dt", span=None):
+        """ 初始化
+        """
+        self.interval = interval
+        self.key = key
+        self.span = max(interval, span or 0)
+        self._bucket = None #正在收集的桶开始时间
+        self._docs = []
+
+    @staticmethod
+    def configured(data_type):
+        """ INFRA.bucket_ms中配置的数据类型(trade,orderbook)的桶大小,没有配置(每条记录一个文档)返回None
+        """
+        interval = (config.infra.get("bucket_ms") or {}).get(data_type)
+        if data_type == "kline" or not interval:
+            return None
+        return int(interval)
+
+    @staticmethod
+    async def save_span(name, interval):
+        """ 在t_bucket_meta表中记录分桶数据表name用过的桶大小(只保留最大的),返回错误
+        """
+        _, e = await MongoDB("db_market", META_COLLECTION).update({"name": name}, {"$max": {"interval": interval}}, upsert=True)
+        return e
+
+    @staticmethod
+    async def load_span(name):
+        """ 读取分桶数据表name用过的最大桶大小,没有记录返回None,返回(结果,错误)
+        """
+        doc, e = await MongoDB("db_market", META_COLLECTION).find_one({"name": name})
+        if e:
+            return None, e
+        return (doc or {}).get("interval"), None
+
+    @staticmethod
+    def collection_name(name):
+        """ 分桶数据表名
+        """
+        return name + BUCKET_SUFFIX
+
+    def bucket_of(self, dt):
+        """ 时间所在桶的开始时间
+        """
+        return dt // self.interval * self.interval
+
+    def pack(self, docs):
+        """ 记录列表按桶打包为分桶文档列表,缺少的字段为None
+        """
+        groups = {}
+        for d in docs:
+            groups.setdefault(self.bucket_of(d[self.key]), []).append(d)
+        result = []
+        for bucket, group in groups.items():
+            names = []
+            for d in group:
+                names.extend(k for k in d if k != "_id" and k not in names)
+            doc = {BUCKET_KEY: bucket, "interval": self.interval, "n": len(group)}
+            for name in names:
+                doc[name] = [d.get(name) for d in group]
+            result.append(doc)
+        return result
+
+    def add(self, doc):
+        """ 按时间顺序收集记录,进入新的桶时返回上一个桶打包好的文档列表,否则返回空列表
+        """
+        bucket = self.bucket_of(doc[self.key])
+        result = []
+        if self._bucket is not None and bucket != self._bucket:
+            result = self.pack(self._docs)
+            self._docs = []
+        self._bucket = bucket
+        self._docs.append(doc)
+        return result
+
+    def expire(self, now):
+        """ 当前时间now已经进入新的桶时返回正在收集的桶打包好的文档列表(没有收集完的桶不会再有新记录),否则返回空列表
+        """
+        if self._bucket is None or self.bucket_of(now) <= self._bucket:
+            return []
+        return self.drain()
+
+    def drain(self):
+        """ 返回正在收集的记录打包好的文档列表,清空正在收集的桶
+        """
+        result = self.pack(self._docs)
+        self._docs = []
+        self._bucket = None
+        return result
+
+    def spec(self, begin, end):
+        """ 包含[begin, end)之间记录的桶的查询条件,begin或者end为None表示不限制
+        """
+        q = {}
+        if begin is not None:
+            q["$gt"] = begin - self.span #开始时间在begin之前,但是还没有结束的桶
+        if end is not None:
+            q["$lt"] = end
+        return {BUCKET_KEY: q}
+
+    def projection(self, fields):
+        """ 字段列表转换为读取分桶文档的projection参数,总是读取时间字段,为None时读取全部字段
+        """
+        if not fields:
+            return None
+        p = {"_id": 0}
+        for f in fields:
+            p[f] = 1
+        p[self.key] = 1
+        return p
+
+    def unpack(self, docs, begin, end, fields=None):
+        """ 分桶文档列表解码为[begin, end)之间的记录,按时间排序的列数组{列名: np.ndarray},begin或者end为None表示不限制
+        """
+        names = []
+        for d in docs:
+            names.extend(k for k in d if k not in (BUCKET_KEY, "interval", "n", "_id") and k not in names)
+        if fields:
+            names = [c for c in names if c in fields]
+        columns = {}
+        for name in names:
+            values = []
+            for d in docs:
+                v = d.get(name)
+                values.extend(v if v is not None else [None] * len(d[self.key]))
+            v = np.array(values)
+            if v.dtype == object and any(x is None for x in values):
+                try:
+                    v = np.array([np.nan if x is None else x for x in values], dtype=float)
+                except (TypeError, ValueError):
+                    pass
+            columns[name] = v
+        dts = np.array([t for d in docs for t in d[self.key]], dtype=np.int64)
+        mask = np.ones(len(dts), dtype=bool)
+        if begin is not None:
+            mask &= dts >= begin
+        if end is not None:
+            mask &= dts < end
+        order = np.flatnonzero(mask)
+        order = order[np.argsort(dts[order], kind="stable")]
+        return {c: v[order] for c, v in columns.items()}
+
+    @staticmethod
+    def to_records(columns):
+        """ 列数组转换为记录列表
+        """
+        if not columns:
+            return []
+        names = list(columns)
+        values = [columns[c].tolist() for c in names]
+        return [dict(zip(names, row)) for row in zip(*values)]
@@ -15,7 +15,9 @@ from collections import defaultdict
 from quant import const
 from quant.state import State
 from quant.utils import tools, logger
-from quant.utils.mongo import MongoDB
+from quant.utils.mongo import MongoDB, BulkWriter
+from quant.coverage import Coverage
+from quant.bucket import Bucket
 from quant.config import config
 from quant.market import Market, Kline, Orderbook, Trade, Ticker
 from quant.order import Order, Fill
@@ -30,6 +32,8 @@ from quant.event import EventOrderbook, EventKline, EventTrade, EventTicker
 
 class Collect(Strategy):
 
+    BUCKET_TIMER_INTERVAL = 0.5 #检查桶是否结束的时间间隔(秒)
+
     def __init__(self):
         """ 初始化
         """
@@ -59,24 +63,93 @@ class Collect(Strategy):
             "direct_ticker_update": True
         }
         self.gw = self.create_gateway(**params)
-        #为数据库保存行情做准备
-        self.t_orderbook_map = defaultdict(lambda:None)
-        self.t_trade_map = defaultdict(lambda:None)
-        self.t_kline_map = defaultdict(lambda:None)
-        self.d_orderbook_map = defaultdict(lambda:[])
-        self.d_trade_map = defaultdict(lambda:[])
+        #为数据库保存行情做准备,行情通过BulkWriter在后台批量写入数据库,写入成功后更新数据覆盖索引
+        #INFRA.bucket_ms中配置了桶大小的订单薄和逐笔成交按桶收集,每个桶写入一个文档
+        self.w_orderbook_map = defaultdict(lambda:None)
+        self.w_trade_map = defaultdict(lambda:None)
+        self.w_kline_map = defaultdict(lambda:None)
+        self.b_orderbook_map = defaultdict(lambda:None)
+        self.b_trade_map = defaultdict(lambda:None)
         if config.mongodb:
             for sym in self.symbols:
                 postfix = sym.replace('-','').replace('_','').replace('/','').lower() #将所有可能的情况转换为我们自定义的数据库表名规则
                 #订单薄
                 name = "t_orderbook_{}_{}".format(self.platform, postfix).lower()
-                self.t_orderbook_map[sym] = MongoDB("db_market", name)
+                if Bucket.configured("orderbook"):
+                    self.b_orderbook_map[sym] = Bucket(Bucket.configured("orderbook"), "dt")
+                self.w_orderbook_map[sym] = self.create_writer(name, "dt", self.b_orderbook_map[sym])
                 #逐笔成交
                 name = "t_trade_{}_{}".format(self.platform, postfix).lower()
-                self.t_trade_map[sym] = MongoDB("db_market", name)
+                if Bucket.configured("trade"):
+                    self.b_trade_map[sym] = Bucket(Bucket.configured("trade"), "dt")
+                self.w_trade_map[sym] = self.create_writer(name, "dt", self.b_trade_map[sym])
                 #K线
                 name = "t_kline_{}_{}".format(self.platform, postfix).lower()
-                self.t_kline_map[sym] = MongoDB("db_market", name)
+                self.w_kline_map[sym] = self.create_writer(name, "begin_dt")
+
+        #退出前把写入队列中的行情全部写入数据库
+        from quant.quant import quant
+        quant.register_shutdown(self.close_writers)
+        #定时写入已经结束的桶,不用等下一条记录到来(成交稀少的交易对,自合成K线服务需要及时读到刚过去一分钟的逐笔成交)
+        if any(self.b_orderbook_map.values()) or any(self.b_trade_map.values()):
+            SingleTask.call_later(self._on_bucket_timer, self.BUCKET_TIMER_INTERVAL)
+
+    async def _on_bucket_timer(self):
+        """ 定时检查正在收集的桶是否已经结束
+        """
+        await self.flush_buckets(False)
+        SingleTask.call_later(self._on_bucket_timer, self.BUCKET_TIMER_INTERVAL)
+
+    async def flush_buckets(self, drain):
+        """ 已经结束的桶(drain为True时全部正在收集的桶)放入写入队列并且立即写入数据库
+        """
+        now = tools.get_cur_timestamp_ms()
+        for writers, buckets in ((self.w_orderbook_map, self.b_orderbook_map), (self.w_trade_map, self.b_trade_map)):
+            for sym, bucket in buckets.items():
+                if not bucket:
+                    continue
+                docs = bucket.drain() if drain else bucket.expire(now)
+                if docs and writers[sym]:
+                    await writers[sym].put(docs)
+                    await writers[sym].flush()
+
+    async def close_writers(self):
+        """ 写入正在收集的桶,关闭所有批量写入器,写入队列中剩余的数据
+        """
+        await self.flush_buckets(True)
+        for writer in list(self.w_orderbook_map.values()) + list(self.w_trade_map.values()) + list(self.w_kline_map.values()):
+            if writer:
+                e = await writer.close()
+                if e:
+                    logger.error("close writer:", e, caller=self)
+
+    def create_writer(self, name, key, bucket=None):
+        """ 创建行情数据表的批量写入器,写入成功后按key字段标记数据覆盖索引,分桶格式时写入分桶数据表,并且记录用过的桶大小
+        """
+        coverage = Coverage("db_market", name)
+        if bucket:
+            name = Bucket.collection_name(name)
+        span_saved = [False]
+        async def on_flush(docs, specs):
+            if not bucket:
+                return await coverage.mark([d[key] for d in docs])
+            e = None
+            if not span_saved[0]: #写入失败时下次写入成功后再记录
+                e = await Bucket.save_span(name, bucket.interval)
+                span_saved[0] = not e
+            return await coverage.mark([dt for d in docs for dt in d[key]]) or e
+        return BulkWriter(MongoDB("db_market", name), on_flush=on_flush, **config.mongodb_writer)
+
+    async def save(self, writer, bucket, doc):
+        """ 行情放入写入队列,分桶格式时先按桶收集,进入新的桶时写入上一个桶
+        """
+        if not writer:
+            return
+        if not bucket:
+            await writer.put(doc)
+            return
+        for d in bucket.add(doc):
+            await writer.put(d)
 
     async def on_state_update_callback(self, state: State, **kwargs):
         """ 状态变化(底层交易所接口,框架等)通知回调函数
@@ -97,13 +170,7 @@ class Collect(Strategy):
             "begin_dt": kline.timestamp,
             "end_dt": kline.timestamp+60*1000-1
         }
-        async def save(kwargs):
-            t_kline = self.t_kline_map[kline.symbol]
-            if t_kline:
-                s, e = await t_kline.insert(kwargs)
-                if e:
-                    logger.error("insert kline:", e, caller=self)
-        SingleTask.run(save, kwargs)
+        await self.save(self.w_kline_map[kline.symbol], None, kwargs)
         #发布行情到消息队列
         kwargs = {
             "platform": kline.platform,
@@ -138,23 +205,7 @@ class Collect(Strategy):
             if i > 20: break
         kwargs["pubdt"] = orderbook.timestamp #交易所发布行情的时间
         kwargs["dt"] = tools.get_cur_timestamp_ms() #本地采集行情的时间
-        async def save(kwargs):
-            #一秒内会有多次通知,将一秒内的通知都收集在一起,一次性写入数据库,约一秒写一次,提高数据库性能
-            dlist = self.d_orderbook_map[orderbook.symbol]
-            dlist.append(kwargs)
-            if dlist[len(dlist)-1]["dt"]-dlist[0]["dt"] > 1000: #每秒写一次数据库
-                #因为是异步并发,所以先清空列表,重新收集新的一秒内的所有通知,而不是等待数据库IO完成再清空(python的变量只是对象的引用)
-                #xxx = copy.deepcopy(dlist)
-                #dlist.clear()
-                #insert xxx
-                self.d_orderbook_map[orderbook.symbol] = []
-                #写数据库
-                t_orderbook = self.t_orderbook_map[orderbook.symbol]
-                if t_orderbook:
-                    s, e = await t_orderbook.insert(dlist)
-                    if e:
-                        logger.error("insert orderbook:", e, caller=self)
-        SingleTask.run(save, kwargs)
+        await self.save(self.w_orderbook_map[orderbook.symbol], self.b_orderbook_map[orderbook.symbol], kwargs)
         #发布行情到消息队列
         kwargs = {
             "platform": orderbook.platform,
@@ -177,23 +228,7 @@ class Collect(Strategy):
             "tradedt": trade.timestamp,
             "dt": tools.get_cur_timestamp_ms()
         }
-        async def save(kwargs):
-            #一秒内会有多次通知,将一秒内的通知都收集在一起,一次性写入数据库,约一秒写一次,提高数据库性能
-            dlist = self.d_trade_map[trade.symbol]
-            dlist.append(kwargs)
-            if dlist[len(dlist)-1]["dt"]-dlist[0]["dt"] > 1000: #每秒写一次数据库
-                #因为是异步并发,所以先清空列表,重新收集新的一秒内的所有通知,而不是等待数据库IO完成再清空(python的变量只是对象的引用)
-                #xxx = copy.deepcopy(dlist)
-                #dlist.clear()
-                #insert xxx
-                self.d_trade_map[trade.symbol] = []
-                #写数据库
-                t_trade = self.t_trade_map[trade.symbol]
-                if t_trade:
-                    s, e = await t_trade.insert(dlist)
-                    if e:
-                        logger.error("insert trade:", e, caller=self)
-        SingleTask.run(save, kwargs)
+        await self.save(self.w_trade_map[trade.symbol], self.b_trade_map[trade.symbol], kwargs)
         #发布行情到消息队列
         kwargs = {
             "platform": trade.platform,
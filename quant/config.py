@@ -32,6 +32,9 @@ class Config:
             PROXY: HTTP proxy config, default is None.
             BACKTEST: Strategy backtest config, default is {}.
             DATAMATRIX: Data matrix config, default is {}.
+            INFRA: Historical data infrastructure config (local cache, etc), default is {}.
+            PORTFOLIO: Portfolio manager retention/archive config, default is {}.
+            MONGODB_WRITER: MongoDB bulk writer config, default is {}.
     """
 
     def __init__(self):
@@ -48,6 +51,9 @@ class Config:
         self.proxy = None
         self.backtest = {}
         self.datamatrix = {}
+        self.infra = {}
+        self.portfolio = {}
+        self.mongodb_writer = {}
 
     def register_run_time_update(self):
         """Subscribe EventConfig and that can update config in run-time dynamically."""
@@ -114,6 +120,9 @@ class Config:
         self.proxy = update_fields.get("PROXY", None)
         self.backtest = update_fields.get("BACKTEST", {})
         self.datamatrix = update_fields.get("DATAMATRIX", {})
+        self.infra = update_fields.get("INFRA", {})
+        self.portfolio = update_fields.get("PORTFOLIO", {})
+        self.mongodb_writer = update_fields.get("MONGODB_WRITER", {})
 
         for k, v in update_fields.items():
             setattr(self, k, v)
@@ -0,0 +1,146 @@
+# -*- coding:utf-8 -*-
+
+"""
+数据覆盖索引,记录行情数据表中哪些时间段有数据
+
+Project: alphahunter
+Author: HJQuant
+Description: Asynchronous driven quantitative trading framework
+"""
+
+from quant.utils import tools
+from quant.utils.mongo import MongoDB
+
+
+class Coverage:
+    """ 某个行情数据表的数据覆盖索引.
+
+    索引保存在行情数据表所在数据库的t_coverage表中,每个数据表每天一条记录:
+    {"name": 数据表名, "day": 当天零点(UTC)毫秒时间戳, "hours": 24位掩码,第n位为1表示第n个小时有数据}
+    另外每个已经确认索引完整的时间段一条记录:
+    {"name": 数据表名, "indexed_begin": 开始毫秒时间戳, "indexed_end": 结束毫秒时间戳}
+
+    行情采集程序和数据导入程序写入数据时同时更新掩码,写入失败的掩码保留下来,下次标记时重新写入.
+    只有建立索引程序(build,从数据表中统计实际有数据的小时)和数据导入程序(整个文件导入成功并且掩码全部写入以后)才会写入完整时间段,
+    回测读取历史数据前先查询索引,只有完整时间段内没有标记的小时才认为没有数据,不用查询数据库,
+    其他时间(包括没有任何完整时间段的数据表)都视为"未知",仍然需要查询数据库.
+
+    Args:
+        db: 行情数据表所在数据库
+        name: 行情数据表名
+    """
+
+    COLLECTION = "t_coverage"
+    DAY = 24*60*60*1000
+    HOUR = 60*60*1000
+
+    def __init__(self, db, name):
+        """ 初始化
+        """
+        self._name = name
+        self._t_coverage = MongoDB(db, self.COLLECTION)
+        self._marked = {} #已经写入索引的掩码,避免重复写数据库
+        self._pending = {} #还没有写入成功的掩码 {day: hours}
+        self._days = None #从数据库读取的索引 {day: hours}
+        self._spans = None #从数据库读取的完整时间段 [(begin, end)]
+
+    @classmethod
+    def hour_masks(cls, dts):
+        """ 将毫秒时间戳列表转换为每天的小时掩码 {day: hours}
+        """
+        masks = {}
+        for dt in dts:
+            day = dt // cls.DAY * cls.DAY
+            masks[day] = masks.get(day, 0) | (1 << ((dt - day) // cls.HOUR))
+        return masks
+
+    async def mark(self, dts):
+        """ 标记这些时间所在的小时有数据,失败时返回错误,没有写入的掩码下次标记(或者flush)时重新写入
+        """
+        for day, hours in self.hour_masks(dts).items():
+            hours &= ~self._marked.get(day, 0) #已经标记过的小时
+            if hours:
+                self._pending[day] = self._pending.get(day, 0) | hours
+        return await self.flush()
+
+    async def flush(self):
+        """ 写入还没有写入成功的掩码
+        """
+        for day in sorted(self._pending):
+            hours = self._pending[day]
+            s, e = await self._t_coverage.update({"name": self._name, "day": day}, {"$bit": {"hours": {"or": hours}}}, upsert=True)
+            if e:
+                return e
+            del self._pending[day]
+            self._marked[day] = self._marked.get(day, 0) | hours
+            if self._days is not None:
+                self._days[day] = self._days.get(day, 0) | hours
+
+    async def mark_indexed(self, begin_time, end_time):
+        """ 记录[begin_time, end_time)内的掩码已经完整,调用前这段时间内的数据必须已经全部标记,还有没写入的掩码时返回错误
+        """
+        e = await self.flush()
+        if e:
+            return e
+        s, e = await self._t_coverage.update({"name": self._name, "indexed_begin": begin_time}, {"$max": {"indexed_end": end_time}}, upsert=True)
+        if e:
+            return e
+        if self._spans is not None:
+            self._spans.append((begin_time, end_time))
+
+    async def build(self, source, key, begin_time=None, end_time=None, unwind=False):
+        """ 从行情数据表source中统计[begin_time, end_time)内实际有数据的小时,写入掩码以后记录为完整时间段.
+        begin_time为None时从最早的数据开始,end_time为None时到当前小时开始为止(当前小时可能还在写入),
+        unwind为True时key字段是数组(分桶格式)
+        """
+        if end_time is None:
+            end_time = tools.get_cur_timestamp_ms() // self.HOUR * self.HOUR
+        spec = {"$lt": end_time}
+        if begin_time is not None:
+            spec["$gte"] = begin_time
+        pipeline = [{"$unwind": "$" + key}] if unwind else []
+        pipeline.append({"$match": {key: spec}})
+        pipeline.append({"$group": {"_id": {"$subtract": ["$" + key, {"$mod": ["$" + key, self.HOUR]}]}}})
+        s, e = await source.aggregate(pipeline)
+        if e:
+            return e
+        hours = [d["_id"] for d in s]
+        if begin_time is None:
+            if not hours:
+                return
+            begin_time = min(hours)
+        e = await self.mark(hours)
+        if e:
+            return e
+        return await self.mark_indexed(begin_time, end_time)
+
+    async def load(self):
+        """ 从数据库读取索引
+        """
+        s, e = await self._t_coverage.get_list({"name": self._name}, fields={"day": 1, "hours": 1, "indexed_begin": 1, "indexed_end": 1})
+        if e:
+            return e
+        self._days = {d["day"]: d["hours"] for d in s if "day" in d}
+        self._spans = [(d["indexed_begin"], d["indexed_end"]) for d in s if "indexed_begin" in d]
+
+    def _indexed(self, hour):
+        """ 这个小时是否在完整时间段内
+        """
+        return any(b <= hour and hour + self.HOUR <= e for b, e in self._spans)
+
+    async def has_data(self, begin_time, end_time):
+        """ 时间段[begin_time, end_time)内是否可能有数据,索引读取失败或者无法确定的都返回True
+        """
+        if self._days is None and await self.load():
+            return True
+        if not self._spans:
+            return True
+        hour = begin_time // self.HOUR * self.HOUR
+        while hour < end_time:
+            if not self._indexed(hour): #不在完整时间段内
+                return True
+            day = hour // self.DAY * self.DAY
+            if self._days.get(day, 0) & (1 << ((hour - day) // self.HOUR)):
+                return True
+            hour += self.HOUR
+        return False
@@ -0,0 +1,260 @@
+# -*- coding:utf-8 -*-
+
+"""
+历史行情本地磁盘缓存(按列存储,内存映射读取)
+
+Project: alphahunter
+Author: HJQuant
+Description: Asynchronous driven quantitative trading framework
+"""
+
+import os
+import json
+import time
+import shutil
+import asyncio
+from collections import defaultdict
+
+import numpy as np
+import pandas as pd
+
+from quant.utils import logger
+
+
+class DataCache:
+    """ 历史行情本地磁盘缓存.
+
+    同一段历史数据经常被反复回测,每次都从数据库读取非常浪费时间,所以第一次读取后按
+    (交易所, 交易对, 数据类型, 天)保存到本地磁盘,每列一个定长类型的二进制文件,再次读取时直接np.memmap映射.
+
+    目录结构: {path}/{exchange}/{symbol}/{data_type}/{day}/meta.json, {column}.bin
+    meta.json: {"rows": 记录数, "columns": [[列名, numpy类型], ...]}
+    只缓存已经完整结束的天(UTC),总大小超过size_limit时按最近访问时间淘汰.
+    还没有结束的天,有无法定长存储的列的天和整天数据超过读取内存限制的天不缓存,只从数据库读取需要的时间段.
+    数据导入程序和K线服务重写某天数据时需要调用invalidate删除对应缓存.
+
+    Args:
+        path: 缓存根目录
+        size_limit: 缓存最大占用磁盘字节数
+    """
+
+    DAY = 24*60*60*1000
+    META = "meta.json"
+
+    def __init__(self, path, size_limit):
+        """ 初始化
+        """
+        self._path = path
+        self._size_limit = size_limit
+        self._size = None #当前缓存总大小,第一次写入时统计
+        self._locks = defaultdict(asyncio.Lock) #同一天的数据同时只从数据库读取一次
+        self._uncacheable = set() #有无法定长存储的列的天和太大的天,以后不再读取整天数据
+
+    @classmethod
+    def day_dir(cls, path, exchange, symbol, data_type, day):
+        """ 某天数据的缓存目录
+        """
+        postfix = symbol.replace('-','').replace('_','').replace('/','').lower() #将所有可能的情况转换为我们自定义的数据库表名规则
+        return os.path.join(path, exchange.lower(), postfix, data_type, str(int(day)))
+
+    @classmethod
+    def invalidate(cls, path, exchange, symbol, data_type, day=None):
+        """ 删除缓存,day为None时删除这个交易对这种数据类型的所有缓存,day为某天内的任意毫秒时间戳
+        """
+        if day is None:
+            target = os.path.dirname(cls.day_dir(path, exchange, symbol, data_type, 0))
+        else:
+            target = cls.day_dir(path, exchange, symbol, data_type, day // cls.DAY * cls.DAY)
+        shutil.rmtree(target, ignore_errors=True)
+
+    def read(self, exchange, symbol, data_type, day):
+        """ 读取某天缓存的列数据,没有缓存返回None
+        """
+        d = self.day_dir(self._path, exchange, symbol, data_type, day)
+        meta_file = os.path.join(d, self.META)
+        try:
+            with open(meta_file) as f:
+                meta = json.load(f)
+            rows = meta["rows"]
+            columns = {}
+            for name, dtype in meta["columns"]:
+                if rows == 0:
+                    columns[name] = np.empty(0, dtype=dtype)
+                else:
+                    columns[name] = np.memmap(os.path.join(d, name + ".bin"), dtype=dtype, mode="r", shape=(rows,))
+            os.utime(meta_file) #记录访问时间,淘汰缓存时使用
+            return columns
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.error("read cache error:", d, e, caller=self)
+            return None
+
+    def write(self, exchange, symbol, data_type, day, columns):
+        """ 将某天的列数据写入缓存
+        """
+        d = self.day_dir(self._path, exchange, symbol, data_type, day)
+        tmp = "{}.tmp{}".format(d, os.getpid())
+        try:
+            os.makedirs(tmp, exist_ok=True)
+            meta = {"rows": 0, "columns": []}
+            for name, v in columns.items():
+                v.tofile(os.path.join(tmp, name + ".bin"))
+                meta["rows"] = len(v)
+                meta["columns"].append([name, v.dtype.str])
+            with open(os.path.join(tmp, self.META), "w") as f:
+                json.dump(meta, f)
+            os.rename(tmp, d) #写完整以后再改名,读取方不会看到写了一半的缓存
+        except Exception as e:
+            shutil.rmtree(tmp, ignore_errors=True)
+            if not os.path.isdir(d):
+                logger.error("write cache error:", d, e, caller=self)
+            return
+        if self._size is None:
+            self._size = sum(size for _, _, size in self._scan())
+        else:
+            self._size += sum(v.nbytes for v in columns.values())
+        if self._size > self._size_limit:
+            self._evict()
+
+    def _scan(self):
+        """ 遍历所有缓存的天,返回[(最近访问时间, 目录, 字节数), ...]
+        """
+        result = []
+        for root, dirs, files in os.walk(self._path):
+            if self.META in files:
+                size = sum(os.path.getsize(os.path.join(root, f)) for f in files)
+                result.append((os.path.getmtime(os.path.join(root, self.META)), root, size))
+                dirs.clear()
+        return result
+
+    def _evict(self):
+        """ 按最近访问时间淘汰缓存,直到总大小不超过限制
+        """
+        days = sorted(self._scan())
+        self._size = sum(size for _, _, size in days)
+        for _, d, size in days:
+            if self._size <= self._size_limit:
+                break
+            shutil.rmtree(d, ignore_errors=True)
+            self._size -= size
+
+    @staticmethod
+    def sort_columns(columns, key):
+        """ 数据库读取的列数据按key排序,去掉_id列
+        """
+        columns = {c: v for c, v in columns.items() if c != "_id"}
+        if not columns or len(columns[key]) == 0:
+            return {}
+        order = np.argsort(columns[key], kind="mergesort")
+        return {c: v[order] for c, v in columns.items()}
+
+    @staticmethod
+    def to_columns(columns, key):
+        """ 数据库读取的列数据按key排序并转换为定长类型,有无法定长存储的列时返回None
+        """
+        result = DataCache.sort_columns(columns, key)
+        for c, v in result.items():
+            if v.dtype == object:
+                if not all(isinstance(x, str) for x in v):
+                    return None
+                result[c] = v.astype(str)
+        return result
+
+    async def get_between(self, exchange, symbol, data_type, key, begin_time, end_time, fetch, max_bytes=None):
+        """ 读取[begin_time, end_time)之间的列数据,fetch(begin, end)从数据库按列读取数据.
+        缓存中没有的已经结束的天读取整天数据并缓存,还没有结束的天和无法缓存的天只读取需要的时间段.
+        max_bytes为读取整天数据时最多占用多少内存,超过的天不缓存,为None时不限制.
+
+        Returns:
+            按key排序的列数据,从数据库读取失败时返回None
+        """
+        parts = []
+        now = int(time.time() * 1000)
+        for day in range(begin_time // self.DAY * self.DAY, end_time, self.DAY):
+            name = (exchange, symbol, data_type, day)
+            lo, hi = max(begin_time, day), min(end_time, day + self.DAY)
+            columns = self.read(exchange, symbol, data_type, day)
+            if columns is None and day + self.DAY <= now and name not in self._uncacheable:
+                async with self._locks[name]:
+                    columns = self.read(exchange, symbol, data_type, day)
+                    if columns is None and name not in self._uncacheable:
+                        columns = await self._fill(exchange, symbol, data_type, key, day, lo, hi, fetch, max_bytes)
+                        if columns is None:
+                            return None
+            if columns is None: #还没有结束的天(数据还会增加)或者无法缓存的天,只读取需要的时间段
+                columns = await fetch(lo, hi)
+                if columns is None:
+                    return None
+                columns = self.sort_columns(columns, key)
+            if not columns:
+                continue
+            dt = columns[key]
+            i, j = np.searchsorted(dt, [begin_time, end_time], side="left")
+            if j > i:
+                parts.append({c: v[i:j] for c, v in columns.items()})
+        return self.concat_columns(parts)
+
+    async def _fill(self, exchange, symbol, data_type, key, day, lo, hi, fetch, max_bytes):
+        """ 读取某天的数据并缓存.先读取需要的时间段[lo, hi),按这段的数据密度估计整天数据超过max_bytes时不缓存这天,
+        否则按估计每次不超过max_bytes/4分段读取这天其余的数据,实际累计超过max_bytes时放弃缓存这天.
+
+        Returns:
+            至少包含[lo, hi)的按key排序的列数据,从数据库读取失败时返回None
+        """
+        name = (exchange, symbol, data_type, day)
+        raw = await fetch(lo, hi)
+        if raw is None:
+            return None
+        total = sum(v.nbytes for v in raw.values())
+        if max_bytes and total * self.DAY / (hi - lo) > max_bytes:
+            self._uncacheable.add(name)
+            return self.sort_columns(raw, key)
+        step = self.DAY
+        if max_bytes and total:
+            step = (hi - lo) * max(1, int(max_bytes / 4 / total))
+        parts = []
+        for b, e in ((day, lo), (hi, day + self.DAY)): #需要的时间段前后两部分
+            for t in range(b, e, step):
+                part = await fetch(t, min(t + step, e))
+                if part is None:
+                    return None
+                total += sum(v.nbytes for v in part.values())
+                if max_bytes and total > max_bytes:
+                    self._uncacheable.add(name)
+                    return self.sort_columns(raw, key)
+                parts.append(part)
+            if b == day:
+                parts.append(raw)
+        raw = self.concat_columns(parts)
+        columns = self.to_columns(raw, key)
+        if columns is None:
+            self._uncacheable.add(name)
+            return self.sort_columns(raw, key) #已经读取的整天数据直接使用,不再重复查询
+        self.write(exchange, symbol, data_type, day, columns)
+        return self.read(exchange, symbol, data_type, day) or columns #改为内存映射读取,不在内存中保留整天数据
+
+    @staticmethod
+    def concat_columns(parts):
+        """ 按时间先后合并多段列数据,某段缺少的列用NaN(数值列)或者None补齐
+        """
+        parts = [p for p in parts if p]
+        if not parts:
+            return {}
+        if len(parts) == 1:
+            return parts[0]
+        names = []
+        for p in parts:
+            names.extend(c for c in p if c not in names)
+        result = {}
+        for c in names:
+            kind = next(p[c].dtype.kind for p in parts if c in p)
+            values = []
+            for p in parts:
+                if c in p:
+                    values.append(p[c])
+                else:
+                    n = len(next(iter(p.values())))
+                    values.append(np.full(n, np.nan) if kind in "biuf" else np.full(n, None, dtype=object))
+            result[c] = np.concatenate(values)
+        return result
@@ -0,0 +1,101 @@
+# -*- coding:utf-8 -*-
+
+"""
+回测成交列表(按列存储)
+
+Project: alphahunter
+Author: HJQuant
+Description: Asynchronous driven quantitative trading framework
+"""
+
+import numpy as np
+import pandas as pd
+
+from quant.order import Fill
+
+
+class FillStore:
+    """ 回测过程中的成交列表,每个字段保存在预先分配的numpy数组中,空间不够时按倍数扩容.
+
+    platform,account,symbol,strategy,side,liquidity这些取值很少的字段保存为整数编码,
+    回测结束时直接生成DataFrame交给Analyzer,不需要再经过trades.csv中转.
+    同一个成交(order_no, fill_no)重复通知时覆盖原来的记录,只记录keys中的交易对.
+
+    Args:
+        capacity: 初始容量(条)
+        keys: 需要记录的(platform, account, symbol)集合,为None时全部记录
+    """
+
+    CODED = ("platform", "account", "symbol", "strategy", "side", "liquidity") #整数编码保存的字段
+    OBJECTS = ("order_no", "fill_no")
+    FLOATS = ("price", "quantity", "fee")
+    COLUMNS = ("platform", "account", "symbol", "strategy", "order_no", "fill_no", "price", "quantity", "side", "liquidity", "fee", "ctime") #和Fill的字段顺序相同
+
+    def __init__(self, capacity=65536, keys=None):
+        """ 初始化
+        """
+        self._n = 0
+        self._keys = set(keys) if keys is not None else None
+        self._rows = {} #{(order_no, fill_no): 下标}
+        self._codes = {c: {} for c in self.CODED} #{字段: {取值: 编码}}
+        self._columns = {}
+        for c in self.CODED:
+            self._columns[c] = np.empty(capacity, dtype=np.int32)
+        for c in self.OBJECTS:
+            self._columns[c] = np.empty(capacity, dtype=object)
+        for c in self.FLOATS:
+            self._columns[c] = np.empty(capacity, dtype=np.float64)
+        self._columns["ctime"] = np.empty(capacity, dtype=np.int64)
+
+    def __len__(self):
+        return self._n
+
+    def _grow(self):
+        """ 容量翻倍
+        """
+        for c, v in self._columns.items():
+            w = np.empty(2*len(v), dtype=v.dtype)
+            w[:self._n] = v[:self._n]
+            self._columns[c] = w
+
+    def append(self, fill: Fill):
+        """ 添加一条成交,已经记录过的成交覆盖原来的记录
+        """
+        if self._keys is not None and (fill.platform, fill.account, fill.symbol) not in self._keys:
+            return
+        i = self._rows.get((fill.order_no, fill.fill_no))
+        if i is None:
+            i = self._n
+            if i == len(self._columns["ctime"]):
+                self._grow()
+            self._rows[(fill.order_no, fill.fill_no)] = i
+            self._n = i + 1
+        columns = self._columns
+        for c in self.CODED:
+            v = getattr(fill, c)
+            codes = self._codes[c]
+            code = codes.get(v)
+            if code is None:
+                code = codes[v] = len(codes)
+            columns[c][i] = code
+        columns["order_no"][i] = fill.order_no
+        columns["fill_no"][i] = fill.fill_no
+        columns["price"][i] = fill.price
+        columns["quantity"][i] = fill.quantity
+        columns["fee"][i] = fill.fee
+        columns["ctime"][i] = fill.ctime
+
+    def to_dataframe(self):
+        """ 转换为DataFrame,列和trades.csv相同
+        """
+        n = self._n
+        data = {}
+        for c in self.COLUMNS:
+            v = self._columns[c][:n]
+            if c in self.CODED:
+                values = np.empty(len(self._codes[c]), dtype=object)
+                for value, code in self._codes[c].items():
+                    values[code] = value
+                v = values[v]
+            data[c] = v
+        return pd.DataFrame(data, columns=self.COLUMNS)
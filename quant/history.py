@@ -8,10 +8,13 @@ Author: HJQuant
 Description: Asynchronous driven quantitative trading framework
 """
 
+import gc
 import asyncio
 import numpy as np
 import pandas as pd
+from heapq import heapify, heappop, heappush
 from threading import Thread
+from collections import deque
 
 from quant.config import config
 from quant.tasks import SingleTask
@@ -30,14 +33,230 @@ pd.set_option('display.width', 50000)
 pd.set_option('max_colwidth', 1000)
 
 
+class HistoryBlock:
+    """ 一段时间内某个交易对某种类型的历史数据(按列存储)
+
+    Args:
+        gw: 数据所属的虚拟适配器接口
+        drive_type: 数据驱动方式,kline,trade,orderbook
+        symbol: 交易对
+        columns: 列数据, e.g. {"begin_dt": np.ndarray, "close": np.ndarray, ...}
+    """
+
+    def __init__(self, gw, drive_type, symbol, columns):
+        """ 初始化
+        """
+        self.gw = gw
+        self.drive_type = drive_type
+        self.symbol = symbol
+        self.columns = columns
+        key = "begin_dt" if drive_type == "kline" else "dt" #K线按开始时间排序,其他按采集时间排序
+        self.dt = columns[key].astype(np.int64)
+        if len(self.dt) > 1 and (np.diff(self.dt) < 0).any():
+            #数据库按时间排序返回,一般不会走到这里,以防万一用稳定排序把数据块整理为按时间有序,这是多路归并的前提
+            order = np.argsort(self.dt, kind='mergesort')
+            self.columns = {c: v[order] for c, v in columns.items()}
+            self.dt = self.dt[order]
+        self._rows = None
+        self._depth = None
+
+    def __len__(self):
+        return len(self.dt)
+
+    @property
+    def nbytes(self):
+        """ 列数据占用的内存字节数
+        """
+        return sum(v.nbytes for v in self.columns.values())
+
+    def split(self, t):
+        """ 按时间t把数据块切分为两部分, 返回(早于t的部分, 其余部分), 没有数据的部分为None
+        """
+        k = int(np.searchsorted(self.dt, t, side='left'))
+        if k == 0:
+            return None, self
+        if k == len(self.dt):
+            return self, None
+        head = HistoryBlock(self.gw, self.drive_type, self.symbol, {c: v[:k] for c, v in self.columns.items()})
+        tail = HistoryBlock(self.gw, self.drive_type, self.symbol, {c: v[k:] for c, v in self.columns.items()})
+        return head, tail
+
+    @classmethod
+    def from_records(cls, gw, drive_type, symbol, records):
+        """ 将数据库读取到的记录列表转换为按列存储
+        """
+        df = pd.DataFrame(records)
+        if "_id" in df.columns:
+            del df["_id"]
+        columns = {c: df[c].to_numpy() for c in df.columns}
+        return cls(gw, drive_type, symbol, columns)
+
+    def rows(self):
+        """ 按驱动类型预先把列数据转换为python原生类型,回放时按下标直接取用,避免逐行生成pandas Series
+        """
+        if self._rows is None:
+            #一次性生成大量python对象时暂停垃圾回收,这些对象之间没有循环引用,频繁触发gc只会白白浪费时间
+            gc_enabled = gc.isenabled()
+            gc.disable()
+            try:
+                self._rows = self._make_rows()
+            finally:
+                if gc_enabled:
+                    gc.enable()
+        return self._rows
+
+    def _make_rows(self):
+        """ 将列数据转换为python原生类型
+        """
+        columns = self.columns
+        if self.drive_type == "kline":
+            names = [c for c in columns if c != "symbol"]
+            values = [columns[c].tolist() for c in names]
+            return names, list(zip(*values))
+        elif self.drive_type == "trade":
+            return (columns["direction"].tolist(), columns["tradeprice"].tolist(),
+                    columns["volume"].tolist(), columns["tradedt"].astype(np.int64).tolist())
+        elif self.drive_type == "orderbook":
+            ask_price, ask_size, bid_price, bid_size = self.depth()
+            asks = np.stack([ask_price, ask_size], axis=2).tolist() #每行为[[price, size], ...]
+            bids = np.stack([bid_price, bid_size], axis=2).tolist()
+            ts = columns["pubdt"] if "pubdt" in columns else columns["dt"]
+            return asks, bids, ts.astype(np.int64).tolist()
+
+    def depth(self):
+        """ 订单薄档位二维数组(ask_price, ask_size, bid_price, bid_size),每行一条订单薄,每列一个档位
+        """
+        if self._depth is None:
+            columns = self.columns
+            depth = 0 #订单薄档位数
+            while f'askprice{depth+1}' in columns and f'bidprice{depth+1}' in columns:
+                depth += 1
+            def _levels(name):
+                return np.column_stack([columns[f'{name}{i}'] for i in range(1, depth+1)]).astype(float)
+            self._depth = (_levels("askprice"), _levels("asksize"), _levels("bidprice"), _levels("bidsize"))
+        return self._depth
+
+
+class HistoryStream:
+    """ 某个虚拟适配器接口某个交易对某种类型的历史数据流,按各自的时间段大小分段读取数据库
+
+    每次读取后根据观察到的数据密度(每毫秒多少条记录,每条记录多少字节)调整下一次读取的时间段大小,
+    使每段数据的记录数不超过chunk_rows,占用内存不超过chunk_bytes.这样K线这种稀疏数据一次能读取一天或者更长时间,
+    订单薄这种密集数据每次只读取几分钟.
+
+    Args:
+        gw: 数据所属的虚拟适配器接口
+        drive_type: 数据驱动方式,kline,trade,orderbook
+        symbol: 交易对
+        begin_time: 开始时间(毫秒)
+        end_time: 结束时间(毫秒)
+        interval: 初始读取时间段大小(毫秒)
+    """
+
+    MIN_INTERVAL = 60*1000 #读取时间段最小1分钟
+    MAX_INTERVAL = 30*24*60*60*1000 #读取时间段最大30天
+
+    def __init__(self, gw, drive_type, symbol, begin_time, end_time, interval):
+        """ 初始化
+        """
+        self.gw = gw
+        self.drive_type = drive_type
+        self.symbol = symbol
+        self.end_time = end_time
+        self.interval = interval
+        self.loaded_until = begin_time #此时间之前的数据都已经从数据库读取
+        self.buffer = None #已经读取但是还没有回放的数据块
+        self.budget_interval = None #按最近一次观察到的数据密度,不超过记录数和内存限制的最大时间段
+
+    @property
+    def finished(self):
+        return self.loaded_until >= self.end_time
+
+    async def load(self, chunk_rows, chunk_bytes, retries=0):
+        """ 从数据库读取下一段数据,读取失败时最多重试retries次
+
+        Returns:
+            error: 读取失败返回错误,这时读取进度不变
+        """
+        bt = self.loaded_until
+        et = min(bt + self.interval, self.end_time)
+        for attempt in range(retries + 1):
+            if attempt:
+                await asyncio.sleep(attempt) #等待数据库恢复
+            block, error = await self.gw.load_block(self.drive_type, self.symbol, bt, et)
+            if not error:
+                break
+            logger.error("load", self.drive_type, self.symbol, bt, et, "failed, attempt", attempt + 1, ":", error, caller=self)
+        else:
+            return error
+        self.loaded_until = et
+        self.buffer = block
+        self._adapt(block, et - bt, chunk_rows, chunk_bytes)
+
+    def _adapt(self, block, span, chunk_rows, chunk_bytes):
+        """ 根据刚读取的数据密度调整下一次读取的时间段大小
+        """
+        rows = len(block) if block else 0
+        if rows == 0: #没有数据就放大时间段,但是不超过按之前的数据密度计算的限制,采集中断之后恢复数据时不会一次读取几个星期
+            interval = span * 2
+            if self.budget_interval:
+                interval = min(interval, self.budget_interval)
+        else:
+            density = rows / span #每毫秒多少条记录
+            row_bytes = block.nbytes / rows #每条记录多少字节
+            interval = min(chunk_rows / density, chunk_bytes / (density * row_bytes))
+            self.budget_interval = interval
+        self.interval = int(min(max(interval, self.MIN_INTERVAL), self.MAX_INTERVAL))
+
+    def take(self, t):
+        """ 取出已读取数据中时间早于t的部分
+        """
+        if self.buffer is None:
+            return None
+        head, self.buffer = self.buffer.split(t)
+        return head
+
+
+def merge_blocks(blocks):
+    """ 多路归并所有数据块(每个数据块本身已按时间有序),按采集时间顺序依次返回(dt, block, 下标)
+
+    这一步非常关键,它将各种类型历史数据按采集顺序安排在同一个时间轴上,和实盘数据顺序一致.
+    时间相同的记录按数据块的先后顺序(gw->drive_type->symbol)返回,同一数据块内保持原有顺序,
+    结果和把所有数据块拼接起来后做稳定排序完全一致,但不需要拼接和整体排序.
+    """
+    dts = [b.dt.tolist() for b in blocks]
+    heap = [(d[0], n, 0) for n, d in enumerate(dts) if d] #堆中每路只放当前最早的一条记录,(时间, 数据块序号, 下标)
+    heapify(heap)
+    while heap:
+        _, n, i = heappop(heap)
+        d, block, size = dts[n], blocks[n], len(dts[n])
+        #当前这一路连续返回,直到它的记录晚于其余各路中最早的那一条,避免每条记录都要进出一次堆
+        if heap:
+            first_dt, first_n, _ = heap[0]
+            while i < size and (d[i] < first_dt or (d[i] == first_dt and n < first_n)):
+                yield d[i], block, i
+                i += 1
+        else:
+            while i < size:
+                yield d[i], block, i
+                i += 1
+        if i < size:
+            heappush(heap, (d[i], n, i))
+
+
 class HistoryAdapter:
     """ 历史行情适配器(同步时间轴)
     """
 
-    INTERVAL = 1*60*60*1000 #按每小时做为时间间隔读取数据库
+    CHUNK_INTERVAL = { #各种类型数据初始读取时间段大小(毫秒),之后会按数据密度自动调整
+        "kline": 24*60*60*1000,
+        "trade": 60*60*1000,
+        "orderbook": 10*60*1000
+    }
     gw_list = []
     current_timestamp = None #回测环境中的"当前时间"
     bind_strategy = None
+    load_semaphore = None
     
     def __init__(self, **kwargs):
         self.gw_list.append(self)
@@ -54,6 +273,13 @@ class HistoryAdapter:
         asyncio.set_event_loop(loop)
         loop.run_forever()
 
+    @classmethod
+    def option(cls, name, default=None):
+        """ 读取回测或者数据矩阵模式下的可选配置项
+        """
+        settings = config.backtest or config.datamatrix or {}
+        return settings.get(name, default)
+
     @classmethod
     def initialize(cls, bind_strategy):
         if config.backtest: #回测模式
@@ -64,6 +290,12 @@ class HistoryAdapter:
             cls._start_time = config.datamatrix["start_time"]
             cls._period_day = config.datamatrix["period_day"]
             cls._drive_type = config.datamatrix["drive_type"]
+        cls._prefetch_depth = max(1, int(cls.option("prefetch_depth", 2))) #最多同时有几段数据已读取但还没有回放完毕
+        cls._load_concurrency = max(1, int(cls.option("load_concurrency", 8))) #最多同时有几个数据库查询
+        cls._chunk_rows = int(cls.option("chunk_rows", 50000)) #每段数据最多多少条记录
+        cls._chunk_bytes = int(cls.option("chunk_bytes", 64*1024*1024)) #每段数据最多占用多少内存
+        cls._chunk_interval = dict(cls.CHUNK_INTERVAL, **cls.option("chunk_interval", {}))
+        cls._load_retries = max(0, int(cls.option("load_retries", 3))) #读取数据库失败时重试几次,仍然失败就停止回测
         #----------------------------------------------------
         ts = tools.datetime_str_to_ts(cls._start_time, fmt='%Y-%m-%d') #转换为时间戳
         ts *= 1000 #转换为毫秒时间戳
@@ -87,9 +319,10 @@ class HistoryAdapter:
             await gw.launch() #模拟交易接口连接初始化成功
 
         #1.算出begin_time和end_time
-        #2.然后按1小时为一个单位调用 按drive_type 依次调用gw_list里面每个对象的gw.load_data(drive_type, begin_time, end_time)
-        #3.将上一步读取到的所有pandas合并成一个大的pandas, 然后按dt进行排序
-        #4.循环遍历这个大的pandas,依据记录里面的self对象，把数据逐条推送给相应BacktestTrader
+        #2.每个gw每种drive_type每个交易对各自作为一个数据流,按各自的时间段大小调用gw.load_block(drive_type, symbol, begin_time, end_time)
+        #  所有数据流都已读取到的最早时间为本次回放的截止时间,各数据流中早于截止时间的数据组成本次回放的数据块
+        #3.将上一步读取到的所有数据块(按列存储,各自已按dt有序)按dt进行多路归并
+        #4.按排序结果遍历所有数据块,依据数据块里面的gw对象，把数据逐条推送给相应BacktestTrader
         #5.BacktestTrader里面将记录按drive_type转换为相应的结构 然后调用相应on_xxxx
         #6.重复第二步
         #备注：每次把时间dt记录下来 作为回测环境的当前时间
@@ -97,35 +330,41 @@ class HistoryAdapter:
         begin_time = tools.datetime_str_to_ts(cls._start_time, fmt='%Y-%m-%d') #转换为时间戳
         begin_time *= 1000 #转换为毫秒时间戳
         end_time = begin_time + int(cls._period_day)*24*60*60*1000 #回测结束毫秒时间戳
+        cls.load_semaphore = asyncio.Semaphore(cls._load_concurrency) #限制同时读取数据库的查询数量
         
-        bt = begin_time
-        et = begin_time + cls.INTERVAL
-        while et <= end_time: #每次从数据库中读取一段时间的数据
-            pd_list = []
-            for gw in cls.gw_list:
-                for t in cls._drive_type:
-                    df = await gw.load_data(t, bt, et)
-                    if not df.empty:
-                        pd_list.append(df)
-            #-------------------------------------
-            #设置下一个时间段
-            bt = et
-            et = bt + cls.INTERVAL
+        streams = [] #顺序为gw->drive_type->symbol,决定了时间相同的记录的回放顺序
+        for gw in cls.gw_list:
+            for t in cls._drive_type:
+                for symbol in gw.symbols:
+                    streams.append(HistoryStream(gw, t, symbol, begin_time, end_time, cls._chunk_interval[t]))
+        cursor = begin_time #此时间之前的数据都已经读取
+        pending = deque() #已经投递给工作线程但还没有回放完毕的数据段
+        while cursor < end_time: #每次从数据库中读取一段时间的数据
+            #预读队列已满就先等待最早的一段数据回放完毕,避免读取数据库远远跑在策略回放前面,导致内存随回测周期无限增长.
+            #队列未满时,读取下一段数据和工作线程回放当前这段数据是同时进行的
+            while len(pending) >= cls._prefetch_depth:
+                await cls._wait_replay(pending.popleft())
+            #读取进度落在最后面的数据流同时读取下一段
+            lagging = [s for s in streams if not s.finished and s.loaded_until <= cursor]
+            errors = await asyncio.gather(*[s.load(cls._chunk_rows, cls._chunk_bytes, cls._load_retries) for s in lagging])
+            if any(errors):
+                #跳过读取失败的时间段会让回测结果悄悄缺少数据,所以等已经投递的数据回放完毕以后停止回测
+                logger.error("load history data failed, stop backtest", caller=cls)
+                while pending:
+                    await cls._wait_replay(pending.popleft())
+                thread_loop.call_soon_threadsafe(thread_loop.stop)
+                cls.bind_strategy.stop()
+                return
+            cursor = min([s.loaded_until for s in streams], default=end_time)
+            blocks = [b for b in (s.take(cursor) for s in streams) if b]
             #-------------------------------------
             #下面的函数一定要上锁,不然当回测的策略面有比如await这样的等待操作的话
             #新的task就会被调度,那样回测数据时间轴就混乱了,所以得上同步锁
             @async_method_locker("HistoryAdapter.start.task") #上锁
-            async def task(pd_list):
-                if pd_list:
-                    #合成一个大表
-                    df = pd.concat(pd_list, sort=False)
-                    #按采集时间排序,这一步非常关键,它将各种类型历史数据按采集顺序安排在同一个时间轴上,和实盘数据顺序一致
-                    sorted_df = df.sort_values(by='dt', kind='mergesort')
-                    for _, row in sorted_df.iterrows():
-                        cls.current_timestamp = int(row['dt']) #回测环境中的"当前时间"
-                        gw = row['gw']
-                        await gw.feed(row) #逐行将数据喂给其对应的虚拟适配器接口
-                elif pd_list == None:
+            async def task(blocks):
+                if blocks:
+                    await cls.replay(blocks)
+                elif blocks == None:
                     #全部执行完毕,进行收尾工作
                     #通知虚拟适配器
                     for gw in cls.gw_list:
@@ -142,15 +381,32 @@ class HistoryAdapter:
             #所以需要修改ModelApi,如果是回测模式就需要将数据库操作投递到主线程中的事件loop中执行.
             
             #在主线程中运行
-            #SingleTask.run(task, pd_list)
+            #SingleTask.run(task, blocks)
             
             #在工作线程中运行
-            asyncio.run_coroutine_threadsafe(task(pd_list), thread_loop)
+            pending.append(asyncio.run_coroutine_threadsafe(task(blocks), thread_loop))
         #end while
         
         #完成通知
         asyncio.run_coroutine_threadsafe(task(None), thread_loop)
 
+    @classmethod
+    async def _wait_replay(cls, future):
+        """ 等待投递到工作线程的一段数据回放完毕(不阻塞主线程事件循环,回放过程中策略还需要通过主线程读取数据库)
+        """
+        try:
+            await asyncio.wrap_future(future)
+        except Exception as e:
+            logger.error("replay error:", e, caller=cls)
+
+    @classmethod
+    async def replay(cls, blocks):
+        """ 将一段时间内的所有数据块按采集时间顺序逐条回放
+        """
+        for dt, block, i in merge_blocks(blocks):
+            cls.current_timestamp = dt #回测环境中的"当前时间"
+            await block.gw.feed(block, i) #逐条将数据喂给其对应的虚拟适配器接口
+
 
 class VirtualTrader(HistoryAdapter, ExchangeGateway):
     """ VirtualTrader module. You can initialize trader object with some attributes in kwargs.
@@ -178,111 +434,94 @@ class VirtualTrader(HistoryAdapter, ExchangeGateway):
 
         super(VirtualTrader, self).__init__(**kwargs)
 
-    async def load_data(self, drive_type, begin_time, end_time):
-        """ 从数据库中读取历史数据
+    @property
+    def symbols(self):
+        return self._symbols
+
+    KLINE_REQUIRED_FIELDS = ("begin_dt", "end_dt", "usable", "close_avg_fillna") #回放和撮合一定会用到的K线字段
+
+    def load_fields(self, drive_type):
+        """ 读取历史数据时需要的字段列表,None表示全部字段
+
+        K线按配置项kline_fields(策略用到的K线字段)读取,订单薄按配置项orderbook_depth(档位数)读取,都没有配置时读取全部字段
         """
+        if drive_type == "kline":
+            fields = self.option("kline_fields")
+            if fields:
+                return list(self.KLINE_REQUIRED_FIELDS) + [f for f in fields if f not in self.KLINE_REQUIRED_FIELDS]
+        elif drive_type == "orderbook":
+            depth = self.option("orderbook_depth")
+            if depth:
+                fields = ["dt", "pubdt"]
+                for i in range(1, int(depth)+1):
+                    fields += [f"askprice{i}", f"asksize{i}", f"bidprice{i}", f"bidsize{i}"]
+                return fields
+        return None
+
+    async def load_block(self, drive_type, symbol, begin_time, end_time):
+        """ 从数据库中读取某个交易对某种类型的历史数据
+
+        Returns:
+            block: 数据块,没有数据时返回None
+            error: 读取失败返回错误,否则返回None
+        """
+        if drive_type not in ("kline", "trade", "orderbook"):
+            return None, None
         try:
-            if drive_type == "kline":
-                pd_list = []
-                for symbol in self._symbols:
-                    r = await InfraAPI.get_klines_between(self._platform, symbol, begin_time, end_time)
-                    if r:
-                        #1.将r转换成pandas
-                        #2.然后添加3列,一列为drive_type,一列为symbol,一列为当前类的self值,然后将从begin_dt这一列复制一个新列,名字叫做dt,方便以后统一排序
-                        #3.pd_list.append(pandas)
-                        df = pd.DataFrame(r)
-                        df["drive_type"] = drive_type
-                        df["symbol"] = symbol
-                        df["gw"] = self
-                        df["dt"] = df["begin_dt"]
-                        del df["_id"]
-                        pd_list.append(df)
-                #将pd_list的所有pandas按行合并成一个大的pandas
-                #然后return这个大的pandas
-                if pd_list:
-                    return pd.concat(pd_list)
-                else:
-                    return pd.DataFrame()
-            elif drive_type == "trade":
-                pd_list = []
-                for symbol in self._symbols:
-                    r = await InfraAPI.get_trades_between(self._platform, symbol, begin_time, end_time)
-                    if r:
-                        #1.将r转换成pandas
-                        #2.然后添加3列,一列为drive_type,一列为symbol,一列为当前类的self值
-                        #3.pd_list.append(pandas)
-                        df = pd.DataFrame(r)
-                        df["drive_type"] = drive_type
-                        df["symbol"] = symbol
-                        df["gw"] = self
-                        del df["_id"]
-                        pd_list.append(df)
-                #将pd_list的所有pandas按行合并成一个大的pandas
-                #然后return这个大的pandas
-                if pd_list:
-                    return pd.concat(pd_list)
-                else:
-                    return pd.DataFrame()
-            elif drive_type == "orderbook":
-                pd_list = []
-                for symbol in self._symbols:
-                    r = await InfraAPI.get_orderbooks_between(self._platform, symbol, begin_time, end_time)
-                    if r:
-                        #1.将r转换成pandas
-                        #2.然后添加3列,一列为drive_type,一列为symbol,一列为当前类的self值
-                        #3.pd_list.append(pandas)
-                        df = pd.DataFrame(r)
-                        df["drive_type"] = drive_type
-                        df["symbol"] = symbol
-                        df["gw"] = self
-                        del df["_id"]
-                        pd_list.append(df)
-                #将pd_list的所有pandas按行合并成一个大的pandas
-                #然后return这个大的pandas
-                if pd_list:
-                    return pd.concat(pd_list)
-                else:
-                    return pd.DataFrame()
+            async with self.load_semaphore: #限制同时进行的数据库查询数量
+                if not await InfraAPI.has_data_between(self._platform, symbol, drive_type, begin_time, end_time):
+                    return None, None #数据覆盖索引表明这段时间没有数据,不用查询数据库
+                fields = self.load_fields(drive_type)
+                columns = await InfraAPI.get_columns_between(self._platform, symbol, drive_type, begin_time, end_time, self._chunk_bytes) #优先读取本地磁盘缓存
+                if columns is None:
+                    columns = await InfraAPI.query_columns_between(self._platform, symbol, drive_type, begin_time, end_time, fields) #分批直接解码为列数组
+                    if columns is None:
+                        return None, Exception("query database failed")
+                elif fields:
+                    columns = {c: v for c, v in columns.items() if c in fields} #缓存保存全部字段
+            if columns:
+                return HistoryBlock(self, drive_type, symbol, columns), None
+            return None, None
         except Exception as e:
-            return pd.DataFrame() #发生异常就返回空df
+            return None, e
 
-    async def feed(self, row):
+    async def feed(self, block, i):
         """ 通过历史数据驱动策略进行回测
+
+        Args:
+            block: 数据块
+            i: 记录在数据块中的下标
         """
-        drive_type = row["drive_type"] #数据驱动方式
+        drive_type = block.drive_type #数据驱动方式
         if drive_type == "kline" and self.cb.on_kline_update_callback:
-            kw = row.to_dict()
-            del kw["drive_type"]
-            del kw["gw"]
-            del kw["dt"]
+            names, rows = block.rows()
+            kw = dict(zip(names, rows[i]))
+            kw["symbol"] = block.symbol
             kw["platform"] = self._platform
             kw["timestamp"] = int(kw["begin_dt"])
             kw["kline_type"] = MARKET_TYPE_KLINE
             kline = Kline(**kw)
             await self.cb.on_kline_update_callback(kline)
         elif drive_type == "trade" and self.cb.on_trade_update_callback:
+            direction, tradeprice, volume, tradedt = block.rows()
             kw = {
                 "platform": self._platform,
-                "symbol": row["symbol"],
-                "action": row["direction"],
-                "price": row["tradeprice"],
-                "quantity": row["volume"],
-                "timestamp": int(row["tradedt"])
+                "symbol": block.symbol,
+                "action": direction[i],
+                "price": tradeprice[i],
+                "quantity": volume[i],
+                "timestamp": tradedt[i]
             }
             trade = Trade(**kw)
             await self.cb.on_trade_update_callback(trade)
         elif drive_type == "orderbook" and self.cb.on_orderbook_update_callback:
-            asks = []
-            bids = []
-            for i in range(1, 20+1):
-                asks.append([row[f'askprice{i}'], row[f'asksize{i}']])
-                bids.append([row[f'bidprice{i}'], row[f'bidsize{i}']])
+            asks, bids, pubdt = block.rows()
             kw = {
                 "platform": self._platform,
-                "symbol": row["symbol"],
-                "asks": asks,
-                "bids": bids,
-                "timestamp": int(row["pubdt"])
+                "symbol": block.symbol,
+                "asks": asks[i],
+                "bids": bids[i],
+                "timestamp": pubdt[i]
             }
             ob = Orderbook(**kw)
             await self.cb.on_orderbook_update_callback(ob)
@@ -9,21 +9,34 @@ Description: Asynchronous driven quantitative trading framework
 """
 
 import time
+import asyncio
 import datetime
 from collections import defaultdict
 
 import pymongo
+import pandas as pd
 
+from quant.config import config
+from quant.utils import logger
 from quant.utils.mongo import MongoDB
+from quant.coverage import Coverage
+from quant.bucket import Bucket, BUCKET_KEY
+from quant.datacache import DataCache
 
 
 class InfraAPI:
     """ 基础历史行情API
+
+    所有get_*查询都可以通过fields参数(字段列表)只读取需要的字段,为None时读取全部字段
     """
     
     t_depth_map = defaultdict(lambda:None)
     t_trade_map = defaultdict(lambda:None)
     t_kline_map = defaultdict(lambda:None)
+    t_bucket_map = defaultdict(lambda:None)
+    t_bucket_span = {} #分桶数据表用过的最大桶大小
+    t_coverage_map = defaultdict(lambda:None)
+    data_cache = None
     
     def __init__(self):
         """ 初始化
@@ -56,6 +69,213 @@ class InfraAPI:
             InfraAPI.t_kline_map[symbol] = MongoDB("db_custom_kline", name)
         return InfraAPI.t_kline_map[symbol]
 
+    @staticmethod
+    def _get_bucket(data_type):
+        """ INFRA.bucket_ms中配置了桶大小的数据类型(trade,orderbook)按分桶格式读取，否则返回None
+        """
+        interval = Bucket.configured(data_type)
+        if not interval:
+            return None
+        return Bucket(interval)
+
+    @staticmethod
+    def _get_bucket_name(exchange, symbol, data_type):
+        postfix = symbol.replace('-','').replace('_','').replace('/','').lower() #将所有可能的情况转换为我们自定义的数据库表名规则
+        return Bucket.collection_name("t_{}_{}_{}".format(data_type, exchange, postfix).lower())
+
+    @staticmethod
+    def _get_db_bucket_reader(exchange, symbol, data_type):
+        name = InfraAPI._get_bucket_name(exchange, symbol, data_type)
+        if not InfraAPI.t_bucket_map[name]:
+            InfraAPI.t_bucket_map[name] = MongoDB("db_market", name)
+        return InfraAPI.t_bucket_map[name]
+
+    @staticmethod
+    async def _load_bucket(exchange, symbol, data_type):
+        """ 分桶格式的读取参数，查询条件按t_bucket_meta中记录的最大桶大小放宽(写入程序的桶可能比本地配置的大)，返回(结果,错误)
+        """
+        name = InfraAPI._get_bucket_name(exchange, symbol, data_type)
+        if name not in InfraAPI.t_bucket_span:
+            span, e = await Bucket.load_span(name)
+            if e:
+                return None, e
+            InfraAPI.t_bucket_span[name] = span
+        return Bucket(Bucket.configured(data_type), span=InfraAPI.t_bucket_span[name]), None
+
+    @staticmethod
+    async def _get_bucket_records(exchange, symbol, data_type, begin_epoch_millisecond, end_epoch_millisecond, n, descending=False, fields=None):
+        """ 分桶格式读取[begin, end)之间按时间排序的前n条记录(descending为True时从后往前)，begin或者end为None表示不限制，失败返回None
+        """
+        bucket, e = await InfraAPI._load_bucket(exchange, symbol, data_type)
+        if e:
+            logger.error("load bucket meta error:", exchange, symbol, data_type, e, caller=InfraAPI)
+            return None
+        cursor = InfraAPI._get_db_bucket_reader(exchange, symbol, data_type)
+        sort = [(BUCKET_KEY, pymongo.DESCENDING if descending else pymongo.ASCENDING)]
+        s = []
+        try:
+            async for batch in cursor.iter_batches(bucket.spec(begin_epoch_millisecond, end_epoch_millisecond), fields=bucket.projection(fields),
+                                                   sort=sort, batch_size=min(n, InfraAPI._batch_size())):
+                records = Bucket.to_records(bucket.unpack(batch, begin_epoch_millisecond, end_epoch_millisecond, fields))
+                if descending:
+                    records.reverse()
+                s.extend(records)
+                if len(s) >= n:
+                    break
+        except pymongo.errors.PyMongoError as e:
+            logger.error("query bucket error:", exchange, symbol, data_type, e, caller=InfraAPI)
+            return None
+        return s[:n]
+
+    @staticmethod
+    def _get_coverage(exchange, symbol, data_type):
+        postfix = symbol.replace('-','').replace('_','').replace('/','').lower() #将所有可能的情况转换为我们自定义的数据库表名规则
+        name = "t_{}_{}_{}".format(data_type, exchange, postfix).lower()
+        if not InfraAPI.t_coverage_map[name]:
+            db = "db_custom_kline" if data_type == "kline" else "db_market"
+            InfraAPI.t_coverage_map[name] = Coverage(db, name)
+        return InfraAPI.t_coverage_map[name]
+
+    @staticmethod
+    async def has_data_between(exchange, symbol, data_type, begin_epoch_millisecond, end_epoch_millisecond):
+        """ 根据数据覆盖索引判断给定symbol，给定数据类型(kline,trade,orderbook)，给定起始毫秒，结束毫秒之间是否可能有数据，
+        返回False表示肯定没有数据，不需要查询数据库
+        """
+        coverage = InfraAPI._get_coverage(exchange, symbol, data_type)
+        return await coverage.has_data(begin_epoch_millisecond, end_epoch_millisecond)
+
+    @staticmethod
+    def _get_data_cache():
+        """ 本地磁盘缓存,没有配置INFRA.cache_path时不使用缓存
+        """
+        if not InfraAPI.data_cache and config.infra.get("cache_path"):
+            size_limit = int(config.infra.get("cache_size", 10*1024*1024*1024))
+            InfraAPI.data_cache = DataCache(config.infra["cache_path"], size_limit)
+        return InfraAPI.data_cache
+
+    @staticmethod
+    def _get_db_reader(exchange, symbol, data_type):
+        """ 数据类型(kline,trade,orderbook)对应的数据库表和时间字段
+        """
+        if data_type == "kline":
+            return InfraAPI._get_db_kline_reader(exchange, symbol), "begin_dt"
+        elif data_type == "trade":
+            return InfraAPI._get_db_trade_reader(exchange, symbol), "dt"
+        else:
+            return InfraAPI._get_db_depth_reader(exchange, symbol), "dt"
+
+    @staticmethod
+    def projection(fields):
+        """ 字段列表转换为数据库查询的projection参数，为None时读取全部字段
+        """
+        if not fields:
+            return None
+        p = {"_id": 0}
+        for f in fields:
+            p[f] = 1
+        return p
+
+    @staticmethod
+    def _batch_size():
+        """ 流式读取数据库时每批记录数
+        """
+        return int(config.infra.get("batch_size", 10000))
+
+    @staticmethod
+    async def _sub_ranges(cursor, spec, begin_epoch_millisecond, end_epoch_millisecond):
+        """ 查询条件spec匹配的记录数(分桶格式时为桶数)不少于INFRA.parallel_min_rows时把[begin, end)按时间等分为INFRA.parallel_reads段并发读取，否则只有一段，
+        时间段短于INFRA.parallel_min_span时直接读取一段，不查询记录数(回测按数据密度分段读取，密集数据的每段都很短)
+        """
+        n = int(config.infra.get("parallel_reads", 1))
+        span = end_epoch_millisecond - begin_epoch_millisecond
+        if n <= 1 or span < max(n, int(config.infra.get("parallel_min_span", 60*60*1000))):
+            return [(begin_epoch_millisecond, end_epoch_millisecond)]
+        count, e = await cursor.count(spec)
+        if e or count < int(config.infra.get("parallel_min_rows", 200000)):
+            return [(begin_epoch_millisecond, end_epoch_millisecond)]
+        step = -(-(end_epoch_millisecond - begin_epoch_millisecond) // n)
+        return [(t, min(t+step, end_epoch_millisecond)) for t in range(begin_epoch_millisecond, end_epoch_millisecond, step)]
+
+    @staticmethod
+    async def _query_parts(exchange, symbol, data_type, begin_epoch_millisecond, end_epoch_millisecond, fields, as_arrays):
+        """ 按时间分段并发读取，返回按时间先后排列的批次列表，失败返回None
+        """
+        if InfraAPI._get_bucket(data_type):
+            bucket, e = await InfraAPI._load_bucket(exchange, symbol, data_type)
+            if e:
+                logger.error("load bucket meta error:", exchange, symbol, data_type, e, caller=InfraAPI)
+                return None
+            #分桶格式,每批桶解码为时间段内的记录,相邻两段都会读到跨越分段边界的桶,解码时各自只保留自己时间段内的记录
+            cursor = InfraAPI._get_db_bucket_reader(exchange, symbol, data_type)
+            spec = bucket.spec
+            def decode(batch, begin, end):
+                columns = bucket.unpack(batch, begin, end, fields)
+                return columns if as_arrays else Bucket.to_records(columns)
+            options = {"fields": bucket.projection(fields), "sort": [(BUCKET_KEY, pymongo.ASCENDING)]}
+        else:
+            cursor, key = InfraAPI._get_db_reader(exchange, symbol, data_type)
+            spec = lambda begin, end: {key:{'$gte':begin,'$lt':end}}
+            decode = lambda batch, begin, end: batch
+            options = {"fields": InfraAPI.projection(fields), "as_arrays": as_arrays}
+        async def fetch(begin, end):
+            parts = []
+            async for batch in cursor.iter_batches(spec(begin, end), batch_size=InfraAPI._batch_size(), **options):
+                parts.append(decode(batch, begin, end))
+            return parts
+        try:
+            ranges = await InfraAPI._sub_ranges(cursor, spec(begin_epoch_millisecond, end_epoch_millisecond), begin_epoch_millisecond, end_epoch_millisecond)
+            if len(ranges) == 1:
+                return await fetch(*ranges[0])
+            result = await asyncio.gather(*[fetch(b, e) for b, e in ranges])
+        except pymongo.errors.PyMongoError as e:
+            logger.error("query error:", exchange, symbol, data_type, begin_epoch_millisecond, end_epoch_millisecond, e, caller=InfraAPI)
+            return None
+        return [batch for parts in result for batch in parts]
+
+    @staticmethod
+    async def query_between(exchange, symbol, data_type, begin_epoch_millisecond, end_epoch_millisecond, fields=None):
+        """ 直接从数据库(不经过本地磁盘缓存)读取给定symbol，给定数据类型(kline,trade,orderbook)，给定起始毫秒，结束毫秒之间的所有记录，
+        fields为需要的字段列表，为None时读取全部字段
+        """
+        parts = await InfraAPI._query_parts(exchange, symbol, data_type, begin_epoch_millisecond, end_epoch_millisecond, fields, False)
+        if parts is None:
+            return None
+        return [d for batch in parts for d in batch]
+
+    @staticmethod
+    async def query_columns_between(exchange, symbol, data_type, begin_epoch_millisecond, end_epoch_millisecond, fields=None):
+        """ 直接从数据库(不经过本地磁盘缓存)读取给定symbol，给定数据类型(kline,trade,orderbook)，给定起始毫秒，结束毫秒之间的所有记录(只读取fields字段)，
+        每批记录直接解码为列数组，不生成完整的记录列表，按列返回{列名: np.ndarray}，失败返回None
+        """
+        parts = await InfraAPI._query_parts(exchange, symbol, data_type, begin_epoch_millisecond, end_epoch_millisecond, fields, True)
+        if parts is None:
+            return None
+        return DataCache.concat_columns(parts)
+
+    @staticmethod
+    async def get_columns_between(exchange, symbol, data_type, begin_epoch_millisecond, end_epoch_millisecond, max_bytes=None):
+        """ 通过本地磁盘缓存读取给定symbol，给定数据类型(kline,trade,orderbook)，给定起始毫秒，结束毫秒之间的数据，按列返回
+        {列名: np.ndarray}，没有配置缓存或者读取失败时返回None，max_bytes为缓存整天数据时最多占用多少内存，超过的天只读取需要的时间段
+        """
+        cache = InfraAPI._get_data_cache()
+        if not cache:
+            return None
+        key = "begin_dt" if data_type == "kline" else "dt"
+        async def fetch(begin, end):
+            return await InfraAPI.query_columns_between(exchange, symbol, data_type, begin, end)
+        return await cache.get_between(exchange, symbol, data_type, key, begin_epoch_millisecond, end_epoch_millisecond, fetch, max_bytes)
+
+    @staticmethod
+    async def _get_between(exchange, symbol, data_type, begin_epoch_millisecond, end_epoch_millisecond, fields=None):
+        """ 优先从本地磁盘缓存读取(缓存保存全部字段，读取后只保留fields)，否则从数据库读取
+        """
+        columns = await InfraAPI.get_columns_between(exchange, symbol, data_type, begin_epoch_millisecond, end_epoch_millisecond)
+        if columns is not None:
+            if fields:
+                columns = {c: v for c, v in columns.items() if c in fields}
+            return pd.DataFrame(columns).to_dict('records')
+        return await InfraAPI.query_between(exchange, symbol, data_type, begin_epoch_millisecond, end_epoch_millisecond, fields)
+
     @staticmethod
     def today():
         """ 获取今天datetime
@@ -143,48 +363,65 @@ class InfraAPI:
         pass
 
     @staticmethod
-    async def get_kline_by_time(exchange, symbol, epoch_millisecond, tolerance_millisecond=0, kline_horizon=None):
+    async def get_kline_by_time(exchange, symbol, epoch_millisecond, tolerance_millisecond=0, kline_horizon=None, fields=None):
         """ 根据给定symbol，给定kline horizon，比如1min或者5min，给定毫秒时间，容忍毫秒数，找到kline
         """
         cursor = InfraAPI._get_db_kline_reader(exchange, symbol)
-        s, e = await cursor.find_one({'begin_dt':{'$gte':epoch_millisecond,'$lt':epoch_millisecond+tolerance_millisecond+1}})
+        s, e = await cursor.find_one({'begin_dt':{'$gte':epoch_millisecond,'$lt':epoch_millisecond+tolerance_millisecond+1}}, fields=InfraAPI.projection(fields))
         if e:
             return None
         return s
 
     @staticmethod
-    async def get_klines_between(exchange, symbol, begin_epoch_millisecond, end_epoch_millisecond, kline_horizon=None):
+    async def get_klines_between(exchange, symbol, begin_epoch_millisecond, end_epoch_millisecond, kline_horizon=None, fields=None):
         """ 根据给定symbol，给定kline horizon，比如1min或者5min，给定起始毫秒，结束毫秒，找到所有kline列表
         """
+        return await InfraAPI._get_between(exchange, symbol, "kline", begin_epoch_millisecond, end_epoch_millisecond, fields)
+
+    @staticmethod
+    async def get_daily_closes(exchange, symbol, begin_epoch_millisecond, end_epoch_millisecond, tz_shift_millisecond=8*60*60*1000):
+        """ 根据给定symbol，给定起始毫秒，结束毫秒，在数据库端按天聚合K线，返回每天最后一个有效(大于0)的收盘价(close_avg_fillna)
+        [{"trade_date": 当天零点毫秒时间戳, "close": 收盘价}, ...]，按K线结束时间(end_dt)划分日期，tz_shift_millisecond为时区偏移(默认东八区)
+        """
+        ONE_DAY = 60*60*24*1000  #一天毫秒数
         cursor = InfraAPI._get_db_kline_reader(exchange, symbol)
-        s, e = await cursor.get_list({'begin_dt':{'$gte':begin_epoch_millisecond,'$lt':end_epoch_millisecond}})
+        shifted = {'$add': ['$end_dt', tz_shift_millisecond]}
+        pipeline = [
+            {'$match': {'begin_dt': {'$gte': begin_epoch_millisecond, '$lt': end_epoch_millisecond}, 'close_avg_fillna': {'$gt': 0}}},
+            {'$sort': {'begin_dt': 1}},
+            {'$group': {'_id': {'$subtract': [{'$subtract': [shifted, {'$mod': [shifted, ONE_DAY]}]}, tz_shift_millisecond]},
+                        'close': {'$last': '$close_avg_fillna'}}},
+            {'$sort': {'_id': 1}},
+            {'$project': {'_id': 0, 'trade_date': '$_id', 'close': 1}}
+        ]
+        s, e = await cursor.aggregate(pipeline)
         if e:
             return None
         return s
 
     @staticmethod
-    async def get_prev_klines(exchange, symbol, epoch_millisecond, n, kline_horizon=None):
+    async def get_prev_klines(exchange, symbol, epoch_millisecond, n, kline_horizon=None, fields=None):
         """ 根据当前毫秒数，给定kline horizon，往过去load若干根kline
         """
         cursor = InfraAPI._get_db_kline_reader(exchange, symbol)
         sort = [('begin_dt', pymongo.DESCENDING)]
-        s, e = await cursor.get_list({'begin_dt':{'$lt':epoch_millisecond}}, sort=sort, limit=n)
+        s, e = await cursor.get_list({'begin_dt':{'$lt':epoch_millisecond}}, sort=sort, limit=n, fields=InfraAPI.projection(fields))
         if e:
             return None
         return s
 
     @staticmethod
-    async def get_next_klines(exchange, symbol, epoch_millisecond, n, kline_horizon=None):
+    async def get_next_klines(exchange, symbol, epoch_millisecond, n, kline_horizon=None, fields=None):
         """ 根据当前毫秒数，给定kline horizon，往未来load若干根kline
         """
         cursor = InfraAPI._get_db_kline_reader(exchange, symbol)
-        s, e = await cursor.get_list({'begin_dt':{'$gte':epoch_millisecond}}, limit=n)
+        s, e = await cursor.get_list({'begin_dt':{'$gte':epoch_millisecond}}, limit=n, fields=InfraAPI.projection(fields))
         if e:
             return None
         return s
 
     @staticmethod
-    async def get_last_kline_oneday(exchange, symbol, date, kline_horizon=None):
+    async def get_last_kline_oneday(exchange, symbol, date, kline_horizon=None, fields=None):
         """ 给定日期，给定kline horizon，找到当天的最后一根kline
         """
         ONE_DAY = 60*60*24  #一天秒数
@@ -196,54 +433,57 @@ class InfraAPI:
         #print(dt.strftime('%Y-%m-%d %H:%M:%S.%f'))
         ts = int(ts*1000)
         cursor = InfraAPI._get_db_kline_reader(exchange, symbol)
-        s, e = await cursor.find_one({'begin_dt':ts})
+        s, e = await cursor.find_one({'begin_dt':ts}, fields=InfraAPI.projection(fields))
         if e:
             return None
         return s
 
     @staticmethod
-    async def get_trade_by_time(exchange, symbol, epoch_millisecond, tolerance_millisecond):
+    async def get_trade_by_time(exchange, symbol, epoch_millisecond, tolerance_millisecond, fields=None):
         """ 根据给定symbol，给定毫秒时间，容忍毫秒数，找到trade
         """
+        if InfraAPI._get_bucket("trade"):
+            s = await InfraAPI._get_bucket_records(exchange, symbol, "trade", epoch_millisecond, epoch_millisecond+tolerance_millisecond+1, 1, fields=fields)
+            return s[0] if s else None
         cursor = InfraAPI._get_db_trade_reader(exchange, symbol)
-        s, e = await cursor.find_one({'dt':{'$gte':epoch_millisecond,'$lt':epoch_millisecond+tolerance_millisecond+1}})
+        s, e = await cursor.find_one({'dt':{'$gte':epoch_millisecond,'$lt':epoch_millisecond+tolerance_millisecond+1}}, fields=InfraAPI.projection(fields))
         if e:
             return None
         return s
 
     @staticmethod
-    async def get_trades_between(exchange, symbol, begin_epoch_millisecond, end_epoch_millisecond):
+    async def get_trades_between(exchange, symbol, begin_epoch_millisecond, end_epoch_millisecond, fields=None):
         """ 根据给定symbol，给定起始毫秒，结束毫秒，找到所有trade列表
         """
-        cursor = InfraAPI._get_db_trade_reader(exchange, symbol)
-        s, e = await cursor.get_list({'dt':{'$gte':begin_epoch_millisecond,'$lt':end_epoch_millisecond}})
-        if e:
-            return None
-        return s
+        return await InfraAPI._get_between(exchange, symbol, "trade", begin_epoch_millisecond, end_epoch_millisecond, fields)
 
     @staticmethod
-    async def get_prev_trades(exchange, symbol, epoch_millisecond, n):
+    async def get_prev_trades(exchange, symbol, epoch_millisecond, n, fields=None):
         """ 根据当前毫秒数，往过去load若干个trade
         """
+        if InfraAPI._get_bucket("trade"):
+            return await InfraAPI._get_bucket_records(exchange, symbol, "trade", None, epoch_millisecond, n, descending=True, fields=fields)
         cursor = InfraAPI._get_db_trade_reader(exchange, symbol)
         sort = [('dt', pymongo.DESCENDING)]
-        s, e = await cursor.get_list({'dt':{'$lt':epoch_millisecond}}, sort=sort, limit=n)
+        s, e = await cursor.get_list({'dt':{'$lt':epoch_millisecond}}, sort=sort, limit=n, fields=InfraAPI.projection(fields))
         if e:
             return None
         return s
 
     @staticmethod
-    async def get_next_trades(exchange, symbol, epoch_millisecond, n):
+    async def get_next_trades(exchange, symbol, epoch_millisecond, n, fields=None):
         """ 根据当前毫秒数，往未来load若干个trade
         """
+        if InfraAPI._get_bucket("trade"):
+            return await InfraAPI._get_bucket_records(exchange, symbol, "trade", epoch_millisecond, None, n, fields=fields)
         cursor = InfraAPI._get_db_trade_reader(exchange, symbol)
-        s, e = await cursor.get_list({'dt':{'$gte':epoch_millisecond}}, limit=n)
+        s, e = await cursor.get_list({'dt':{'$gte':epoch_millisecond}}, limit=n, fields=InfraAPI.projection(fields))
         if e:
             return None
         return s
 
     @staticmethod
-    async def get_last_trade_oneday(exchange, symbol, date):
+    async def get_last_trade_oneday(exchange, symbol, date, fields=None):
         """ 给定日期，找到当天的最后一笔trade
         """
         ONE_DAY = 60*60*24*1000  #一天毫秒数
@@ -253,56 +493,62 @@ class InfraAPI:
         ts = ts + ONE_DAY - 1
         #dt = datetime.datetime.fromtimestamp(ts)
         #print(dt.strftime('%Y-%m-%d %H:%M:%S.%f'))
+        if InfraAPI._get_bucket("trade"):
+            s = await InfraAPI._get_bucket_records(exchange, symbol, "trade", None, ts+1, 1, descending=True, fields=fields)
+            return s[0] if s else None
         cursor = InfraAPI._get_db_trade_reader(exchange, symbol)
         sort = [('dt', pymongo.DESCENDING)]
-        s, e = await cursor.find_one({'dt':{'$lte':ts}}, sort=sort)
+        s, e = await cursor.find_one({'dt':{'$lte':ts}}, sort=sort, fields=InfraAPI.projection(fields))
         if e:
             return None
         return s
 
     @staticmethod
-    async def get_orderbook_by_time(exchange, symbol, epoch_millisecond, tolerance_millisecond):
+    async def get_orderbook_by_time(exchange, symbol, epoch_millisecond, tolerance_millisecond, fields=None):
         """ 根据给定symbol，给定毫秒时间，容忍毫秒数，找到orderbook
         """
+        if InfraAPI._get_bucket("orderbook"):
+            s = await InfraAPI._get_bucket_records(exchange, symbol, "orderbook", epoch_millisecond, epoch_millisecond+tolerance_millisecond+1, 1, fields=fields)
+            return s[0] if s else None
         cursor = InfraAPI._get_db_depth_reader(exchange, symbol)
-        s, e = await cursor.find_one({'dt':{'$gte':epoch_millisecond,'$lt':epoch_millisecond+tolerance_millisecond+1}})
+        s, e = await cursor.find_one({'dt':{'$gte':epoch_millisecond,'$lt':epoch_millisecond+tolerance_millisecond+1}}, fields=InfraAPI.projection(fields))
         if e:
             return None
         return s
 
     @staticmethod
-    async def get_orderbooks_between(exchange, symbol, begin_epoch_millisecond, end_epoch_millisecond):
+    async def get_orderbooks_between(exchange, symbol, begin_epoch_millisecond, end_epoch_millisecond, fields=None):
         """ 根据给定symbol，给定起始毫秒，结束毫秒，找到所有orderbook列表
         """
-        cursor = InfraAPI._get_db_depth_reader(exchange, symbol)
-        s, e = await cursor.get_list({'dt':{'$gte':begin_epoch_millisecond,'$lt':end_epoch_millisecond}})
-        if e:
-            return None
-        return s
+        return await InfraAPI._get_between(exchange, symbol, "orderbook", begin_epoch_millisecond, end_epoch_millisecond, fields)
 
     @staticmethod
-    async def get_prev_orderbooks(exchange, symbol, epoch_millisecond, n):
+    async def get_prev_orderbooks(exchange, symbol, epoch_millisecond, n, fields=None):
         """ 根据当前毫秒数，往过去load若干个orderbook
         """
+        if InfraAPI._get_bucket("orderbook"):
+            return await InfraAPI._get_bucket_records(exchange, symbol, "orderbook", None, epoch_millisecond, n, descending=True, fields=fields)
         cursor = InfraAPI._get_db_depth_reader(exchange, symbol)
         sort = [('dt', pymongo.DESCENDING)]
-        s, e = await cursor.get_list({'dt':{'$lt':epoch_millisecond}}, sort=sort, limit=n)
+        s, e = await cursor.get_list({'dt':{'$lt':epoch_millisecond}}, sort=sort, limit=n, fields=InfraAPI.projection(fields))
         if e:
             return None
         return s
 
     @staticmethod
-    async def get_next_orderbooks(exchange, symbol, epoch_millisecond, n):
+    async def get_next_orderbooks(exchange, symbol, epoch_millisecond, n, fields=None):
         """ 根据当前毫秒数，往未来load若干个orderbook
         """
+        if InfraAPI._get_bucket("orderbook"):
+            return await InfraAPI._get_bucket_records(exchange, symbol, "orderbook", epoch_millisecond, None, n, fields=fields)
         cursor = InfraAPI._get_db_depth_reader(exchange, symbol)
-        s, e = await cursor.get_list({'dt':{'$gte':epoch_millisecond}}, limit=n)
+        s, e = await cursor.get_list({'dt':{'$gte':epoch_millisecond}}, limit=n, fields=InfraAPI.projection(fields))
         if e:
             return None
         return s
 
     @staticmethod
-    async def get_last_orderbook_oneday(exchange, symbol, date):
+    async def get_last_orderbook_oneday(exchange, symbol, date, fields=None):
         """ 给定日期，找到当天的最后一个orderbook
         """
         ONE_DAY = 60*60*24*1000  #一天毫秒数
@@ -312,9 +558,12 @@ class InfraAPI:
         ts = ts + ONE_DAY - 1
         #dt = datetime.datetime.fromtimestamp(ts)
         #print(dt.strftime('%Y-%m-%d %H:%M:%S.%f'))
+        if InfraAPI._get_bucket("orderbook"):
+            s = await InfraAPI._get_bucket_records(exchange, symbol, "orderbook", None, ts+1, 1, descending=True, fields=fields)
+            return s[0] if s else None
         cursor = InfraAPI._get_db_depth_reader(exchange, symbol)
         sort = [('dt', pymongo.DESCENDING)]
-        s, e = await cursor.find_one({'dt':{'$lte':ts}}, sort=sort)
+        s, e = await cursor.find_one({'dt':{'$lte':ts}}, sort=sort, fields=InfraAPI.projection(fields))
         if e:
             return None
         return s
@@ -0,0 +1,155 @@
+# -*- coding:utf-8 -*-
+
+"""
+K线滑动窗口缓存
+
+Project: alphahunter
+Author: HJQuant
+Description: Asynchronous driven quantitative trading framework
+"""
+
+from bisect import bisect_left
+
+
+class KlineWindow:
+    """ 某个交易对回放时间附近的K线滑动窗口缓存.
+
+    回测或者数据矩阵模式下,策略每根K线都会调用get_prev_klines/get_next_klines查询前后若干根K线,相邻两次查询的结果几乎完全重叠.
+    窗口里保存的是按begin_dt排序的K线,并且已知时间段[lo, hi)内的K线全部都在窗口里,查询落在窗口内就直接返回切片,
+    不需要访问数据库,只有不够的时候才从数据库多读取prefetch根K线扩展窗口,同时丢弃窗口前面太旧的K线.
+
+    Args:
+        fetch_prev: 从数据库读取K线的函数, fetch_prev(ts, n)返回begin_dt < ts的n根K线(按时间倒序)
+        fetch_next: 从数据库读取K线的函数, fetch_next(ts, n)返回begin_dt >= ts的n根K线
+        prefetch: 每次访问数据库额外多读取的K线数量
+        capacity: 窗口最多保存的K线数量
+    """
+
+    def __init__(self, fetch_prev, fetch_next, prefetch=1000, capacity=10000):
+        """ 初始化
+        """
+        self._fetch_prev = fetch_prev
+        self._fetch_next = fetch_next
+        self._prefetch = prefetch
+        self._capacity = capacity
+        self._klines = []
+        self._dts = [] #和self._klines一一对应的begin_dt,用于二分查找
+        self._lo = None #[lo, hi)时间段内的K线全部都在窗口里
+        self._hi = None
+        self._head_done = False #数据库中lo之前已经没有K线了
+        self._tail_done = False #数据库中hi之后已经没有K线了
+        self.hits = 0
+        self.misses = 0
+
+    def _covers(self, ts):
+        if self._lo is None:
+            return False
+        return (self._head_done or self._lo <= ts) and (self._tail_done or ts <= self._hi)
+
+    def _reset(self, ts):
+        """ 清空窗口,以ts为起点重新开始
+        """
+        self._klines = []
+        self._dts = []
+        self._lo = self._hi = ts
+        self._head_done = self._tail_done = False
+
+    async def _extend_back(self, n):
+        """ 窗口往过去扩展n根K线
+        """
+        r = await self._fetch_prev(self._lo, n)
+        if r is None:
+            return False
+        r = sorted(r, key=lambda k: k["begin_dt"])
+        if len(r) < n:
+            self._head_done = True
+        if r:
+            self._klines[:0] = r
+            self._dts[:0] = [k["begin_dt"] for k in r]
+            self._lo = self._dts[0]
+        return True
+
+    async def _extend_forward(self, n):
+        """ 窗口往未来扩展n根K线
+        """
+        r = await self._fetch_next(self._hi, n)
+        if r is None:
+            return False
+        r = sorted(r, key=lambda k: k["begin_dt"])
+        if len(r) < n:
+            self._tail_done = True
+        if r:
+            self._klines.extend(r)
+            self._dts.extend(k["begin_dt"] for k in r)
+            self._hi = self._dts[-1] + 1
+        self._trim()
+        return True
+
+    def _trim(self):
+        """ 丢弃窗口前面太旧的K线
+        """
+        drop = len(self._klines) - self._capacity
+        if drop > 0:
+            del self._klines[:drop]
+            del self._dts[:drop]
+            self._lo = self._dts[0]
+            self._head_done = False
+
+    def _gap(self, ts):
+        """ 按窗口内K线的平均间隔估计[hi, ts)之间有多少根K线,窗口为空时返回None
+        """
+        if len(self._dts) < 2:
+            return None
+        step = (self._dts[-1] - self._dts[0]) / (len(self._dts) - 1)
+        return int((ts - self._hi) / step) + 1 if step > 0 else None
+
+    async def prev(self, ts, n):
+        """ begin_dt < ts的n根K线,按时间倒序,和InfraAPI.get_prev_klines一致
+        """
+        if self._covers(ts):
+            i = bisect_left(self._dts, ts)
+            if i >= n or self._head_done:
+                self.hits += 1
+                return self._copy(self._klines[max(0, i-n):i][::-1])
+        self.misses += 1
+        if not self._covers(ts):
+            gap = self._gap(ts) if self._lo is not None and self._lo <= ts else None
+            if gap is not None and gap <= self._prefetch:
+                #时间往前推进,查询范围和窗口重叠,从hi往未来扩展窗口(同时预读),而不是清空重来
+                if not await self._extend_forward(gap + self._prefetch):
+                    self._reset(ts)
+                    return None
+            if not self._covers(ts):
+                self._reset(ts)
+        i = bisect_left(self._dts, ts)
+        if i < n and not self._head_done:
+            if not await self._extend_back(n - i + self._prefetch):
+                self._reset(ts)
+                return None
+            i = bisect_left(self._dts, ts)
+        return self._copy(self._klines[max(0, i-n):i][::-1])
+
+    async def next(self, ts, n):
+        """ begin_dt >= ts的n根K线,按时间顺序,和InfraAPI.get_next_klines一致
+        """
+        if self._covers(ts):
+            i = bisect_left(self._dts, ts)
+            if len(self._klines) - i >= n or self._tail_done:
+                self.hits += 1
+                return self._copy(self._klines[i:i+n])
+            need = n - (len(self._klines) - i)
+        else:
+            self._reset(ts)
+            need = n
+        self.misses += 1
+        if not await self._extend_forward(need + self._prefetch):
+            self._reset(ts)
+            return None
+        i = bisect_left(self._dts, ts)
+        return self._copy(self._klines[i:i+n])
+
+    @staticmethod
+    def _copy(klines):
+        """ 返回K线的副本,调用者修改返回结果不会破坏窗口中的K线
+        """
+        return [dict(k) for k in klines]
@@ -8,13 +8,16 @@ Author: HJQuant
 Description: Asynchronous driven quantitative trading framework
 """
 
+import time
 import asyncio
 import threading
 from functools import wraps
+from collections import defaultdict
 
 from quant.config import config
 from quant.history import HistoryAdapter
 from quant.infra_api import InfraAPI
+from quant.interface.kline_window import KlineWindow
 
 
 class ModelAPI:
@@ -24,6 +27,11 @@ class ModelAPI:
         """ 初始化
         """
 
+    kline_windows = {} #回测模式或者数据矩阵模式下每个(exchange, symbol)的K线滑动窗口缓存
+    last_kline_oneday = {} #回测模式或者数据矩阵模式下get_last_kline_oneday的查询结果缓存
+    last_kline_oneday_stats = {"hits": 0, "misses": 0}
+    latency = defaultdict(lambda:{"calls": 0, "total": 0.0, "max": 0.0}) #跨线程调用的耗时统计(毫秒),按函数名分类
+
     def contextswitch(fn):
         """
         装饰器函数
@@ -33,12 +41,32 @@ class ModelAPI:
             #如果是回测模式或者数据矩阵模式,并且当前线程不是主线程
             if (config.backtest or config.datamatrix) and threading.current_thread() != threading.main_thread():
                 from quant.quant import quant
+                begin = time.perf_counter()
                 future = asyncio.run_coroutine_threadsafe(fn(*args, **kwargs), quant.get_event_loop())
-                return future.result()
+                #不能直接调用future.result(),那样会阻塞工作线程的整个事件循环,策略的定时器等其他任务都会停下来等待数据库返回
+                result = await asyncio.wrap_future(future)
+                cost = (time.perf_counter() - begin) * 1000
+                stat = ModelAPI.latency[fn.__name__]
+                stat["calls"] += 1
+                stat["total"] += cost
+                stat["max"] = max(stat["max"], cost)
+                return result
             else:
                 return await fn(*args, **kwargs)
         return wrap
 
+    @staticmethod
+    def latency_stats():
+        """ 获取回测模式或者数据矩阵模式下每个数据查询函数跨线程调用的耗时统计
+
+        Returns:
+            {函数名: {"calls": 调用次数, "total": 总耗时(毫秒), "avg": 平均耗时(毫秒), "max": 最大耗时(毫秒)}}
+        """
+        result = {}
+        for name, stat in ModelAPI.latency.items():
+            result[name] = dict(stat, avg=stat["total"]/stat["calls"] if stat["calls"] else 0.0)
+        return result
+
     @staticmethod
     def today():
         """ 获取今天datetime
@@ -127,108 +155,169 @@ class ModelAPI:
 
     @staticmethod
     @contextswitch
-    async def get_kline_by_time(exchange, symbol, epoch_millisecond, tolerance_millisecond=0, kline_horizon=None):
+    async def get_kline_by_time(exchange, symbol, epoch_millisecond, tolerance_millisecond=0, kline_horizon=None, fields=None):
         """ 根据给定symbol，给定kline horizon，比如1min或者5min，给定毫秒时间，容忍毫秒数，找到kline
         """
-        return await InfraAPI.get_kline_by_time(exchange, symbol, epoch_millisecond, tolerance_millisecond, kline_horizon)
+        return await InfraAPI.get_kline_by_time(exchange, symbol, epoch_millisecond, tolerance_millisecond, kline_horizon, fields)
 
     @staticmethod
     @contextswitch
-    async def get_klines_between(exchange, symbol, begin_epoch_millisecond, end_epoch_millisecond, kline_horizon=None):
+    async def get_klines_between(exchange, symbol, begin_epoch_millisecond, end_epoch_millisecond, kline_horizon=None, fields=None):
         """ 根据给定symbol，给定kline horizon，比如1min或者5min，给定起始毫秒，结束毫秒，找到所有kline列表
         """
-        return await InfraAPI.get_klines_between(exchange, symbol, begin_epoch_millisecond, end_epoch_millisecond, kline_horizon)
+        return await InfraAPI.get_klines_between(exchange, symbol, begin_epoch_millisecond, end_epoch_millisecond, kline_horizon, fields)
 
     @staticmethod
     @contextswitch
-    async def get_prev_klines(exchange, symbol, epoch_millisecond, n, kline_horizon=None):
+    async def get_daily_closes(exchange, symbol, begin_epoch_millisecond, end_epoch_millisecond):
+        """ 根据给定symbol，给定起始毫秒，结束毫秒，找到每天的收盘价列表(数据库端聚合)
+        """
+        return await InfraAPI.get_daily_closes(exchange, symbol, begin_epoch_millisecond, end_epoch_millisecond)
+
+    @staticmethod
+    def _get_kline_window(exchange, symbol, kline_horizon):
+        """ 回测模式或者数据矩阵模式下(历史数据不会再变化)获取K线滑动窗口缓存,其他模式返回None
+        """
+        if not (config.backtest or config.datamatrix) or kline_horizon:
+            return None
+        key = (exchange, symbol)
+        if key not in ModelAPI.kline_windows:
+            prefetch = int(HistoryAdapter.option("kline_window_prefetch", 1000))
+            fetch_prev = lambda ts, n: ModelAPI._get_prev_klines(exchange, symbol, ts, n)
+            fetch_next = lambda ts, n: ModelAPI._get_next_klines(exchange, symbol, ts, n)
+            ModelAPI.kline_windows[key] = KlineWindow(fetch_prev, fetch_next, prefetch, max(10000, prefetch*4))
+        return ModelAPI.kline_windows[key]
+
+    @staticmethod
+    def kline_cache_stats():
+        """ 获取K线缓存命中统计
+
+        Returns:
+            {"window": {(exchange, symbol): {"hits": 命中次数, "misses": 未命中次数}}, "last_kline_oneday": {"hits": ..., "misses": ...}}
+        """
+        window = {k: {"hits": w.hits, "misses": w.misses} for k, w in ModelAPI.kline_windows.items()}
+        return {"window": window, "last_kline_oneday": dict(ModelAPI.last_kline_oneday_stats)}
+
+    @staticmethod
+    async def get_prev_klines(exchange, symbol, epoch_millisecond, n, kline_horizon=None, fields=None):
         """ 根据当前毫秒数，给定kline horizon，往过去load若干根kline
         """
-        return await InfraAPI.get_prev_klines(exchange, symbol, epoch_millisecond, n, kline_horizon)
+        window = None if fields else ModelAPI._get_kline_window(exchange, symbol, kline_horizon) #只读取部分字段时不经过滑动窗口缓存
+        if window:
+            return await window.prev(epoch_millisecond, n)
+        return await ModelAPI._get_prev_klines(exchange, symbol, epoch_millisecond, n, kline_horizon, fields)
 
     @staticmethod
-    @contextswitch
-    async def get_next_klines(exchange, symbol, epoch_millisecond, n, kline_horizon=None):
+    async def get_next_klines(exchange, symbol, epoch_millisecond, n, kline_horizon=None, fields=None):
         """ 根据当前毫秒数，给定kline horizon，往未来load若干根kline
         """
-        return await InfraAPI.get_next_klines(exchange, symbol, epoch_millisecond, n, kline_horizon)
+        window = None if fields else ModelAPI._get_kline_window(exchange, symbol, kline_horizon) #只读取部分字段时不经过滑动窗口缓存
+        if window:
+            return await window.next(epoch_millisecond, n)
+        return await ModelAPI._get_next_klines(exchange, symbol, epoch_millisecond, n, kline_horizon, fields)
+
+    @staticmethod
+    @contextswitch
+    async def _get_prev_klines(exchange, symbol, epoch_millisecond, n, kline_horizon=None, fields=None):
+        return await InfraAPI.get_prev_klines(exchange, symbol, epoch_millisecond, n, kline_horizon, fields)
 
     @staticmethod
     @contextswitch
-    async def get_last_kline_oneday(exchange, symbol, date, kline_horizon=None):
+    async def _get_next_klines(exchange, symbol, epoch_millisecond, n, kline_horizon=None, fields=None):
+        return await InfraAPI.get_next_klines(exchange, symbol, epoch_millisecond, n, kline_horizon, fields)
+
+    @staticmethod
+    async def get_last_kline_oneday(exchange, symbol, date, kline_horizon=None, fields=None):
         """ 给定日期，给定kline horizon，找到当天的最后一根kline
         """
-        return await InfraAPI.get_last_kline_oneday(exchange, symbol, date, kline_horizon)
+        if not (config.backtest or config.datamatrix):
+            return await ModelAPI._get_last_kline_oneday(exchange, symbol, date, kline_horizon, fields)
+        #历史数据不会再变化,同一天的查询结果缓存起来
+        key = (exchange, symbol, date.date(), kline_horizon, tuple(fields) if fields else None)
+        if key in ModelAPI.last_kline_oneday:
+            ModelAPI.last_kline_oneday_stats["hits"] += 1
+            return dict(ModelAPI.last_kline_oneday[key]) #返回副本,调用者修改结果不会影响缓存
+        ModelAPI.last_kline_oneday_stats["misses"] += 1
+        s = await ModelAPI._get_last_kline_oneday(exchange, symbol, date, kline_horizon, fields)
+        if s is None:
+            return None
+        ModelAPI.last_kline_oneday[key] = s
+        return dict(s)
+
+    @staticmethod
+    @contextswitch
+    async def _get_last_kline_oneday(exchange, symbol, date, kline_horizon=None, fields=None):
+        return await InfraAPI.get_last_kline_oneday(exchange, symbol, date, kline_horizon, fields)
 
     @staticmethod
     @contextswitch
-    async def get_trade_by_time(exchange, symbol, epoch_millisecond, tolerance_millisecond):
+    async def get_trade_by_time(exchange, symbol, epoch_millisecond, tolerance_millisecond, fields=None):
         """ 根据给定symbol，给定毫秒时间，容忍毫秒数，找到trade
         """
-        return await InfraAPI.get_trade_by_time(exchange, symbol, epoch_millisecond, tolerance_millisecond)
+        return await InfraAPI.get_trade_by_time(exchange, symbol, epoch_millisecond, tolerance_millisecond, fields)
 
     @staticmethod
     @contextswitch
-    async def get_trades_between(exchange, symbol, begin_epoch_millisecond, end_epoch_millisecond):
+    async def get_trades_between(exchange, symbol, begin_epoch_millisecond, end_epoch_millisecond, fields=None):
         """ 根据给定symbol，给定起始毫秒，结束毫秒，找到所有trade列表
         """
-        return await InfraAPI.get_trades_between(exchange, symbol, begin_epoch_millisecond, end_epoch_millisecond)
+        return await InfraAPI.get_trades_between(exchange, symbol, begin_epoch_millisecond, end_epoch_millisecond, fields)
 
     @staticmethod
     @contextswitch
-    async def get_prev_trades(exchange, symbol, epoch_millisecond, n):
+    async def get_prev_trades(exchange, symbol, epoch_millisecond, n, fields=None):
         """ 根据当前毫秒数，往过去load若干个trade
         """
-        return await InfraAPI.get_prev_trades(exchange, symbol, epoch_millisecond, n)
+        return await InfraAPI.get_prev_trades(exchange, symbol, epoch_millisecond, n, fields)
 
     @staticmethod
     @contextswitch
-    async def get_next_trades(exchange, symbol, epoch_millisecond, n):
+    async def get_next_trades(exchange, symbol, epoch_millisecond, n, fields=None):
         """ 根据当前毫秒数，往未来load若干个trade
         """
-        return await InfraAPI.get_next_trades(exchange, symbol, epoch_millisecond, n)
+        return await InfraAPI.get_next_trades(exchange, symbol, epoch_millisecond, n, fields)
 
     @staticmethod
     @contextswitch
-    async def get_last_trade_oneday(exchange, symbol, date):
+    async def get_last_trade_oneday(exchange, symbol, date, fields=None):
         """ 给定日期，找到当天的最后一笔trade
         """
-        return await InfraAPI.get_last_trade_oneday(exchange, symbol, date)
+        return await InfraAPI.get_last_trade_oneday(exchange, symbol, date, fields)
 
     @staticmethod
     @contextswitch
-    async def get_orderbook_by_time(exchange, symbol, epoch_millisecond, tolerance_millisecond):
+    async def get_orderbook_by_time(exchange, symbol, epoch_millisecond, tolerance_millisecond, fields=None):
         """ 根据给定symbol，给定毫秒时间，容忍毫秒数，找到orderbook
         """
-        return await InfraAPI.get_orderbook_by_time(exchange, symbol, epoch_millisecond, tolerance_millisecond)
+        return await InfraAPI.get_orderbook_by_time(exchange, symbol, epoch_millisecond, tolerance_millisecond, fields)
 
     @staticmethod
     @contextswitch
-    async def get_orderbooks_between(exchange, symbol, begin_epoch_millisecond, end_epoch_millisecond):
+    async def get_orderbooks_between(exchange, symbol, begin_epoch_millisecond, end_epoch_millisecond, fields=None):
         """ 根据给定symbol，给定起始毫秒，结束毫秒，找到所有orderbook列表
         """
-        return await InfraAPI.get_orderbooks_between(exchange, symbol, begin_epoch_millisecond, end_epoch_millisecond)
+        return await InfraAPI.get_orderbooks_between(exchange, symbol, begin_epoch_millisecond, end_epoch_millisecond, fields)
 
     @staticmethod
     @contextswitch
-    async def get_prev_orderbooks(exchange, symbol, epoch_millisecond, n):
+    async def get_prev_orderbooks(exchange, symbol, epoch_millisecond, n, fields=None):
         """ 根据当前毫秒数，往过去load若干个orderbook
         """
-        return await InfraAPI.get_prev_orderbooks(exchange, symbol, epoch_millisecond, n)
+        return await InfraAPI.get_prev_orderbooks(exchange, symbol, epoch_millisecond, n, fields)
 
     @staticmethod
     @contextswitch
-    async def get_next_orderbooks(exchange, symbol, epoch_millisecond, n):
+    async def get_next_orderbooks(exchange, symbol, epoch_millisecond, n, fields=None):
         """ 根据当前毫秒数，往未来load若干个orderbook
         """
-        return await InfraAPI.get_next_orderbooks(exchange, symbol, epoch_millisecond, n)
+        return await InfraAPI.get_next_orderbooks(exchange, symbol, epoch_millisecond, n, fields)
 
     @staticmethod
     @contextswitch
-    async def get_last_orderbook_oneday(exchange, symbol, date):
+    async def get_last_orderbook_oneday(exchange, symbol, date, fields=None):
         """ 给定日期，找到当天的最后一个orderbook
         """
-        return await InfraAPI.get_last_orderbook_oneday(exchange, symbol, date)
+        return await InfraAPI.get_last_orderbook_oneday(exchange, symbol, date, fields)
 
     @staticmethod
     async def get_lead_ret_between_klines(exchange, symbol, kline1, kline2):
@@ -0,0 +1,91 @@
+# -*- coding:utf-8 -*-
+
+"""
+回测账户资产账本
+
+Project: alphahunter
+Author: HJQuant
+Description: Asynchronous driven quantitative trading framework
+"""
+
+from collections import defaultdict
+from decimal import Decimal
+
+
+DEFAULT_UNIT = 1e-8 #没有指定记账单位的币种使用的最小单位
+
+
+def decimals(tick):
+    """ 精度的小数位数, decimals(0.0001) -> 4
+    """
+    return max(0, -Decimal(str(tick)).as_tuple().exponent)
+
+
+class Ledger:
+    """ 回测账户资产账本.
+
+    每个币种的可用数量和冻结数量都保存为整数个记账单位(现货'货'为size_tick,'钱'为value_tick),
+    撮合引擎结算时只做整数加减,不会累积浮点误差,也不需要每次都用tools.nearest取整.
+    只有通知上层策略时(snapshot)才转换为浮点数.
+
+    Attributes:
+        free: 可用数量 {currency: 整数个记账单位}
+        locked: 冻结数量 {currency: 整数个记账单位}
+        unit: 记账单位 {currency: 单位}
+        scale: 记账单位的倒数 {currency: 1/单位},浮点数乘以scale取整就是记账单位个数
+    """
+
+    def __init__(self):
+        """ 初始化
+        """
+        self.free = defaultdict(int)
+        self.locked = defaultdict(int)
+        self.unit = {}
+        self.scale = {}
+        self._digits = {}
+        self._provisional = set() #还没有撮合引擎指定记账单位的币种
+
+    def add_unit(self, currency, unit):
+        """ 指定币种的记账单位,多个交易对使用同一个币种时取最小的单位,已有的余额按新单位换算
+        """
+        old = self.unit.get(currency)
+        if old is not None and currency not in self._provisional and old <= unit:
+            return
+        self._provisional.discard(currency)
+        self.unit[currency] = unit
+        self.scale[currency] = 1 / unit
+        self._digits[currency] = decimals(unit)
+        if old is not None and old != unit:
+            k = old / unit
+            self.free[currency] = round(self.free[currency] * k)
+            self.locked[currency] = round(self.locked[currency] * k)
+
+    def to_units(self, currency, amount):
+        """ 浮点数换算为整数个记账单位
+        """
+        if currency not in self.unit:
+            self.add_unit(currency, DEFAULT_UNIT)
+            self._provisional.add(currency)
+        return round(amount * self.scale[currency])
+
+    def to_float(self, currency, n):
+        """ 整数个记账单位换算为浮点数
+        """
+        return round(n * self.unit[currency], self._digits[currency])
+
+    def deposit(self, currency, amount):
+        """ 增加可用数量,用于初始资产
+        """
+        self.free[currency] += self.to_units(currency, amount)
+
+    def entry(self, currency):
+        """ 某个币种的资产,转换为Asset使用的格式 {"free": , "locked": , "total": }
+        """
+        free = self.free[currency]
+        locked = self.locked[currency]
+        return {"free": self.to_float(currency, free), "locked": self.to_float(currency, locked), "total": self.to_float(currency, free + locked)}
+
+    def snapshot(self):
+        """ 全部币种的资产,转换为Asset使用的格式 {currency: {"free": , "locked": , "total": }}
+        """
+        return {c: self.entry(c) for c in self.unit}
@@ -0,0 +1,272 @@
+# -*- coding:utf-8 -*-
+
+"""
+回测撮合引擎使用的订单薄数据结构
+
+Project: alphahunter
+Author: HJQuant
+Description: Asynchronous driven quantitative trading framework
+"""
+
+import heapq
+
+import numpy as np
+
+from quant.order import ORDER_ACTION_BUY, ORDER_ACTION_SELL
+
+
+class MarketDepth:
+    """ 撮合引擎看到的市场订单薄.
+
+    回放订单薄时档位直接引用数据块里的二维数组(HistoryBlock.depth),每次更新只需要记录数组和行号,
+    不需要为每条订单薄生成python列表.只有主动成交或者估计排队位置时才需要档位数据,
+    这时才把整个数据块的档位一次性转换为整数价格档位和数量列表,之后每条订单薄直接按行号取用.
+    同一条订单薄上自己主动成交吃掉的数量记录在consumed中,下一条订单薄到来之前不会被重复吃掉.
+
+    Args:
+        price_tick: 价格变动最小精度
+    """
+
+    def __init__(self, price_tick):
+        """ 初始化
+        """
+        self._price_tick = price_tick
+        self._arrays = None #(ask_price, ask_size, bid_price, bid_size)
+        self._i = 0 #当前订单薄在数组中的行号
+        self._best_ask = None #每行第一档价格,每个数据块只转换一次
+        self._best_bid = None
+        self._rows = None #{side: (价格列表, 整数价格档位列表, 数量列表, 有效档位数列表)},需要时才转换
+        self._consumed = {} #{(side, tick): 已经吃掉的数量}
+
+    @property
+    def ready(self):
+        return self._arrays is not None
+
+    def tick(self, price):
+        """ 价格转换为整数档位,用于价格比较和字典键
+        """
+        return int(round(price / self._price_tick))
+
+    def update(self, arrays, i):
+        """ 更新为arrays中第i条订单薄
+        """
+        if arrays is not self._arrays:
+            self._arrays = arrays
+            self._best_ask = arrays[0][:, 0].tolist()
+            self._best_bid = arrays[2][:, 0].tolist()
+            self._rows = None
+        self._i = i
+        if self._consumed:
+            self._consumed = {}
+
+    def update_from_orderbook(self, orderbook):
+        """ 通过Orderbook对象更新
+        """
+        asks = np.array(orderbook.asks, dtype=float).reshape(-1, 2)
+        bids = np.array(orderbook.bids, dtype=float).reshape(-1, 2)
+        self.update((asks[:, 0][None], asks[:, 1][None], bids[:, 0][None], bids[:, 1][None]), 0)
+
+    @property
+    def best_ask(self):
+        p = self._best_ask[self._i]
+        return p if p > 0 else None #空档位为nan或者0
+
+    @property
+    def best_bid(self):
+        p = self._best_bid[self._i]
+        return p if p > 0 else None
+
+    def _side_rows(self, side):
+        """ 某一边整个数据块的档位列表
+        """
+        if self._rows is None:
+            self._rows = {}
+        rows = self._rows.get(side)
+        if rows is None:
+            k = 0 if side == ORDER_ACTION_SELL else 2
+            price, size = self._arrays[k], self._arrays[k+1]
+            with np.errstate(invalid="ignore"):
+                valid = (price > 0) & (size > 0)
+            #有效档位都在前面,遇到第一个无效档位就结束
+            count = np.where(valid.all(axis=1), valid.shape[1], np.argmin(valid, axis=1))
+            ticks = np.rint(np.where(valid, price, 0) / self._price_tick).astype(np.int64)
+            rows = (price.tolist(), ticks.tolist(), np.where(valid, size, 0).tolist(), count.tolist())
+            self._rows[side] = rows
+        return rows
+
+    def levels(self, side):
+        """ 某一边的有效档位[(price, size), ...],已经扣除自己吃掉的数量
+
+        Args:
+            side: ORDER_ACTION_SELL为卖盘(asks), ORDER_ACTION_BUY为买盘(bids)
+        """
+        price, ticks, size, count = self._side_rows(side)
+        i = self._i
+        n = count[i]
+        if not self._consumed:
+            return list(zip(price[i][:n], size[i][:n]))
+        return [(p, s - self._consumed.get((side, t), 0)) for p, t, s in zip(price[i][:n], ticks[i][:n], size[i][:n])]
+
+    def consume(self, side, price, quantity):
+        """ 记录自己主动成交吃掉的数量
+        """
+        key = (side, self.tick(price))
+        self._consumed[key] = self._consumed.get(key, 0) + quantity
+
+    def row(self, side):
+        """ 某一边当前订单薄 (整数价格档位列表, 数量列表, 有效档位数)
+        """
+        price, ticks, size, count = self._side_rows(side)
+        i = self._i
+        return ticks[i], size[i], count[i]
+
+    def size_at(self, side, price):
+        """ 某一边某个价格上显示的挂单量,价格优于最优价或者在档位之间空缺时为0,超出显示的档位范围时为None
+        """
+        ticks, sizes, n = self.row(side)
+        if n == 0:
+            return 0
+        t = self.tick(price)
+        sign = 1 if side == ORDER_ACTION_BUY else -1 #买盘价格从高到低,卖盘价格从低到高
+        if sign*t > sign*ticks[0]: #价格优于最优价
+            return 0
+        if sign*t < sign*ticks[n-1]: #超出显示的档位范围
+            return None
+        if t in ticks: #档位之间空缺时为0
+            return sizes[ticks.index(t, 0, n)]
+        return 0
+
+
+class RestingOrders:
+    """ 自己挂在订单薄上还没有成交的订单.
+
+    买单和卖单分别保存在按价格排序的堆中,撮合时只需要取出价格能够成交的订单,撤销的订单延迟删除.
+    同时按价格档位记录每个订单前面还有多少排队数量(queue ahead),订单薄驱动和逐笔成交驱动时用来估计订单什么时候轮到成交.
+
+    Args:
+        price_tick: 价格变动最小精度
+    """
+
+    def __init__(self, price_tick):
+        """ 初始化
+        """
+        self._price_tick = price_tick
+        self.orders = {} #订单列表 {order_no: order}
+        self._bids = [] #买单堆,元素为(-价格, 下单序号, 订单号),价格最高的在堆顶
+        self._asks = [] #卖单堆,元素为(价格, 下单序号, 订单号),价格最低的在堆顶
+        self._seq = 0 #下单序号,同时可以成交的订单按下单先后顺序成交
+        self.levels = {ORDER_ACTION_BUY: {}, ORDER_ACTION_SELL: {}} #{action: {tick: {order_no: 排在前面的数量}}}
+
+    def __len__(self):
+        return len(self.orders)
+
+    def tick(self, price):
+        return int(round(price / self._price_tick))
+
+    def add(self, order, ahead=0):
+        """ 订单进入订单薄
+
+        Args:
+            order: 订单
+            ahead: 同一价格上排在这个订单前面的数量,未知时为inf
+        """
+        self.orders[order.order_no] = order
+        self._seq += 1
+        if order.action == ORDER_ACTION_BUY:
+            heapq.heappush(self._bids, (-order.price, self._seq, order.order_no))
+        else:
+            heapq.heappush(self._asks, (order.price, self._seq, order.order_no))
+        self.levels[order.action].setdefault(self.tick(order.price), {})[order.order_no] = ahead
+
+    def remove(self, order_no):
+        """ 订单离开订单薄(成交或者撤销),堆中的元素延迟删除
+        """
+        o = self.orders.pop(order_no, None)
+        if not o:
+            return None
+        levels = self.levels[o.action]
+        t = self.tick(o.price)
+        level = levels.get(t)
+        if level is not None:
+            level.pop(order_no, None)
+            if not level:
+                del levels[t]
+        if len(self._bids) + len(self._asks) > 2 * len(self.orders) + 64:
+            self._compact()
+        return o
+
+    def _compact(self):
+        """ 已删除的订单太多时重建买卖堆,避免堆无限增长
+        """
+        self._bids = [e for e in self._bids if e[2] in self.orders]
+        self._asks = [e for e in self._asks if e[2] in self.orders]
+        heapq.heapify(self._bids)
+        heapq.heapify(self._asks)
+
+    def pop_crossed(self, bid_price=None, ask_price=None, strict=False):
+        """ 取出价格能够成交的订单,按下单先后顺序返回
+
+        Args:
+            bid_price: 价格不低于bid_price的买单可以成交,None表示不检查买单
+            ask_price: 价格不高于ask_price的卖单可以成交,None表示不检查卖单
+            strict: 为True时价格必须严格优于bid_price/ask_price
+        """
+        crossed = []
+        if bid_price is not None:
+            while self._bids and (-self._bids[0][0] > bid_price or (not strict and -self._bids[0][0] == bid_price)):
+                _, seq, order_no = heapq.heappop(self._bids)
+                if order_no in self.orders: #已经删除的订单直接丢弃
+                    crossed.append((seq, order_no))
+        if ask_price is not None:
+            while self._asks and (self._asks[0][0] < ask_price or (not strict and self._asks[0][0] == ask_price)):
+                _, seq, order_no = heapq.heappop(self._asks)
+                if order_no in self.orders:
+                    crossed.append((seq, order_no))
+        crossed.sort()
+        return [self.orders[order_no] for _, order_no in crossed]
+
+    def update_queue(self, depth):
+        """ 订单薄更新以后重新估计排队位置: 排在前面的数量不会超过这个价格上当前显示的挂单量
+        """
+        for action in (ORDER_ACTION_BUY, ORDER_ACTION_SELL):
+            levels = self.levels[action]
+            if not levels:
+                continue
+            ticks, sizes, n = depth.row(action)
+            sign = 1 if action == ORDER_ACTION_BUY else -1 #买盘价格从高到低,卖盘价格从低到高
+            best = sign*ticks[0] if n else None
+            worst = sign*ticks[n-1] if n else None
+            for t, level in levels.items():
+                if best is None or sign*t > best: #价格优于最优价,排在最前面
+                    size = 0
+                elif sign*t < worst: #超出显示的档位范围,无法判断
+                    continue
+                elif t in ticks: #档位之间空缺时为0
+                    size = sizes[ticks.index(t, 0, n)]
+                else:
+                    size = 0
+                for order_no, ahead in level.items():
+                    if ahead > size:
+                        level[order_no] = size
+
+    def consume_queue(self, action, price, quantity):
+        """ 在price上成交了quantity,先消耗排在前面的数量,返回[(订单, 可以成交的数量), ...]
+        """
+        level = self.levels[action].get(self.tick(price))
+        if not level:
+            return []
+        result = []
+        for order_no, ahead in list(level.items()): #同一价格按下单先后顺序排队
+            if quantity <= 0:
+                break
+            if ahead >= quantity:
+                level[order_no] = ahead - quantity
+                quantity = 0
+                break
+            quantity -= ahead
+            level[order_no] = 0
+            o = self.orders[order_no]
+            filled = min(o.remain, quantity)
+            quantity -= filled
+            result.append((o, filled))
+        return result
@@ -0,0 +1,164 @@
+# -*- coding:utf-8 -*-
+
+"""
+回测过程中实时计算的业绩指标
+
+Project: alphahunter
+Author: HJQuant
+Description: Asynchronous driven quantitative trading framework
+"""
+
+import math
+
+from quant.order import Fill, ORDER_ACTION_BUY
+
+
+ONE_MIN = 60*1000
+ONE_DAY = 24*60*60*1000
+CHINA_TZONE_SHIFT = 8*60*60*1000
+
+
+class OnlineMetrics:
+    """ 回测过程中增量更新的业绩指标,和Analyzer使用相同的盈亏算法(结算币种计价,不需要成交列表和每日收盘价).
+
+    每个交易对记录累计净成交额,累计净成交量和手续费,盈亏 = 累计净成交额 + 合约乘数*累计净成交量*最新价格 - 累计手续费,
+    反向合约按币本位计算.行情更新时只记录最新价格,最多每分钟(K线精度)计算一次权益,同时更新最大回撤,
+    每天结束时把日收益率累加到均值和方差中(Welford算法),随时可以通过snapshot查询.
+    所有交易对的结算币种必须相同,不同结算币种的交易对分别使用各自的OnlineMetrics.
+    现货交易对初始持有的基础币种在收到第一个价格时按这个价格计入初始资金,之后和买入的持仓一样按最新价格计算盈亏.
+
+    Args:
+        init_balance: 初始资金(结算币种)
+        syminfo: 交易对信息 {symbol: BACKTEST.feature.syminfo中的配置}
+        init_holdings: 现货交易对初始持有的基础币种数量 {symbol: 数量}
+    """
+
+    def __init__(self, init_balance, syminfo, init_holdings=None):
+        """ 初始化
+        """
+        self.init_balance = init_balance
+        self._holdings = {sym: v for sym, v in (init_holdings or {}).items() if v} #还没有收到价格的初始持仓
+        self._params = {} #{symbol: (是否现货, 合约乘数, 是否反向合约)}
+        for sym, info in syminfo.items():
+            is_spot = info["type"] == "spot"
+            mult = 1 if is_spot else info["contract_size"]
+            self._params[sym] = (is_spot, mult, (not is_spot) and info.get("is_inverse", False))
+        self._net_turnover = dict.fromkeys(syminfo, 0.0) #累计净成交额
+        self._net_volume = dict.fromkeys(syminfo, 0.0) #累计净成交量
+        self._price = {} #最新价格
+        self.commission = 0.0 #累计手续费
+        self.turnover = 0.0 #累计成交额
+        self.trades = 0 #成交次数
+        self.equity = init_balance #最新权益
+        self.peak = init_balance #权益最高点
+        self.max_drawdown = 0.0 #最大回撤(比例)
+        self._minute = None
+        self._day = None
+        self._day_open = init_balance #当天开始时的权益
+        self._n = 0 #已经结束的天数
+        self._mean = 0.0 #日收益率均值
+        self._m2 = 0.0 #日收益率离差平方和
+
+    def on_fill(self, fill: Fill):
+        """ 成交更新
+        """
+        is_spot, mult, is_inverse = self._params[fill.symbol]
+        direction = 1 if fill.side == ORDER_ACTION_BUY else -1
+        if is_inverse:
+            turnover = mult * fill.quantity / fill.price
+            self._net_turnover[fill.symbol] += direction * turnover #币本位:买入时记正的币数,按最新价格扣回
+        else:
+            turnover = mult * fill.quantity * fill.price
+            self._net_turnover[fill.symbol] -= direction * turnover
+        self._net_volume[fill.symbol] += direction * fill.quantity
+        #现货买入手续费扣的是'货',统一成'钱'
+        self.commission += fill.fee * fill.price if is_spot and direction == 1 else fill.fee
+        self.turnover += turnover
+        self.trades += 1
+
+    def on_price(self, symbol, price, ts):
+        """ 行情更新,进入新的一分钟时计算一次权益
+        """
+        if not price or symbol not in self._params:
+            return
+        self._price[symbol] = price
+        if symbol in self._holdings: #初始持仓按第一个价格计入初始资金
+            volume = self._holdings.pop(symbol)
+            value = volume * price
+            self._net_volume[symbol] += volume
+            self._net_turnover[symbol] -= value
+            self.init_balance += value
+            self.equity += value
+            self.peak += value
+            self._day_open += value
+        minute = ts // ONE_MIN
+        if minute != self._minute:
+            self._minute = minute
+            self.update(ts)
+
+    def update(self, ts):
+        """ 按最新价格计算权益,更新回撤和日收益率
+        """
+        pnl = 0.0
+        for sym, (is_spot, mult, is_inverse) in self._params.items():
+            price = self._price.get(sym)
+            if price is None:
+                continue
+            if is_inverse:
+                pnl += self._net_turnover[sym] - mult * self._net_volume[sym] / price
+            else:
+                pnl += self._net_turnover[sym] + mult * self._net_volume[sym] * price
+        self.equity = self.init_balance + pnl - self.commission
+        if self.equity > self.peak:
+            self.peak = self.equity
+        elif self.peak > 0:
+            self.max_drawdown = max(self.max_drawdown, (self.peak - self.equity) / self.peak)
+        day = (ts + CHINA_TZONE_SHIFT) // ONE_DAY
+        if self._day is None:
+            self._day = day
+        elif day != self._day:
+            self._add_return(self._daily_return())
+            self._day = day
+            self._day_open = self.equity
+
+    def _daily_return(self):
+        return self.equity / self._day_open - 1 if self._day_open else 0.0
+
+    def _add_return(self, r):
+        """ Welford算法累加日收益率
+        """
+        self._n += 1
+        delta = r - self._mean
+        self._mean += delta / self._n
+        self._m2 += delta * (r - self._mean)
+
+    def snapshot(self):
+        """ 当前指标,当天还没有结束的收益率也计算在内
+
+        Returns:
+            {"equity": 权益, "total_pnl": 总盈亏, "commission": 手续费, "turnover": 成交额, "trades": 成交次数,
+             "drawdown": 当前回撤, "max_drawdown": 最大回撤, "days": 天数, "annual_return": 年化收益率,
+             "annual_volatility": 年化波动率, "sharpe": 夏普比率}, 比例都不是百分数
+        """
+        n, mean, m2 = self._n, self._mean, self._m2
+        if self._day is not None: #加上当天的收益率
+            r = self._daily_return()
+            n += 1
+            delta = r - mean
+            mean += delta / n
+            m2 += delta * (r - mean)
+        vol = math.sqrt(m2 / (n - 1) * 365) if n > 1 else 0.0
+        annual_return = mean * 365
+        return {
+            "equity": self.equity,
+            "total_pnl": self.equity - self.init_balance,
+            "commission": self.commission,
+            "turnover": self.turnover,
+            "trades": self.trades,
+            "drawdown": (self.peak - self.equity) / self.peak if self.peak > 0 else 0.0,
+            "max_drawdown": self.max_drawdown,
+            "days": n,
+            "annual_return": annual_return,
+            "annual_volatility": vol,
+            "sharpe": annual_return / vol if vol > 0 else 0.0
+        }
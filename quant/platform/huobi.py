@@ -1021,11 +1021,13 @@ class HuobiTrader(Websocket, ExchangeGateway):
         """
         tm = msg["ts"]
         account_info = msg["data"]
+        changes = {}
         for d in account_info["list"]:
             b = d["balance"]
             c = d["currency"]
             self._assets[c]["free"] = float(b)
-        ast = Asset(self._platform, self._account, self._assets, tm, True)
+            changes[c] = self._assets[c]
+        ast = Asset(self._platform, self._account, self._assets, tm, True, changes)
         SingleTask.run(self.cb.on_asset_update_callback, ast)
 
     @staticmethod
@@ -1160,6 +1160,7 @@ class HuobiFutureTrader(Websocket, ExchangeGateway):
             SingleTask.run(self.cb.on_position_update_callback, pos)
 
     def _convert_asset_format(self, data):
+        changes = {}
         for d in data["data"]:
             symbol = d["symbol"]
             total = d["margin_balance"]
@@ -1170,6 +1171,7 @@ class HuobiFutureTrader(Websocket, ExchangeGateway):
                 "free": free,
                 "locked": locked
             }
+            changes[symbol] = self._assets[symbol]
             #========================================================
             #查看此币种下是否有要处理的仓位
             #火币的爆仓价格是在资产通知里面,所以要在每次资产通知来的时候,填充仓位的爆仓价格
@@ -1183,7 +1185,7 @@ class HuobiFutureTrader(Websocket, ExchangeGateway):
                         pos.short_liquid_price = d["liquidation_price"]
             #========================================================
         timestamp = data["ts"]
-        ast = Asset(self._platform, self._account, self._assets, timestamp, True)
+        ast = Asset(self._platform, self._account, self._assets, timestamp, True, changes)
         return ast
 
     def _update_asset(self, data):
@@ -754,12 +754,14 @@ class OKExTrader(Websocket, ExchangeGateway):
             self._update_asset(msg["data"])
 
     def _convert_asset_format(self, data):
+        changes = {}
         for d in data:
             c = d["currency"]
             self._assets[c]["free"] = float(d["available"])
             self._assets[c]["locked"] = float(d["hold"])
             self._assets[c]["total"] = float(d["balance"])
-        return Asset(self._platform, self._account, self._assets, tools.get_cur_timestamp_ms(), True)
+            changes[c] = self._assets[c]
+        return Asset(self._platform, self._account, self._assets, tools.get_cur_timestamp_ms(), True, changes)
     
     def _update_asset(self, data):
         ast = self._convert_asset_format(data)
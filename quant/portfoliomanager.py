@@ -8,95 +8,191 @@ Author: HJQuant
 Description: Asynchronous driven quantitative trading framework
 """
 
-import hashlib
-from typing import DefaultDict, Dict
-from collections import defaultdict
+import os
+import json
+from typing import DefaultDict, Dict, Tuple
+from collections import defaultdict, OrderedDict
 
+from quant.config import config
 from quant.asset import Asset
 from quant.position import Position
 from quant.order import Order, Fill
+from quant.order import ORDER_STATUS_FILLED, ORDER_STATUS_CANCELED, ORDER_STATUS_FAILED
 
 
-def sha256(s):
-    """
+ORDER_STATUS_TERMINAL = (ORDER_STATUS_FILLED, ORDER_STATUS_CANCELED, ORDER_STATUS_FAILED) #已经结束的订单状态
+
+
+class ArchiveStore(object):
+    """ 追加写入的订单和成交归档文件,每个交易对一个目录{path}/{platform}/{account}/{symbol}/,每行一条json记录(orders.jsonl, fills.jsonl)
+
+    Args:
+        path: 归档目录
     """
-    x = hashlib.sha256()
-    x.update(s.encode())
-    return x.hexdigest()
+
+    def __init__(self, path):
+        """ 初始化
+        """
+        os.makedirs(path, exist_ok=True)
+        self._path = path
+        self._files = {} #{(kind, platform, account, symbol): 打开的文件}
+
+    def _file_path(self, kind, platform, account, symbol):
+        """ 某个交易对的归档文件
+        """
+        names = [str(x).replace("/", "_") for x in (platform, account, symbol)] #交易对可能包含'/'
+        return os.path.join(self._path, *names, kind + ".jsonl")
+
+    def append(self, kind, obj):
+        """ 追加一条记录
+        """
+        key = (kind, obj.platform, obj.account, obj.symbol)
+        f = self._files.get(key)
+        if f is None:
+            path = self._file_path(*key)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            f = self._files[key] = open(path, "a")
+        f.write(json.dumps(vars(obj)) + "\n")
+
+    def read(self, kind, platform, account, symbol):
+        """ 读取某个交易对的归档记录
+        """
+        f = self._files.get((kind, platform, account, symbol))
+        if f:
+            f.flush()
+        path = self._file_path(kind, platform, account, symbol)
+        if not os.path.isfile(path):
+            return
+        cls = Order if kind == "orders" else Fill
+        with open(path) as f:
+            for line in f:
+                yield cls(**json.loads(line))
+
+    def close(self):
+        """ 关闭归档文件
+        """
+        for f in self._files.values():
+            f.close()
+        self._files = {}
 
 
 class PortfolioManager(object):
     """策略数据管理器,比如资产,仓位,订单,成交等
+
+    数据按(platform, account)或者(platform, account, symbol)元组索引.未完成的订单单独保存,get_orders只返回未完成的订单.
+    已经结束的订单和成交在内存中只保留最近的一部分(配置文件PORTFOLIO中的max_done_orders, max_fills,每个交易对分别计算),
+    超出的部分写入archive_path目录下的归档文件后从内存中删除,没有配置archive_path时直接丢弃.没有配置PORTFOLIO时全部保留在内存中.
     """
-    
+
     def __init__(self):
         """ 初始化
         """
-        self._assets: DefaultDict[str, Asset] = defaultdict(Asset)
-        self._positions: DefaultDict[str, Position] = defaultdict(Position)
-        self._orders: DefaultDict[str, DefaultDict[str, Order]] = defaultdict(lambda:defaultdict(lambda:None)) #两级字典
-        self._fills: DefaultDict[str, DefaultDict[str, DefaultDict[str, Fill]]] = defaultdict(lambda:defaultdict(lambda:defaultdict(lambda:None))) #三级字典
+        self._assets: Dict[Tuple, Asset] = {}
+        self._positions: Dict[Tuple, Position] = {}
+        self._open_orders: DefaultDict[Tuple, Dict[str, Order]] = defaultdict(dict) #未完成的订单
+        self._done_orders: DefaultDict[Tuple, Dict[str, Order]] = defaultdict(OrderedDict) #已经结束的订单,按结束先后排序
+        self._fills: DefaultDict[Tuple, Dict[str, Dict[str, Fill]]] = defaultdict(OrderedDict) #两级字典,订单按第一次成交先后排序
+        self._fill_count: DefaultDict[Tuple, int] = defaultdict(int) #每个交易对内存中的成交数量
+        cfg = config.portfolio or {}
+        self._max_done_orders = cfg.get("max_done_orders") #每个交易对内存中最多保留多少个已经结束的订单,None为不限制
+        self._max_fills = cfg.get("max_fills") #每个交易对内存中最多保留多少条成交,None为不限制
+        self._archive = ArchiveStore(cfg["archive_path"]) if cfg.get("archive_path") else None
 
     def on_asset_update(self, asset: Asset):
-        """资产变化
+        """资产变化,只有部分币种变化(asset.changes)时和已有的资产列表合并成新的资产对象,
+        不修改之前保存的资产对象(策略可能还持有它)
         """
-        key = sha256(asset.platform + asset.account)
-        self._assets[key] = asset
+        key = (asset.platform, asset.account)
+        old = self._assets.get(key)
+        if asset.changes is None or old is None or old.assets is None:
+            self._assets[key] = asset
+        else:
+            assets = dict(old.assets)
+            assets.update(asset.changes)
+            self._assets[key] = Asset(asset.platform, asset.account, assets, asset.timestamp, asset.update)
 
     def on_position_update(self, position: Position):
         """仓位变化
         """
-        key = sha256(position.platform + position.account + position.symbol)
-        self._positions[key] = position
+        self._positions[(position.platform, position.account, position.symbol)] = position
 
     def on_order_update(self, order: Order):
         """订单变化
         """
-        key = sha256(order.platform + order.account + order.symbol)
-        self._orders[key][order.order_no] = order
+        key = (order.platform, order.account, order.symbol)
+        if order.status not in ORDER_STATUS_TERMINAL:
+            self._open_orders[key][order.order_no] = order
+            return
+        self._open_orders[key].pop(order.order_no, None)
+        done = self._done_orders[key]
+        done[order.order_no] = order
+        if self._max_done_orders is not None:
+            while len(done) > self._max_done_orders:
+                _, o = done.popitem(last=False)
+                if self._archive:
+                    self._archive.append("orders", o)
 
     def on_fill_update(self, fill: Fill):
         """订单成交
         """
-        key = sha256(fill.platform + fill.account + fill.symbol)
-        self._fills[key][fill.order_no][fill.fill_no] = fill
-        
+        key = (fill.platform, fill.account, fill.symbol)
+        fills = self._fills[key]
+        d = fills.get(fill.order_no)
+        if d is None:
+            d = fills[fill.order_no] = {}
+        if fill.fill_no not in d:
+            self._fill_count[key] += 1
+        d[fill.fill_no] = fill
+        if self._max_fills is not None:
+            #按订单整体移出最早的成交
+            while self._fill_count[key] > self._max_fills and len(fills) > 1:
+                _, old = fills.popitem(last=False)
+                self._fill_count[key] -= len(old)
+                if self._archive:
+                    for f in old.values():
+                        self._archive.append("fills", f)
+
+    def close(self):
+        """关闭归档文件
+        """
+        if self._archive:
+            self._archive.close()
+
     def get_asset(self, platform, account) -> Asset:
         """从本地获取账户的资产信息
         """
-        key = sha256(platform + account)
-        return self._assets[key]
-        
+        return self._assets.get((platform, account)) or Asset()
+
     def get_position(self, platform, account, symbol) -> Position:
         """从本地获取指定的持仓信息
         """
-        key = sha256(platform + account + symbol)
-        return self._positions[key]
-    
+        return self._positions.get((platform, account, symbol)) or Position()
+
     def get_order(self, platform, account, symbol, order_no) -> Order:
-        """从本地获取指定的挂单信息
+        """从本地获取指定的订单信息,已经移出内存的订单返回None
         """
-        key = sha256(platform + account + symbol)
-        return self._orders[key][order_no]
-    
+        key = (platform, account, symbol)
+        o = self._open_orders[key].get(order_no)
+        if o is None:
+            o = self._done_orders[key].get(order_no)
+        return o
+
     def get_orders(self, platform, account, symbol):
-        """从本地获取某个符号下的所有挂单
+        """从本地获取某个符号下所有未完成的订单
         """
-        key = sha256(platform + account + symbol)
-        d = self._orders[key]
-        return d.values()
+        return self._open_orders[(platform, account, symbol)].values()
 
-    def get_fills_by_order_no(self, platform, account, symbol, order_no) -> DefaultDict[str, Fill]:
-        """从本地获取指定挂单的所有成交
+    def get_fills_by_order_no(self, platform, account, symbol, order_no) -> Dict[str, Fill]:
+        """从本地获取指定订单还保留在内存中的所有成交
         """
-        key = sha256(platform + account + symbol)
-        return self._fills[key][order_no]
+        return self._fills[(platform, account, symbol)].get(order_no, {})
 
     def get_fills_by_symbol(self, platform, account, symbol):
-        """从本地获取指定符号的所有成交
+        """获取指定符号的所有成交,包括已经归档的成交
         """
-        key = sha256(platform + account + symbol)
-        d = self._fills[key]
+        if self._archive:
+            yield from self._archive.read("fills", platform, account, symbol)
+        d = self._fills[(platform, account, symbol)]
         for v in d.values(): #v是一个dict,包含了某一个订单的所有成交(一个订单可以包含多个成交)
             for vv in v.values():
-                yield vv
\ No newline at end of file
+                yield vv
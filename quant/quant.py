@@ -22,6 +22,7 @@ class Quant:
     def __init__(self):
         self.loop = None
         self.event_center = None
+        self._shutdown_cbs = []
 
     def initialize(self, config_module=None):
         """ Initialize.
@@ -40,15 +41,37 @@ class Quant:
         """Start the event loop."""
         def keyboard_interrupt(s, f):
             print("KeyboardInterrupt (ID: {}) has been caught. Cleaning up...".format(s))
-            self.loop.stop()
+            self.loop.call_soon_threadsafe(self.stop)
         signal.signal(signal.SIGINT, keyboard_interrupt)
 
         logger.info("start io loop ...", caller=self)
         self.loop.run_forever()
 
     def stop(self):
-        """Stop the event loop."""
+        """Stop the event loop, registered shutdown callbacks are awaited first."""
         logger.info("stop io loop.", caller=self)
+        if self._shutdown_cbs:
+            self.loop.create_task(self._shutdown())
+        else:
+            self.loop.stop()
+
+    def register_shutdown(self, func, timeout=30):
+        """ Register an asynchronous callback function called before the event loop stops,
+        e.g. writing all queued documents into database.
+
+        Args:
+            func: Asynchronous callback function.
+            timeout: Max seconds to wait for the callback.
+        """
+        self._shutdown_cbs.append((func, timeout))
+
+    async def _shutdown(self):
+        cbs, self._shutdown_cbs = self._shutdown_cbs, []
+        for func, timeout in cbs:
+            try:
+                await asyncio.wait_for(func(), timeout)
+            except Exception as e:
+                logger.error("shutdown callback ERROR:", e, caller=self)
         self.loop.stop()
 
     def get_event_loop(self):
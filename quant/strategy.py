@@ -21,6 +21,7 @@ from quant.asset import Asset
 from quant.position import Position
 from quant.order import Order, Fill, ORDER_TYPE_LIMIT
 from quant.portfoliomanager import PortfolioManager
+from quant.fillstore import FillStore
 from quant.trader import Trader
 from quant.tasks import LoopRunTask, SingleTask
 from quant.utils.mongo import MongoDB
@@ -46,6 +47,14 @@ class Strategy(ExchangeGateway.ICallBack):
         self._just_once = False
         self._interval = 0
         self._pm = PortfolioManager()
+        self._fill_store = None #回测模式下按列记录配置的交易对的所有成交,回测结束时直接交给Analyzer
+        if config.backtest:
+            self._trades_export = config.backtest.get("trades_export", "csv")
+            if self._trades_export not in (None, "", "csv", "parquet"):
+                logger.error("trades_export must be csv or parquet:", self._trades_export, caller=self)
+                raise ValueError("invalid trades_export: {}".format(self._trades_export))
+            keys = [(p["platform"], p["account"], sym) for p in config.platforms for sym in p["symbols"]]
+            self._fill_store = FillStore(keys=keys)
         self._original_on_asset_update_callback = None
         self._original_on_position_update_callback = None
         self._original_on_order_update_callback = None
@@ -54,6 +63,9 @@ class Strategy(ExchangeGateway.ICallBack):
         self._hook_strategy()
         #注册数据库连接状态通知回调
         MongoDB.register_state_callback(self.on_state_update_callback)
+        #停止前关闭订单和成交归档文件(回测完毕,调用stop或者收到退出信号)
+        from quant.quant import quant
+        quant.register_shutdown(self._close_portfolio)
     
     def _hook_strategy(self):
         """Hook策略相应账户各种私有数据的通知回调函数,这样策略执行后,资产,仓位,订单,成交等数据发生变化时,
@@ -103,6 +115,8 @@ class Strategy(ExchangeGateway.ICallBack):
         #并且记录到数据库里面,以后可以按策略分类进行离线分析,生成报表等等功能,这样交易执行程序和策略研究,报表生成等程序之间可以解耦合
         #================
         self._pm.on_fill_update(fill)
+        if self._fill_store is not None:
+            self._fill_store.append(fill)
         await self._original_on_fill_update_callback(fill)
 
     async def _on_state_update_callback(self, state: State, **kwargs):
@@ -420,6 +434,11 @@ class Strategy(ExchangeGateway.ICallBack):
         """
         return await gateway.invalid_indicate(symbol, indicate_type)
     
+    async def _close_portfolio(self):
+        """ 关闭订单和成交归档文件
+        """
+        self._pm.close()
+
     def stop(self):
         """ 停止策略
         """
@@ -449,31 +468,31 @@ class Strategy(ExchangeGateway.ICallBack):
         """ 回测或者数据矩阵工作完毕
         """
         if config.backtest: #回测模式
-            #保存成交列表到csv文件
+            for gw in self._gw_list:
+                metrics = gw.metrics()
+                if metrics:
+                    logger.info("metrics:", metrics, caller=self)
             result_dir_path = os.path.dirname(os.path.abspath(sys.argv[0])) + "/result_report"
-            csv_file = result_dir_path + "/trades.csv"
-            tools.create_dir(csv_file)
-            if os.path.isdir(csv_file) or os.path.ismount(csv_file) or os.path.islink(csv_file):
-                logger.error("无效的csv文件")
-                return
-            if os.path.isfile(csv_file):
-                os.remove(csv_file)
-            result = []
-            for param in config.platforms:
-                platform = param["platform"]
-                account = param["account"]
-                symbols = param["symbols"]
-                for sym in symbols:
-                    fills = self.pm.get_fills_by_symbol(platform, account, sym)
-                    for f in fills:
-                        result.append(vars(f))
-            #保存到csv
-            df = pd.DataFrame(result)
-            df.to_csv(csv_file)
-            #接下来读取csv文件进行分析,生成回测报告
-            analyzer = Analyzer() #回测结果分析器
-            if await analyzer.initialize(file_folder=result_dir_path):
-                analyzer.do_analyze(result_dir=result_dir_path)
+            #成交列表直接交给分析器,另外按配置保存到文件(trades_export: csv/parquet,为空就不保存)
+            trades = self._fill_store.to_dataframe()
+            fmt = self._trades_export
+            if fmt:
+                trades_file = result_dir_path + "/trades." + fmt
+                tools.create_dir(trades_file)
+                if os.path.isdir(trades_file) or os.path.ismount(trades_file) or os.path.islink(trades_file):
+                    logger.error("无效的成交列表文件")
+                    return
+                if os.path.isfile(trades_file):
+                    os.remove(trades_file)
+                if fmt == "parquet":
+                    trades.to_parquet(trades_file, index=False)
+                else:
+                    trades.to_csv(trades_file)
+            #接下来分析成交列表,生成回测报告,只需要实时业绩指标时(report为false)跳过
+            if config.backtest.get("report", True):
+                analyzer = Analyzer() #回测结果分析器
+                if await analyzer.initialize(file_folder=result_dir_path, trades=trades):
+                    analyzer.do_analyze(result_dir=result_dir_path)
             logger.info("回测完毕", caller=self)
             self.stop()
         elif config.datamatrix: #数据矩阵模式
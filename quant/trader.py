@@ -225,10 +225,14 @@ class Trader(ExchangeGateway):
         """ 账户资产更新
         """
         if self.is_upper: #如果币种符号需要转换成大写,就进行转换
-            _assets = defaultdict(lambda: {k: 0.0 for k in {'free', 'locked', 'total'}})
-            for (k, v) in asset.assets.items():
-                _assets[k.upper()] = v
-            asset.assets = _assets
+            def upper(src=asset):
+                _assets = defaultdict(lambda: {k: 0.0 for k in {'free', 'locked', 'total'}})
+                for (k, v) in src.assets.items():
+                    _assets[k.upper()] = v
+                return _assets
+            changes = {k.upper(): v for (k, v) in asset.changes.items()} if asset.changes is not None else None
+            #完整资产列表等到上层策略访问时才转换
+            asset = Asset(asset.platform, asset.account, None, asset.timestamp, asset.update, changes, upper)
         await self._original_on_asset_update_callback(asset)
 
     @property
@@ -387,6 +391,19 @@ class Trader(ExchangeGateway):
         """
         pass
 
+    def metrics(self, currency=None):
+        """ 回测模式下获取实时业绩指标(OnlineMetrics.snapshot),其他模式返回None
+
+        Args:
+            currency: 结算币种,为None时返回所有结算币种的指标{结算币种: 指标}
+        """
+        if not hasattr(self._t, "metrics"):
+            return None
+        if currency:
+            m = self._t.metrics.get(currency)
+            return m.snapshot() if m else None
+        return {c: m.snapshot() for c, m in self._t.metrics.items()}
+
     def csv_write(self, header, row):
         """
         """
@@ -10,8 +10,14 @@ Description: Asynchronous driven quantitative trading framework
 """
 
 import copy
+import time
+import asyncio
+from collections import deque
 
+import numpy as np
 import pymongo
+from pymongo.errors import BulkWriteError, ConnectionFailure, OperationFailure
+from pymongo.write_concern import WriteConcern
 import motor.motor_asyncio
 from bson.objectid import ObjectId
 from urllib.parse import quote_plus
@@ -22,11 +28,14 @@ from quant.tasks import LoopRunTask, SingleTask
 from quant.state import State
 
 
-__all__ = ("MongoDB", )
+__all__ = ("MongoDB", "BulkWriter", )
 
 
 DELETE_FLAG = "delete"  # Delete flag, `True` is deleted, otherwise is not deleted.
 
+# Server error codes of transient failures (primary stepdown, shutdown, network errors), an operation failing with them can be retried.
+RETRYABLE_CODES = {6, 7, 89, 91, 189, 262, 9001, 10107, 11600, 11602, 13435, 13436}
+
 class MongoDB(object):
     """ Create a MongoDB connection cursor.
 
@@ -166,6 +175,69 @@ class MongoDB(object):
             datas.append(item)
         return datas, None
 
+    async def iter_batches(self, spec=None, fields=None, sort=None, batch_size=10000, as_arrays=False, cursor=None):
+        """ Iterate over all matching documents in fixed-size batches, without a total limit.
+
+        Args:
+            spec: Query params, optional.
+            fields: projection params, optional. When `as_arrays` is True, the included field names are the returned columns.
+            sort: A Set() document that defines the sort order of the result set.
+            batch_size: The max documents of one batch, default is 10000.
+            as_arrays: If True, decode every batch into NumPy column arrays {field: np.ndarray}, `_id` is dropped.
+            cursor: Query cursor, default is `self._cursor`.
+
+        Yield:
+            batch: Documents list, or column arrays if `as_arrays` is True.
+
+        NOTE:
+            Raise a `pymongo.errors.PyMongoError` if the connection is lost or the query fails.
+        """
+        if not self._connected:
+            raise pymongo.errors.ConnectionFailure("mongodb connection lost")
+        if not spec:
+            spec = {}
+        if not sort:
+            sort = []
+        if not cursor:
+            cursor = self._cursor
+        if "_id" in spec:
+            spec["_id"] = self._convert_id_object(spec["_id"])
+        spec[DELETE_FLAG] = {"$ne": True}
+        names = None
+        if as_arrays and fields:
+            names = [f for f in fields if f != "_id" and (not isinstance(fields, dict) or fields[f])]
+        result = cursor.find(spec, fields, sort=sort, batch_size=batch_size)
+        while True:
+            docs = await result.to_list(length=batch_size)
+            if not docs:
+                break
+            if as_arrays:
+                if names is None:
+                    names = [k for k in docs[0] if k != "_id"]
+                yield self.to_arrays(docs, names)
+            else:
+                yield docs
+
+    @staticmethod
+    def to_arrays(docs, names):
+        """ Decode documents into NumPy column arrays {name: np.ndarray}.
+            Fields missing in all documents are skipped, otherwise missing fields are None,
+            numeric columns with missing fields are decoded as float with NaN.
+        """
+        columns = {}
+        for name in names:
+            if not any(name in d for d in docs):
+                continue
+            values = [d.get(name) for d in docs]
+            v = np.array(values)
+            if v.dtype == object and any(x is None for x in values):
+                try:
+                    v = np.array([np.nan if x is None else x for x in values], dtype=float)
+                except (TypeError, ValueError):
+                    pass
+            columns[name] = v
+        return columns
+
     @forestall
     async def find_one(self, spec=None, fields=None, sort=None, cursor=None):
         """ Get one document.
@@ -326,6 +398,25 @@ class MongoDB(object):
         result = await cursor.distinct(key, spec)
         return result, None
 
+    @forestall
+    async def aggregate(self, pipeline, cursor=None):
+        """ Aggregation query, documents with delete flag are filtered out first.
+
+        Args:
+            pipeline: Aggregation pipeline stages, e.g. [{"$match": {...}}, {"$group": {...}}]
+            cursor: Query cursor, default is `self._cursor`.
+
+        Return:
+            datas: Result documents.
+        """
+        if not cursor:
+            cursor = self._cursor
+        pipeline = [{"$match": {DELETE_FLAG: {"$ne": True}}}] + list(pipeline)
+        datas = []
+        async for item in cursor.aggregate(pipeline, allowDiskUse=True):
+            datas.append(item)
+        return datas, None
+
     @forestall
     async def find_one_and_update(self, spec, update_fields, upsert=False, return_document=False, fields=None, cursor=None):
         """ Find a document and update this document.
@@ -406,4 +497,258 @@ class MongoDB(object):
         elif isinstance(origin, dict):
             for key, value in origin.items():
                 origin[key] = self._convert_id_object(value)
-        return origin
\ No newline at end of file
+        return origin
+
+
+class BulkWriter(object):
+    """ Write-behind bulk writer for one collection.
+
+    Producers `put` documents (or `put_update` updates) into a queue and return immediately,
+    the queue is flushed as unordered `insert_many` calls (ordered `bulk_write` calls if the batch contains updates,
+    so an update is never applied before the insert of the document it updates) when `max_batch` operations are queued
+    or every `flush_interval` seconds. When `max_queue` operations are waiting, producers wait until a flush
+    makes room. Operations failing with transient errors (connection errors, write concern errors, primary stepdown)
+    are put back to the head of the queue and retried on the next flush, inserted documents keep their `_id`,
+    so documents already written by a partially failed batch are skipped as duplicates. Operations failing with
+    other errors (oversized document, validation error...) are retried one at a time and dropped after `max_retries`
+    attempts. While MongoDB is unavailable producers do not wait, the oldest queued operations are dropped instead.
+    Dropped operations are logged and counted in `metrics()`.
+
+    Args:
+        mongo: Target `MongoDB` instance.
+        max_batch: Max operations of one flush call, default is 1000.
+        flush_interval: Flush interval(seconds), default is 1.
+        max_queue: Max queued operations before `put` waits, default is 100000.
+        max_retries: Max attempts of an operation failing with a non transient error, default is 3.
+        write_concern: Write concern params, e.g. {"w": 1, "j": False}, default is the client's write concern.
+        on_flush: Asynchronous callback function `on_flush(docs, specs)` called with the inserted documents and the query params of the updates after
+            every successful flush, returns an error or None.
+    """
+
+    def __init__(self, mongo, max_batch=1000, flush_interval=1, max_queue=100000, max_retries=3, write_concern=None, on_flush=None):
+        """ Initialize. """
+        self._cursor = mongo._cursor
+        if write_concern:
+            self._cursor = self._cursor.with_options(write_concern=WriteConcern(**write_concern))
+        self._max_batch = max_batch
+        self._flush_interval = flush_interval
+        self._max_queue = max_queue
+        self._max_retries = max_retries
+        self._on_flush = on_flush
+        self._queue = deque() # (operation, inserted document or None, query params of update or None, failed attempts)
+        self._unavailable = False # last flush failed with a transient error
+        self._lock = asyncio.Lock()
+        self._space = asyncio.Event()
+        self._space.set()
+        self._timer = None
+        self._flushes = 0
+        self._written = 0
+        self._errors = 0
+        self._dropped = 0
+        self._last_latency = 0.0
+        self._total_latency = 0.0
+        self._max_latency = 0.0
+        self._max_depth = 0
+
+    @property
+    def queue_depth(self):
+        return len(self._queue)
+
+    def metrics(self):
+        """ Queue depth and flush latency(seconds) metrics.
+        """
+        return {
+            "queue_depth": len(self._queue),
+            "max_queue_depth": self._max_depth,
+            "flushes": self._flushes,
+            "written": self._written,
+            "errors": self._errors,
+            "dropped": self._dropped,
+            "last_flush_latency": self._last_latency,
+            "avg_flush_latency": self._total_latency / self._flushes if self._flushes else 0.0,
+            "max_flush_latency": self._max_latency
+        }
+
+    async def put(self, doc):
+        """ Queue a document to be inserted, wait if the queue is full.
+
+        Args:
+            doc: Dict or List to be inserted, documents are shallow copied.
+        """
+        docs = doc if isinstance(doc, list) else [doc]
+        for d in docs:
+            d = copy.copy(d)
+            await self._put(pymongo.InsertOne(d), d, None)
+
+    async def put_update(self, spec, update_fields, upsert=False):
+        """ Queue a single document update, wait if the queue is full.
+
+        Args:
+            spec: Query params.
+            update_fields: Fields to be updated.
+            upsert: If server this document if not exist? True or False.
+        """
+        spec = copy.copy(spec)
+        query = dict(spec, **{DELETE_FLAG: {"$ne": True}})
+        await self._put(pymongo.UpdateOne(query, copy.deepcopy(update_fields), upsert=upsert), None, spec)
+
+    async def _put(self, op, doc, spec):
+        while len(self._queue) >= self._max_queue:
+            if self._unavailable or not MongoDB.is_connected():
+                #数据库不可用时不让采集等待,丢弃最早的操作
+                if not self._unavailable:
+                    logger.error("mongodb unavailable, queue is full, drop oldest operations", caller=self)
+                    self._unavailable = True
+                self._queue.popleft()
+                self._dropped += 1
+                break
+            self._space.clear()
+            self._flush_later()
+            await self._space.wait()
+        self._queue.append((op, doc, spec, 0))
+        self._max_depth = max(self._max_depth, len(self._queue))
+        if self._timer is None:
+            self._timer = asyncio.get_event_loop().create_task(self._run())
+        if len(self._queue) >= self._max_batch:
+            self._flush_later()
+
+    def _flush_later(self):
+        if not self._lock.locked():
+            asyncio.get_event_loop().create_task(self.flush())
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self._flush_interval)
+            await self.flush()
+
+    async def flush(self):
+        """ Write all queued operations in batches of `max_batch`.
+
+        Return:
+            error: Error of the failed batch, or None.
+        """
+        error = None
+        async with self._lock:
+            while self._queue:
+                if not MongoDB.is_connected():
+                    self._set_unavailable()
+                    return Exception("mongodb connection lost")
+                if self._queue[0][3]:
+                    #上次写入失败的操作单独写入,找出写不进去的操作
+                    batch = [self._queue.popleft()]
+                else:
+                    batch = [self._queue.popleft() for _ in range(min(self._max_batch, len(self._queue)))]
+                if len(self._queue) < self._max_queue:
+                    self._space.set()
+                retry, e, retryable = await self._write(batch)
+                if not e:
+                    self._unavailable = False
+                    continue
+                error = e
+                if retryable:
+                    self._queue.extendleft(reversed(retry))
+                    self._set_unavailable()
+                    return e
+                drop = [item for item in retry if item[3] >= self._max_retries]
+                for op, _, _, attempts in drop:
+                    logger.error("drop operation after", attempts, "attempts:", str(op)[:500], caller=self)
+                self._dropped += len(drop)
+                self._queue.extendleft(reversed([item for item in retry if item[3] < self._max_retries]))
+        return error
+
+    def _set_unavailable(self):
+        #唤醒等待的生产者,由它们丢弃最早的操作
+        self._unavailable = True
+        self._space.set()
+
+    @staticmethod
+    def _retryable(e, codes):
+        if isinstance(e, ConnectionFailure):
+            return True
+        if isinstance(e, BulkWriteError):
+            return bool(e.details.get("writeConcernErrors")) or all(code in RETRYABLE_CODES for code in codes if code is not None)
+        if isinstance(e, OperationFailure):
+            return e.code in RETRYABLE_CODES
+        return False
+
+    async def _write(self, batch):
+        """ Write one batch.
+
+        Return:
+            retry: Operations to be put back to the queue, operations failing with non transient errors have
+                their attempts increased.
+            error: Error or None.
+            retryable: If the error is transient.
+        """
+        docs = [doc for _, doc, _, _ in batch if doc is not None]
+        begin = time.time()
+        failed = [] # (index in batch, error code) of failed operations, an ordered write stops at the first one
+        try:
+            if len(docs) == len(batch):
+                try:
+                    await self._cursor.insert_many(docs, ordered=False)
+                except BulkWriteError as e:
+                    if e.details.get("writeConcernErrors"):
+                        raise
+                    failed = [(err["index"], err["code"]) for err in e.details.get("writeErrors", []) if err["code"] != 11000]
+                    if failed:
+                        raise
+            else:
+                #包含更新时按顺序写入,更新不会跑到它要更新的文档的插入前面,重试时已经插入的文档跳过(duplicate key)后继续写入后面的操作
+                ops = [op for op, _, _, _ in batch]
+                start = 0
+                while start < len(ops):
+                    try:
+                        await self._cursor.bulk_write(ops[start:], ordered=True)
+                        break
+                    except BulkWriteError as e:
+                        errors = e.details.get("writeErrors", [])
+                        if e.details.get("writeConcernErrors") or not errors:
+                            raise
+                        start += errors[0]["index"]
+                        if errors[0]["code"] != 11000:
+                            failed = [(i, None) for i in range(start, len(ops))]
+                            failed[0] = (start, errors[0]["code"])
+                            raise
+                        start += 1
+        except Exception as e:
+            self._errors += 1
+            logger.error("bulk write ERROR:", e.details if isinstance(e, BulkWriteError) else e, caller=self)
+            retryable = self._retryable(e, [code for _, code in failed])
+            if not failed:
+                failed = [(i, None if retryable else -1) for i in range(len(batch))]
+            #只有非暂时性错误的操作增加失败次数,顺序写入时没有执行到的操作不计
+            retry = []
+            for i, code in failed:
+                op, doc, spec, attempts = batch[i]
+                if code is not None and code not in RETRYABLE_CODES:
+                    attempts += 1
+                retry.append((op, doc, spec, attempts))
+            written = sorted(set(range(len(batch))) - set(i for i, _ in failed))
+            if written:
+                await self._done(begin, [batch[i] for i in written])
+            return retry, e, retryable
+        await self._done(begin, batch)
+        return [], None, False
+
+    async def _done(self, begin, written):
+        latency = time.time() - begin
+        self._flushes += 1
+        self._written += len(written)
+        self._last_latency = latency
+        self._total_latency += latency
+        self._max_latency = max(self._max_latency, latency)
+        docs = [doc for _, doc, _, _ in written if doc is not None]
+        specs = [spec for _, _, spec, _ in written if spec is not None]
+        if self._on_flush and (docs or specs):
+            e = await self._on_flush(docs, specs)
+            if e:
+                logger.error("on_flush ERROR:", e, caller=self)
+
+    async def close(self):
+        """ Stop the flush timer and write all queued operations.
+        """
+        if self._timer:
+            self._timer.cancel()
+            self._timer = None
+        return await self.flush()
@@ -0,0 +1,222 @@
+# -*- coding:utf-8 -*-
+
+"""
+向量化回测,用于K线驱动,只由目标仓位决定交易的策略做参数研究
+
+Project: alphahunter
+Author: HJQuant
+Description: Asynchronous driven quantitative trading framework
+"""
+
+from decimal import Decimal
+
+import numpy as np
+import pandas as pd
+
+from quant.config import config
+from quant.order import ORDER_ACTION_BUY, ORDER_ACTION_SELL
+
+
+def nearest(num, tick_size):
+    """ tools.nearest的向量化版本,结果和tools.nearest一致
+    """
+    digits = max(0, -Decimal(str(tick_size)).as_tuple().exponent)
+    return np.round(np.round(np.asarray(num, dtype=float) / tick_size) * tick_size, digits)
+
+
+class VectorBacktestResult:
+    """ 向量化回测结果
+
+    Attributes:
+        equity: 每根K线收盘后的账户权益(以结算币种计价)
+        base: 每根K线收盘后的'货'数量
+        quote: 每根K线收盘后的'钱'数量
+        fills: 成交列表, DataFrame, 列为 index(第几根K线), ctime, side, price, quantity, fee
+        rejected: 因为余额不足或者K线不可用被拒绝的下单次数
+    """
+
+    def __init__(self, equity, base, quote, fills, rejected):
+        self.equity = equity
+        self.base = base
+        self.quote = quote
+        self.fills = fills
+        self.rejected = rejected
+
+    @property
+    def returns(self):
+        """ 每根K线的收益率
+        """
+        r = np.zeros(len(self.equity))
+        r[1:] = self.equity[1:] / self.equity[:-1] - 1
+        return r
+
+    @property
+    def total_return(self):
+        return self.equity[-1] / self.equity[0] - 1 if len(self.equity) else 0.0
+
+
+class VectorBacktest:
+    """ 向量化回测.
+
+    适用于只依赖K线历史,输出目标仓位的模型(比如example/cta_multi_signal/nr.py里面的RsiModel, CciModel).
+    给定每根K线的成交价(close_avg_fillna)和目标仓位(相对初始持仓,单位为'货'),按和事件驱动回测完全相同的规则模拟交易:
+    每根K线上 下单量 = nearest(目标仓位 - 当前仓位, size_tick),绝对值小于min_trade就不下单(和CTAController.submit_orders一致),
+    否则按taker成交,成交价为close_avg_fillna取整到price_tick(和撮合引擎的价格档位相同),买入手续费从'货'里扣,卖出手续费从'钱'里扣,
+    资产分别按size_tick, value_tick取整,和SimpleSpotMatchEngine一致.
+
+    目标仓位不变的K线不会产生交易,所以只需要逐个处理目标仓位发生变化的K线,权益曲线等全部用numpy计算,
+    每组参数只需要几毫秒.成交依赖之前的成交(余额不足拒单,买入手续费造成的差额下一根K线补单),这部分是逐个处理
+    目标仓位变化的K线的python循环,耗时和目标仓位变化次数成正比.手续费和精度参数从config.backtest["feature"]读取.
+    只输出信号(-1.0到1.0,nan表示没有信号)的模型可以使用run_signal,信号按signal_to_target转换为目标仓位.
+
+    Args:
+        platform: 交易平台
+        symbol: 交易对
+        min_trade: 最小下单量,默认为size_tick
+    """
+
+    def __init__(self, platform, symbol, min_trade=None):
+        """ 初始化
+        """
+        feature = config.backtest["feature"][platform]
+        syminfo = feature["syminfo"][symbol]
+        self._price_tick = syminfo["price_tick"]
+        self._size_tick = syminfo["size_tick"]
+        self._value_tick = syminfo["value_tick"]
+        self._taker_commission_rate = feature["taker_commission_rate"]
+        self._base0 = feature["asset"].get(syminfo["base_currency"], 0)
+        self._quote0 = feature["asset"].get(syminfo["settlement_currency"], 0)
+        self._min_trade = min_trade if min_trade is not None else self._size_tick
+        self._size_scale = 10.0 ** self._digits(self._size_tick)
+
+    @staticmethod
+    def signal_to_target(signal, fixed_volume):
+        """ 信号转换为目标仓位,规则和example/cta_multi_signal/nr.py中模型的generate_target_position一致:
+        空仓时信号为1(-1)开多(空)fixed_volume,持多仓时信号为-1,持空仓时信号为1,或者信号为nan时平仓,其他情况仓位不变.
+        平仓的同一根K线不会反向开仓.
+        """
+        signal = np.asarray(signal, dtype=float)
+        target = np.zeros(len(signal))
+        pos = 0.0
+        for i, sig in enumerate(signal):
+            if pos == 0:
+                if sig == 1 or sig == -1:
+                    pos = sig * fixed_volume
+            elif np.isnan(sig) or (pos > 0 and sig == -1) or (pos < 0 and sig == 1):
+                pos = 0.0
+            target[i] = pos
+        return target
+
+    def run_signal(self, prices, signal, fixed_volume, timestamps=None, usable=None):
+        """ 按信号运行回测,信号按signal_to_target转换为目标仓位,其他参数和返回值与run一致
+        """
+        return self.run(prices, self.signal_to_target(signal, fixed_volume), timestamps, usable)
+
+    @staticmethod
+    def _digits(tick):
+        """ 精度的小数位数
+        """
+        return max(0, -Decimal(str(tick)).as_tuple().exponent)
+
+    def _nearest(self, num):
+        """ 单个数值的nearest(num, size_tick),按np.round的计算方法(乘以10的幂,四舍六入五成双,再除回去)用python浮点数计算,
+        结果和nearest完全相同,循环中不用每次创建numpy数组
+        """
+        scale = self._size_scale
+        return round(round(num / self._size_tick) * self._size_tick * scale) / scale
+
+    def run(self, prices, target, timestamps=None, usable=None):
+        """ 运行回测
+
+        Args:
+            prices: 每根K线的成交价,一般为close_avg_fillna
+            target: 每根K线的目标仓位,nan视为0
+            timestamps: 每根K线的时间,用于成交列表的ctime,可选
+            usable: 每根K线是否可以下单(Kline.usable),可选
+
+        Returns:
+            VectorBacktestResult
+        """
+        #和撮合引擎一样按整数档位记账: 价格按price_tick,'货'按size_tick,'钱'按value_tick,每笔成交的金额和手续费分别取整以后再加减
+        price_t = np.round(np.asarray(prices, dtype=float) * (1 / self._price_tick))
+        px = np.round(price_t * self._price_tick, self._digits(self._price_tick))
+        target = np.nan_to_num(np.asarray(target, dtype=float))
+        n = len(px)
+        rate = self._taker_commission_rate
+        base0_t = round(self._base0 / self._size_tick)
+        quote0_t = round(self._quote0 / self._value_tick)
+        base_t, quote_t = base0_t, quote0_t
+        held = 0.0 #当前仓位(相对初始持仓)
+        rejected = 0
+        fill_index, fill_side, fill_price, fill_qty, fill_fee, fill_base, fill_quote = [], [], [], [], [], [], []
+        #目标仓位发生变化的K线
+        changes = np.flatnonzero(np.diff(target, prepend=0.0)).tolist()
+        #循环中只用python数值,避免逐个读取numpy数组元素的开销
+        price_l, px_l, target_l = price_t.tolist(), px.tolist(), target.tolist()
+        usable_l = np.asarray(usable, dtype=bool).tolist() if usable is not None else None
+        k = 0
+        i = changes[0] if changes else n
+        while i < n:
+            delta = self._nearest(target_l[i] - held)
+            traded = False
+            if abs(delta) < self._min_trade:
+                pass
+            elif usable_l is not None and not usable_l[i]:
+                rejected += 1
+            else:
+                vol_t = round(abs(delta) * (1 / self._size_tick))
+                money = price_l[i] * vol_t * self._price_tick * self._size_tick * (1 / self._value_tick) #计算顺序和撮合引擎相同,取整结果才会一致
+                if delta > 0:
+                    if round(money) > quote_t:
+                        rejected += 1
+                    else:
+                        qty = vol_t * self._size_tick * (1 / self._size_tick)
+                        fee_t = round(qty * rate) #现货买入手续费从'货'里扣
+                        base_t += round(qty) - fee_t
+                        quote_t -= round(money)
+                        fill_side.append(ORDER_ACTION_BUY)
+                        fill_fee.append(fee_t * self._size_tick)
+                        traded = True
+                else:
+                    if vol_t > base_t:
+                        rejected += 1
+                    else:
+                        base_t -= vol_t
+                        quote_t += round(money - money * rate) #现货卖出手续费从'钱'里扣
+                        fill_side.append(ORDER_ACTION_SELL)
+                        fill_fee.append(round(money * rate) * self._value_tick)
+                        traded = True
+                if traded:
+                    held = (base_t - base0_t) * self._size_tick
+                    fill_index.append(i)
+                    fill_price.append(px_l[i])
+                    fill_qty.append(abs(delta))
+                    fill_base.append(base_t)
+                    fill_quote.append(quote_t)
+            if abs(delta) >= self._min_trade:
+                #成交后仍然没有达到目标仓位(比如买入手续费),或者被拒绝,下一根K线会继续下单
+                if i + 1 < n and abs(self._nearest(target_l[i+1] - held)) >= self._min_trade:
+                    i += 1
+                    continue
+            #跳到下一个目标仓位发生变化的K线
+            while k < len(changes) and changes[k] <= i:
+                k += 1
+            i = changes[k] if k < len(changes) else n
+        #每根K线收盘后的资产,成交之间保持不变
+        idx = np.asarray(fill_index, dtype=np.int64)
+        pos = np.searchsorted(idx, np.arange(n), side="right") - 1 #每根K线之前(含)最后一次成交
+        base_arr = np.where(pos >= 0, np.asarray(fill_base + [base0_t])[pos], base0_t)
+        quote_arr = np.where(pos >= 0, np.asarray(fill_quote + [quote0_t])[pos], quote0_t)
+        base_arr = np.round(base_arr * self._size_tick, self._digits(self._size_tick))
+        quote_arr = np.round(quote_arr * self._value_tick, self._digits(self._value_tick))
+        fill_fee = [round(f, max(self._digits(self._size_tick), self._digits(self._value_tick))) for f in fill_fee]
+        equity = quote_arr + base_arr * px
+        fills = pd.DataFrame({
+            "index": idx,
+            "ctime": np.asarray(timestamps)[idx] if timestamps is not None else idx,
+            "side": fill_side,
+            "price": fill_price,
+            "quantity": fill_qty,
+            "fee": fill_fee
+        })
+        return VectorBacktestResult(equity, base_arr, quote_arr, fills, rejected)
@@ -23,6 +23,7 @@ setup(
     install_requires=[
         "aiohttp==3.2.1",
         "aioamqp==0.13.0",
-        "motor==2.0.0"
+        "motor==2.0.0",
+        "numpy"
     ],
 )
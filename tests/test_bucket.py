@@ -0,0 +1,69 @@
+# -*- coding:utf-8 -*-
+
+"""
+分桶数据格式(quant/bucket.py)测试
+
+Project: alphahunter
+Author: HJQuant
+Description: Asynchronous driven quantitative trading framework
+"""
+
+import numpy as np
+
+from quant.bucket import Bucket, BUCKET_KEY
+
+
+def trades(dts):
+    return [{"_id": i, "dt": dt, "tradeprice": 100.0 + i, "direction": "BUY" if i % 2 else "SELL"} for i, dt in enumerate(dts)]
+
+
+def test_pack_groups_records_by_bucket():
+    docs = Bucket(1000).pack(trades([1000, 1500, 2100]))
+    assert docs == [
+        {BUCKET_KEY: 1000, "interval": 1000, "n": 2, "dt": [1000, 1500], "tradeprice": [100.0, 101.0], "direction": ["SELL", "BUY"]},
+        {BUCKET_KEY: 2000, "interval": 1000, "n": 1, "dt": [2100], "tradeprice": [102.0], "direction": ["SELL"]}
+    ]
+
+
+def test_pack_fills_missing_fields_with_none():
+    docs = Bucket(1000).pack([{"dt": 1, "a": 1}, {"dt": 2, "b": 2}])
+    assert docs[0]["a"] == [1, None]
+    assert docs[0]["b"] == [None, 2]
+
+
+def test_unpack_round_trip_sorted_and_filtered():
+    bucket = Bucket(1000)
+    records = trades([2100, 1500, 1000, 2999, 3000])
+    docs = bucket.pack(records[:2]) + bucket.pack(records[2:]) #同一个桶分几次写入
+    columns = bucket.unpack(docs, 1000, 3000)
+    assert columns["dt"].tolist() == [1000, 1500, 2100, 2999]
+    assert columns["tradeprice"].tolist() == [102.0, 101.0, 100.0, 103.0]
+    assert columns["direction"].tolist() == ["SELL", "BUY", "SELL", "BUY"]
+    assert "_id" not in columns and "n" not in columns and "interval" not in columns
+    assert Bucket.to_records(bucket.unpack(docs, 1500, 2100, fields=["dt"])) == [{"dt": 1500}]
+
+
+def test_unpack_missing_numeric_values_are_nan():
+    bucket = Bucket(1000)
+    docs = bucket.pack([{"dt": 1, "a": 1.5}]) + bucket.pack([{"dt": 2}])
+    columns = bucket.unpack(docs, None, None)
+    assert columns["a"].dtype == np.float64
+    assert columns["a"][0] == 1.5 and np.isnan(columns["a"][1])
+
+
+def test_add_and_expire_emit_finished_buckets():
+    bucket = Bucket(1000)
+    assert bucket.add({"dt": 1000}) == []
+    assert bucket.add({"dt": 1999}) == []
+    docs = bucket.add({"dt": 2000})
+    assert [d["dt"] for d in docs] == [[1000, 1999]]
+    assert bucket.expire(2999) == []
+    assert [d["dt"] for d in bucket.expire(3000)] == [[2000]]
+    assert bucket.drain() == []
+
+
+def test_spec_widened_by_largest_bucket_size():
+    assert Bucket(1000).spec(5000, 6000) == {BUCKET_KEY: {"$gt": 4000, "$lt": 6000}}
+    assert Bucket(1000, span=60000).spec(60000, None) == {BUCKET_KEY: {"$gt": 0}}
+    assert Bucket(1000).projection(["tradeprice"]) == {"_id": 0, "tradeprice": 1, "dt": 1}
+    assert Bucket(1000).projection(None) is None
@@ -0,0 +1,102 @@
+# -*- coding:utf-8 -*-
+
+"""
+数据覆盖索引(quant/coverage.py)测试
+
+Project: alphahunter
+Author: HJQuant
+Description: Asynchronous driven quantitative trading framework
+"""
+
+import asyncio
+
+import pytest
+
+from quant import coverage as coverage_module
+from quant.coverage import Coverage
+
+
+DAY = Coverage.DAY
+HOUR = Coverage.HOUR
+T0 = 1587340800000 #2020-04-20 00:00:00 UTC
+
+
+class FakeCollection:
+    """ 内存中的t_coverage表,只实现Coverage用到的update和get_list
+    """
+
+    docs = []
+    fail = False
+
+    def __init__(self, db, collection):
+        pass
+
+    async def update(self, spec, update_fields, upsert=False):
+        if FakeCollection.fail:
+            return None, Exception("mongodb connection lost")
+        doc = next((d for d in self.docs if all(d.get(k) == v for k, v in spec.items())), None)
+        if doc is None:
+            doc = dict(spec)
+            self.docs.append(doc)
+        for op, fields in update_fields.items():
+            for k, v in fields.items():
+                if op == "$bit":
+                    doc[k] = doc.get(k, 0) | v["or"]
+                elif op == "$max":
+                    doc[k] = max(doc.get(k, v), v)
+        return 1, None
+
+    async def get_list(self, spec, fields=None):
+        if FakeCollection.fail:
+            return None, Exception("mongodb connection lost")
+        return [dict(d) for d in self.docs if d["name"] == spec["name"]], None
+
+
+@pytest.fixture
+def coverage(monkeypatch):
+    FakeCollection.docs = []
+    FakeCollection.fail = False
+    monkeypatch.setattr(coverage_module, "MongoDB", FakeCollection)
+    return Coverage("db_market", "t_trade_huobi_btcusdt")
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_hour_masks():
+    masks = Coverage.hour_masks([T0, T0 + HOUR - 1, T0 + 5*HOUR, T0 + DAY + 23*HOUR])
+    assert masks == {T0: 0b100001, T0 + DAY: 1 << 23}
+
+
+def test_unknown_without_indexed_span(coverage):
+    assert run(coverage.mark([T0 + 2*HOUR])) is None
+    fresh = Coverage("db_market", "t_trade_huobi_btcusdt")
+    assert run(fresh.has_data(T0 + 5*HOUR, T0 + 6*HOUR)) #没有完整时间段时都视为未知
+
+
+def test_has_data_inside_indexed_span(coverage):
+    run(coverage.mark([T0 + 2*HOUR + 1, T0 + DAY + 3*HOUR]))
+    assert run(coverage.mark_indexed(T0, T0 + 2*DAY)) is None
+    fresh = Coverage("db_market", "t_trade_huobi_btcusdt")
+    assert run(fresh.has_data(T0 + 2*HOUR, T0 + 2*HOUR + 1))
+    assert not run(fresh.has_data(T0 + 3*HOUR, T0 + DAY + 3*HOUR)) #中间的小时都没有标记
+    assert run(fresh.has_data(T0 + 3*HOUR, T0 + DAY + 3*HOUR + 1))
+    assert run(fresh.has_data(T0 + 2*DAY - HOUR, T0 + 2*DAY + HOUR)) #超出完整时间段
+
+
+def test_load_error_means_unknown(coverage):
+    run(coverage.mark([T0]))
+    run(coverage.mark_indexed(T0, T0 + DAY))
+    FakeCollection.fail = True
+    fresh = Coverage("db_market", "t_trade_huobi_btcusdt")
+    assert run(fresh.has_data(T0 + 5*HOUR, T0 + 6*HOUR))
+
+
+def test_failed_marks_are_retried(coverage):
+    FakeCollection.fail = True
+    assert run(coverage.mark([T0 + HOUR])) is not None
+    assert run(coverage.mark_indexed(T0, T0 + DAY)) is not None #还有没写入的掩码,不能记录为完整时间段
+    FakeCollection.fail = False
+    assert run(coverage.mark([T0 + 4*HOUR])) is None
+    assert FakeCollection.docs == [{"name": "t_trade_huobi_btcusdt", "day": T0, "hours": 0b10010}]
@@ -0,0 +1,57 @@
+# -*- coding:utf-8 -*-
+
+"""
+回测成交列表(quant/fillstore.py)测试
+
+Project: alphahunter
+Author: HJQuant
+Description: Asynchronous driven quantitative trading framework
+"""
+
+from quant.fillstore import FillStore
+from quant.order import Fill, ORDER_ACTION_BUY, ORDER_ACTION_SELL
+
+
+def make_fill(order_no, fill_no, quantity=1.0, symbol="btcusdt", side=ORDER_ACTION_BUY, ctime=1587340800000):
+    return Fill("huobi", "test", symbol, "strategy", order_no, fill_no, 100.0, quantity, side, "TAKER", 0.002, ctime)
+
+
+def test_columns_match_trades_csv():
+    store = FillStore()
+    store.append(make_fill("1", "1"))
+    store.append(make_fill("2", "1", 2.0, side=ORDER_ACTION_SELL, ctime=1587340860000))
+    df = store.to_dataframe()
+    assert list(df.columns) == list(FillStore.COLUMNS)
+    assert df["side"].tolist() == [ORDER_ACTION_BUY, ORDER_ACTION_SELL]
+    assert df["quantity"].tolist() == [1.0, 2.0]
+    assert df["ctime"].tolist() == [1587340800000, 1587340860000]
+    assert df["platform"].tolist() == ["huobi", "huobi"]
+
+
+def test_repeated_fill_overwrites_record():
+    store = FillStore()
+    store.append(make_fill("1", "1", 1.0))
+    store.append(make_fill("1", "2", 2.0))
+    store.append(make_fill("1", "1", 1.5)) #同一个成交重复通知
+    assert len(store) == 2
+    df = store.to_dataframe()
+    assert df["fill_no"].tolist() == ["1", "2"]
+    assert df["quantity"].tolist() == [1.5, 2.0]
+
+
+def test_keys_filter_symbols():
+    store = FillStore(keys=[("huobi", "test", "btcusdt")])
+    store.append(make_fill("1", "1"))
+    store.append(make_fill("2", "1", symbol="ethusdt"))
+    assert store.to_dataframe()["symbol"].tolist() == ["btcusdt"]
+
+
+def test_grows_beyond_initial_capacity():
+    store = FillStore(capacity=2)
+    for i in range(5):
+        store.append(make_fill(str(i), "1", float(i)))
+    store.append(make_fill("0", "1", 9.0))
+    df = store.to_dataframe()
+    assert len(df) == 5
+    assert df["order_no"].tolist() == ["0", "1", "2", "3", "4"]
+    assert df["quantity"].tolist() == [9.0, 1.0, 2.0, 3.0, 4.0]
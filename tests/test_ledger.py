@@ -0,0 +1,66 @@
+# -*- coding:utf-8 -*-
+
+"""
+回测资产账本(quant/ledger.py)测试
+
+Project: alphahunter
+Author: HJQuant
+Description: Asynchronous driven quantitative trading framework
+"""
+
+from quant.ledger import Ledger, decimals
+
+
+def test_decimals():
+    assert decimals(0.0001) == 4
+    assert decimals(0.01) == 2
+    assert decimals(1) == 0
+    assert decimals(10) == 0
+
+
+def test_deposit_does_not_accumulate_float_error():
+    ledger = Ledger()
+    ledger.add_unit("USDT", 0.01)
+    for _ in range(10):
+        ledger.deposit("USDT", 0.1) #浮点数累加会得到0.9999999999999999
+    assert ledger.free["USDT"] == 100
+    assert ledger.entry("USDT") == {"free": 1.0, "locked": 0.0, "total": 1.0}
+
+
+def test_to_units_rounds_to_nearest_unit():
+    ledger = Ledger()
+    ledger.add_unit("USDT", 0.01)
+    assert ledger.to_units("USDT", 0.30000000000000004) == 30
+    assert ledger.to_units("USDT", 0.014) == 1
+    assert ledger.to_units("USDT", 0.016) == 2
+    assert ledger.to_float("USDT", 30) == 0.3
+
+
+def test_entry_includes_locked():
+    ledger = Ledger()
+    ledger.add_unit("BTC", 0.0001)
+    ledger.deposit("BTC", 1.5)
+    ledger.free["BTC"] -= 2500
+    ledger.locked["BTC"] += 2500
+    assert ledger.entry("BTC") == {"free": 1.25, "locked": 0.25, "total": 1.5}
+
+
+def test_smaller_unit_rescales_balance():
+    ledger = Ledger()
+    ledger.add_unit("USDT", 0.01)
+    ledger.deposit("USDT", 1.23)
+    ledger.add_unit("USDT", 0.0001) #另一个交易对使用更小的单位
+    assert ledger.free["USDT"] == 12300
+    assert ledger.entry("USDT")["total"] == 1.23
+    ledger.add_unit("USDT", 0.01) #更大的单位不会替换已有的单位
+    assert ledger.unit["USDT"] == 0.0001
+
+
+def test_provisional_unit_replaced_by_engine_unit():
+    ledger = Ledger()
+    ledger.deposit("BTC", 0.123456789) #撮合引擎指定单位之前的初始资产按默认单位记账
+    assert ledger.unit["BTC"] == 1e-08
+    ledger.add_unit("BTC", 0.0001)
+    assert ledger.unit["BTC"] == 0.0001
+    assert ledger.free["BTC"] == 1235
+    assert ledger.snapshot() == {"BTC": {"free": 0.1235, "locked": 0.0, "total": 0.1235}}
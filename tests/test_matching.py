@@ -0,0 +1,80 @@
+# -*- coding:utf-8 -*-
+
+"""
+回测撮合订单薄数据结构(quant/matching.py)测试
+
+Project: alphahunter
+Author: HJQuant
+Description: Asynchronous driven quantitative trading framework
+"""
+
+import numpy as np
+
+from quant.matching import MarketDepth, RestingOrders
+from quant.order import Order, ORDER_ACTION_BUY, ORDER_ACTION_SELL
+
+
+def make_order(order_no, action, price, quantity):
+    return Order(order_no=order_no, action=action, price=price, quantity=quantity, remain=quantity)
+
+
+def make_depth(asks, bids, price_tick=0.01):
+    """ 一条订单薄,asks/bids为[(price, size), ...]
+    """
+    depth = MarketDepth(price_tick)
+    asks = np.array(asks, dtype=float)
+    bids = np.array(bids, dtype=float)
+    depth.update((asks[:, 0][None], asks[:, 1][None], bids[:, 0][None], bids[:, 1][None]), 0)
+    return depth
+
+
+def test_pop_crossed_in_order_of_placement():
+    book = RestingOrders(0.01)
+    book.add(make_order("1", ORDER_ACTION_BUY, 100.0, 1))
+    book.add(make_order("2", ORDER_ACTION_BUY, 101.0, 1))
+    book.add(make_order("3", ORDER_ACTION_SELL, 99.0, 1))
+    book.add(make_order("4", ORDER_ACTION_BUY, 99.0, 1))
+    crossed = book.pop_crossed(bid_price=100.0, ask_price=100.0)
+    assert [o.order_no for o in crossed] == ["1", "2", "3"]
+    assert book.pop_crossed(bid_price=99.0, strict=True) == []
+    assert [o.order_no for o in book.pop_crossed(bid_price=99.0)] == ["4"]
+
+
+def test_removed_orders_are_not_returned():
+    book = RestingOrders(0.01)
+    book.add(make_order("1", ORDER_ACTION_SELL, 100.0, 1))
+    book.add(make_order("2", ORDER_ACTION_SELL, 100.0, 1))
+    book.remove("1")
+    assert len(book) == 1
+    assert [o.order_no for o in book.pop_crossed(ask_price=100.0)] == ["2"]
+    assert book.levels[ORDER_ACTION_SELL] == {10000: {"2": 0}}
+
+
+def test_queue_ahead_capped_by_displayed_size():
+    book = RestingOrders(0.01)
+    book.add(make_order("1", ORDER_ACTION_BUY, 99.99, 1), ahead=float("inf"))
+    book.add(make_order("2", ORDER_ACTION_BUY, 99.50, 1), ahead=float("inf"))
+    book.add(make_order("3", ORDER_ACTION_BUY, 101.00, 1), ahead=float("inf"))
+    depth = make_depth([(100.01, 5), (100.02, 5)], [(100.00, 3), (99.99, 7), (99.98, 2)])
+    book.update_queue(depth)
+    bids = book.levels[ORDER_ACTION_BUY]
+    assert bids[9999] == {"1": 7} #按这个价格上显示的挂单量
+    assert bids[9950] == {"2": float("inf")} #超出显示的档位范围,无法判断
+    assert bids[10100] == {"3": 0} #价格优于最优价,排在最前面
+    depth = make_depth([(100.01, 5)], [(100.00, 3), (99.99, 9)])
+    book.update_queue(depth)
+    assert bids[9999] == {"1": 7} #挂单量增加时排在前面的数量不变
+
+
+def test_consume_queue_fills_after_queue_ahead():
+    book = RestingOrders(0.01)
+    book.add(make_order("1", ORDER_ACTION_SELL, 100.0, 2), ahead=3)
+    book.add(make_order("2", ORDER_ACTION_SELL, 100.0, 2), ahead=6)
+    assert book.consume_queue(ORDER_ACTION_SELL, 100.0, 2) == []
+    assert book.levels[ORDER_ACTION_SELL][10000] == {"1": 1, "2": 6}
+    result = book.consume_queue(ORDER_ACTION_SELL, 100.0, 2)
+    assert [(o.order_no, q) for o, q in result] == [("1", 1)]
+    result[0][0].remain -= 1 #撮合引擎成交以后更新剩余数量
+    result = book.consume_queue(ORDER_ACTION_SELL, 100.0, 10)
+    assert [(o.order_no, q) for o, q in result] == [("1", 1), ("2", 2)]
+    assert book.consume_queue(ORDER_ACTION_SELL, 100.5, 10) == []
@@ -0,0 +1,96 @@
+# -*- coding:utf-8 -*-
+
+"""
+实时业绩指标(quant/metrics.py)测试,和回测结果分析器(quant/analyze.py)的盈亏算法对比
+
+Project: alphahunter
+Author: HJQuant
+Description: Asynchronous driven quantitative trading framework
+"""
+
+import asyncio
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from quant.analyze import Analyzer, ONE_DAY, CHINA_TZONE_SHIFT
+from quant.config import config
+from quant.fillstore import FillStore
+from quant.metrics import OnlineMetrics
+from quant.order import Fill, ORDER_ACTION_BUY, ORDER_ACTION_SELL
+
+
+PLATFORM = "huobi"
+T0 = 1587312000000 #2020-04-20 00:00:00 东八区
+DAYS = 3
+SYMINFO = {
+    "btcusdt": {"type": "spot", "settlement_currency": "USDT"},
+    "btc.usdt.swap": {"type": "future", "contract_size": 0.01, "is_inverse": False, "settlement_currency": "USDT"}
+}
+
+
+@pytest.fixture
+def backtest_config(monkeypatch):
+    monkeypatch.setattr(config, "backtest", {
+        "start_time": "2020-04-20",
+        "period_day": str(DAYS),
+        "feature": {PLATFORM: {"syminfo": SYMINFO, "asset": {"USDT": 10000}}}
+    })
+
+
+def simulate(seed):
+    """ 随机游走价格(每10分钟一个)和随机成交,返回(OnlineMetrics, 成交列表DataFrame, 每日收盘价DataFrame, 每天结束时的权益)
+    """
+    rng = np.random.RandomState(seed)
+    metrics = OnlineMetrics(10000, SYMINFO)
+    store = FillStore()
+    price = dict.fromkeys(SYMINFO, 100.0)
+    closes = []
+    equity = []
+    n = 0
+    for day in range(DAYS):
+        for k in range(144):
+            ts = T0 + day * ONE_DAY + k * 600000
+            for sym in SYMINFO:
+                price[sym] = round(price[sym] * np.exp(rng.normal(0, 0.003)), 2)
+                if rng.random_sample() < 0.2:
+                    n += 1
+                    side = ORDER_ACTION_BUY if rng.random_sample() < 0.5 else ORDER_ACTION_SELL
+                    fill = Fill(PLATFORM, "test", sym, "strategy", str(n), "1", price[sym], round(rng.random_sample(), 4), side, "TAKER", 0.001, ts)
+                    metrics.on_fill(fill)
+                    store.append(fill)
+                metrics.on_price(sym, price[sym], ts)
+        metrics.update(ts)
+        equity.append(metrics.snapshot()["equity"])
+        trade_date = (ts + CHINA_TZONE_SHIFT) // ONE_DAY * ONE_DAY - CHINA_TZONE_SHIFT
+        closes.extend((PLATFORM, sym, trade_date, price[sym]) for sym in SYMINFO)
+    closes = pd.DataFrame(closes, columns=["platform", "symbol", "trade_date", "close"]).set_index(["platform", "symbol", "trade_date"]).sort_index()
+    return metrics, store.to_dataframe(), closes, equity
+
+
+def analyze(trades, closes):
+    analyzer = Analyzer()
+    async def get_daily_closes():
+        return closes
+    analyzer.get_daily_closes = get_daily_closes
+    assert asyncio.run(analyzer.initialize(trades=trades))
+    analyzer.process_trades()
+    analyzer.process_daily()
+    return analyzer.daily
+
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_online_metrics_match_analyzer(backtest_config, seed):
+    metrics, trades, closes, equity = simulate(seed)
+    daily = analyze(trades, closes)
+    snapshot = metrics.snapshot()
+    by_day = daily.groupby(level="trade_date")
+    assert snapshot["total_pnl"] == pytest.approx(by_day["CumProfitComm"].sum().iloc[-1], abs=1e-6)
+    assert snapshot["commission"] == pytest.approx(daily["commission"].sum(), abs=1e-9)
+    assert snapshot["turnover"] == pytest.approx(daily["TurnOver"].sum(), abs=1e-6)
+    assert snapshot["trades"] == len(trades)
+    assert snapshot["days"] == DAYS
+    #每天权益的变化就是当天的总盈亏
+    daily_pnl = np.diff([10000] + equity)
+    assert daily_pnl == pytest.approx(by_day["total_pnl"].sum().values, abs=1e-6)